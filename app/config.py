@@ -17,6 +17,27 @@ class AppConfig:
     default_days: int
     printer_poll_enabled: bool
     printer_poll_interval_sec: int
+    cache_max_entries: int = 256
+    cache_ttl_sec: int = 60
+    db_read_workers: int = 4
+    agent_presence_flush_sec: int = 30
+    db_write_queue_size: int = 1000
+    db_commit_window_ms: int = 5
+    report_workers: int = 2
+    report_processes: int = 2
+    report_cache_dir: str = ""
+    report_cache_ttl_sec: int = 3600
+    report_cache_max_mb: int = 512
+    papercut_max_connections: int = 4
+    papercut_batch_size: int = 100
+    papercut_sync_interval_sec: int = 3600
+    papercut_sync_page_size: int = 500
+    papercut_cache_ttl_sec: int = 3600
+    papercut_cache_negative_ttl_sec: int = 300
+    papercut_cache_max_entries: int = 10000
+    papercut_job_log_url: str = ""
+    papercut_job_log_interval_sec: int = 300
+    papercut_job_log_page_kb: int = 1024
 
 
 def _env(name: str, default: Optional[str] = None) -> Optional[str]:
@@ -44,6 +65,33 @@ def load_config(config_path: Optional[str] = None) -> AppConfig:
     default_days = int(_env("DEFAULT_DAYS", str(data.get("default_days", 7))))
     printer_poll_enabled = str(_env("PRINTER_POLL_ENABLED", str(data.get("printer_poll_enabled", True)))).lower() == "true"
     printer_poll_interval_sec = int(_env("PRINTER_POLL_INTERVAL_SEC", str(data.get("printer_poll_interval_sec", 300))))
+    cache_max_entries = int(_env("CACHE_MAX_ENTRIES", str(data.get("cache_max_entries", 256))))
+    cache_ttl_sec = int(_env("CACHE_TTL_SEC", str(data.get("cache_ttl_sec", 60))))
+    db_read_workers = int(_env("DB_READ_WORKERS", str(data.get("db_read_workers", 4))))
+    agent_presence_flush_sec = int(_env("AGENT_PRESENCE_FLUSH_SEC", str(data.get("agent_presence_flush_sec", 30))))
+    db_write_queue_size = int(_env("DB_WRITE_QUEUE_SIZE", str(data.get("db_write_queue_size", 1000))))
+    db_commit_window_ms = int(_env("DB_COMMIT_WINDOW_MS", str(data.get("db_commit_window_ms", 5))))
+    report_workers = int(_env("REPORT_WORKERS", str(data.get("report_workers", 2))))
+    report_processes = int(_env("REPORT_PROCESSES", str(data.get("report_processes", 2))))
+    report_cache_dir = _env("REPORT_CACHE_DIR", data.get("report_cache_dir", "")) or os.path.join(
+        os.path.dirname(db_path) or ".", "reports"
+    )
+    report_cache_ttl_sec = int(_env("REPORT_CACHE_TTL_SEC", str(data.get("report_cache_ttl_sec", 3600))))
+    report_cache_max_mb = int(_env("REPORT_CACHE_MAX_MB", str(data.get("report_cache_max_mb", 512))))
+    papercut_max_connections = int(_env("PAPERCUT_MAX_CONNECTIONS", str(data.get("papercut_max_connections", 4))))
+    papercut_batch_size = int(_env("PAPERCUT_BATCH_SIZE", str(data.get("papercut_batch_size", 100))))
+    papercut_sync_interval_sec = int(_env("PAPERCUT_SYNC_INTERVAL_SEC", str(data.get("papercut_sync_interval_sec", 3600))))
+    papercut_sync_page_size = int(_env("PAPERCUT_SYNC_PAGE_SIZE", str(data.get("papercut_sync_page_size", 500))))
+    papercut_cache_ttl_sec = int(_env("PAPERCUT_CACHE_TTL_SEC", str(data.get("papercut_cache_ttl_sec", 3600))))
+    papercut_cache_negative_ttl_sec = int(
+        _env("PAPERCUT_CACHE_NEGATIVE_TTL_SEC", str(data.get("papercut_cache_negative_ttl_sec", 300)))
+    )
+    papercut_cache_max_entries = int(_env("PAPERCUT_CACHE_MAX_ENTRIES", str(data.get("papercut_cache_max_entries", 10000))))
+    papercut_job_log_url = _env("PAPERCUT_JOB_LOG_URL", data.get("papercut_job_log_url", "")) or ""
+    papercut_job_log_interval_sec = int(
+        _env("PAPERCUT_JOB_LOG_INTERVAL_SEC", str(data.get("papercut_job_log_interval_sec", 300)))
+    )
+    papercut_job_log_page_kb = int(_env("PAPERCUT_JOB_LOG_PAGE_KB", str(data.get("papercut_job_log_page_kb", 1024))))
 
     return AppConfig(
         papercut_log_dir=papercut_log_dir,
@@ -57,4 +105,25 @@ def load_config(config_path: Optional[str] = None) -> AppConfig:
         default_days=default_days,
         printer_poll_enabled=printer_poll_enabled,
         printer_poll_interval_sec=printer_poll_interval_sec,
+        cache_max_entries=cache_max_entries,
+        cache_ttl_sec=cache_ttl_sec,
+        db_read_workers=db_read_workers,
+        agent_presence_flush_sec=agent_presence_flush_sec,
+        db_write_queue_size=db_write_queue_size,
+        db_commit_window_ms=db_commit_window_ms,
+        report_workers=report_workers,
+        report_processes=report_processes,
+        report_cache_dir=report_cache_dir,
+        report_cache_ttl_sec=report_cache_ttl_sec,
+        report_cache_max_mb=report_cache_max_mb,
+        papercut_max_connections=papercut_max_connections,
+        papercut_batch_size=papercut_batch_size,
+        papercut_sync_interval_sec=papercut_sync_interval_sec,
+        papercut_sync_page_size=papercut_sync_page_size,
+        papercut_cache_ttl_sec=papercut_cache_ttl_sec,
+        papercut_cache_negative_ttl_sec=papercut_cache_negative_ttl_sec,
+        papercut_cache_max_entries=papercut_cache_max_entries,
+        papercut_job_log_url=papercut_job_log_url,
+        papercut_job_log_interval_sec=papercut_job_log_interval_sec,
+        papercut_job_log_page_kb=papercut_job_log_page_kb,
     )
@@ -0,0 +1,218 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from app.storage import WriteBatch
+
+
+# How long a writer waits for room in a full queue before giving up.
+_QUEUE_PUT_TIMEOUT_SEC = 30.0
+
+
+class WriteQueueFull(Exception):
+    pass
+
+
+class _WriteOp:
+    __slots__ = ("fn", "args", "kwargs", "future", "queued_at")
+
+    def __init__(self, fn: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.queued_at = time.perf_counter()
+
+
+class DBExecutor:
+    # Runs blocking storage calls off the event loop. Reads go to a pool of
+    # `readers` threads (SQLite in WAL mode serves them concurrently). Every
+    # mutation goes through one writer thread fed by a bounded queue: it
+    # collects the operations that arrive within `commit_window_ms` (up to
+    # `max_batch`) and commits them together as one WriteBatch, so concurrent
+    # agent posts, heartbeats and counter inserts share an fsync instead of
+    # fighting over the write lock. Neither pool is shared with Starlette's
+    # default threadpool.
+    def __init__(
+        self,
+        db_path: str,
+        readers: int = 4,
+        queue_size: int = 1000,
+        commit_window_ms: float = 5,
+        max_batch: int = 200,
+    ) -> None:
+        self.db_path = db_path
+        self.readers = max(1, int(readers))
+        self.commit_window = max(0.0, float(commit_window_ms)) / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        self._read_pool = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="db-read")
+        self._queue: "queue.Queue[Optional[_WriteOp]]" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._batch: Optional[WriteBatch] = None
+        self._lock = threading.Lock()
+        self._read_pending = 0
+        self._commits = 0
+        self._ops = 0
+        self._failed_ops = 0
+        self._failed_commits = 0
+        self._commit_ms_total = 0.0
+        self._commit_ms_max = 0.0
+        self._commit_ms_last = 0.0
+        self._wait_ms_total = 0.0
+        self._writer = threading.Thread(target=self._writer_loop, name="db-write", daemon=True)
+        self._writer.start()
+
+    def _read_done(self, _future: Future) -> None:
+        with self._lock:
+            self._read_pending -= 1
+
+    def submit_read(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        with self._lock:
+            self._read_pending += 1
+        future = self._read_pool.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._read_done)
+        return future
+
+    def submit_write(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        # Blocks while the queue is full (backpressure); for plain threads,
+        # call .result() on the returned future.
+        if threading.current_thread() is self._writer:
+            # Nested write from inside a batch operation: run it in place,
+            # as part of the same transaction.
+            future: Future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        op = _WriteOp(fn, args, kwargs)
+        try:
+            self._queue.put(op, timeout=_QUEUE_PUT_TIMEOUT_SEC)
+        except queue.Full:
+            raise WriteQueueFull("database write queue is full")
+        return op.future
+
+    async def read(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.wrap_future(self.submit_read(fn, *args, **kwargs))
+
+    async def write(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        op = _WriteOp(fn, args, kwargs)
+        deadline = time.monotonic() + _QUEUE_PUT_TIMEOUT_SEC
+        while True:
+            try:
+                self._queue.put_nowait(op)
+                break
+            except queue.Full:
+                # Never block the event loop on a full queue; retry shortly.
+                if time.monotonic() >= deadline:
+                    raise WriteQueueFull("database write queue is full")
+                await asyncio.sleep(0.01)
+        return await asyncio.wrap_future(op.future)
+
+    def _writer_loop(self) -> None:
+        while True:
+            op = self._queue.get()
+            if op is None:
+                break
+            ops = [op]
+            stop = False
+            deadline = time.perf_counter() + self.commit_window
+            while len(ops) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    nxt = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                ops.append(nxt)
+            self._commit_ops(ops)
+            if stop:
+                break
+        if self._batch is not None:
+            self._batch.close()
+            self._batch = None
+
+    def _commit_ops(self, ops: List[_WriteOp]) -> None:
+        ops = [op for op in ops if op.future.set_running_or_notify_cancel()]
+        if not ops:
+            return
+        started = time.perf_counter()
+        outcomes = []
+        try:
+            if self._batch is None:
+                self._batch = WriteBatch(self.db_path)
+            self._batch.begin()
+            for op in ops:
+                try:
+                    outcomes.append((op, self._batch.run(op.fn, *op.args, **op.kwargs), None))
+                except Exception as e:
+                    outcomes.append((op, None, e))
+            self._batch.commit()
+        except Exception as e:
+            # BEGIN/COMMIT failed (e.g. locked by another process past the
+            # busy timeout): nothing was written, fail the whole batch and
+            # start over with a fresh connection.
+            if self._batch is not None:
+                try:
+                    self._batch.rollback()
+                    self._batch.close()
+                except Exception:
+                    pass
+                self._batch = None
+            with self._lock:
+                self._failed_commits += 1
+                self._failed_ops += len(ops)
+            for op in ops:
+                op.future.set_exception(e)
+            return
+        finished = time.perf_counter()
+        commit_ms = (finished - started) * 1000.0
+        with self._lock:
+            self._commits += 1
+            self._ops += len(ops)
+            self._failed_ops += sum(1 for o in outcomes if o[2] is not None)
+            self._commit_ms_total += commit_ms
+            self._commit_ms_last = commit_ms
+            self._commit_ms_max = max(self._commit_ms_max, commit_ms)
+            self._wait_ms_total += sum((finished - op.queued_at) * 1000.0 for op in ops)
+        # Results are released only after COMMIT, so a resolved future means
+        # the write is durable.
+        for op, result, error in outcomes:
+            if error is not None:
+                op.future.set_exception(error)
+            else:
+                op.future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            commits = self._commits
+            return {
+                "readers": self.readers,
+                "read_pending": self._read_pending,
+                "write_queue_depth": self._queue.qsize(),
+                "write_queue_max": self._queue.maxsize,
+                "commits": commits,
+                "write_ops": self._ops,
+                "failed_write_ops": self._failed_ops,
+                "failed_commits": self._failed_commits,
+                "ops_per_commit": round(self._ops / commits, 2) if commits else 0.0,
+                "commit_ms_last": round(self._commit_ms_last, 3),
+                "commit_ms_avg": round(self._commit_ms_total / commits, 3) if commits else 0.0,
+                "commit_ms_max": round(self._commit_ms_max, 3),
+                "write_latency_ms_avg": round(self._wait_ms_total / self._ops, 3) if self._ops else 0.0,
+            }
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        self._read_pool.shutdown(wait=False)
+        # Queued writes are committed before the writer exits. With the queue
+        # still full after `timeout` the writer is abandoned (it is a daemon
+        # thread) rather than blocking shutdown forever.
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._writer.join(timeout=timeout)
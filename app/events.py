@@ -0,0 +1,63 @@
+﻿import asyncio
+import threading
+from typing import Iterable, Set
+
+
+class Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._event = asyncio.Event()
+        self._lock = threading.Lock()
+        self._pending: Set[str] = set()
+
+    def _notify(self, tables: Iterable[str]) -> None:
+        with self._lock:
+            self._pending.update(tables)
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            # Loop already closed (client gone during shutdown).
+            pass
+
+    async def wait(self, timeout: float, debounce: float = 0.0) -> Set[str]:
+        # Returns the tables changed since the last call, or an empty set on timeout.
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return set()
+        if debounce > 0:
+            # A poll cycle writes one row per printer; coalesce them into one push.
+            await asyncio.sleep(debounce)
+        self._event.clear()
+        with self._lock:
+            tables, self._pending = self._pending, set()
+        return tables
+
+
+class ChangeBroker:
+    # Fan-out of storage write notifications (called from any thread) to
+    # asyncio subscribers such as the /api/stream SSE handlers.
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subs: Set[Subscription] = set()
+
+    def subscribe(self) -> Subscription:
+        sub = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            self._subs.discard(sub)
+
+    def publish(self, tables: Iterable[str]) -> None:
+        tables = tuple(tables)
+        with self._lock:
+            subs = list(self._subs)
+        for sub in subs:
+            sub._notify(tables)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subs)
@@ -0,0 +1,88 @@
+﻿import csv
+import io
+import tempfile
+from typing import IO, Any, Iterable, Iterator, Optional, Sequence, Tuple
+
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# (title, headers, rows, column widths or None)
+Sheet = Tuple[str, Sequence[str], Iterable[Sequence[Any]], Optional[Sequence[float]]]
+
+
+def csv_stream(headers: Sequence[str], rows: Iterable[Sequence[Any]], batch_size: int = 500) -> Iterator[bytes]:
+    # Yields the CSV in small chunks: the header goes out immediately and the
+    # buffer is flushed every `batch_size` rows, so memory stays constant no
+    # matter how many rows the iterator produces.
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(headers)
+    yield buf.getvalue().encode("utf-8")
+    buf.seek(0)
+    buf.truncate(0)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= batch_size:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate(0)
+            pending = 0
+    if pending:
+        yield buf.getvalue().encode("utf-8")
+
+
+def _xlsx_value(value: Any) -> Any:
+    # Numbers stay numeric cells (sums/filters work in Excel); everything else is text.
+    if value is None:
+        return ""
+    if isinstance(value, (bool, int, float)):
+        return value
+    return str(value)
+
+
+def write_xlsx(fileobj: IO[bytes], sheets: Iterable[Sheet]) -> None:
+    # write_only keeps only the current row in memory; openpyxl streams each
+    # sheet to its own temp file and zips them on save.
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    bold = Font(bold=True)
+    for title, headers, rows, widths in sheets:
+        ws = wb.create_sheet(title=title)
+        if widths is None:
+            widths = [max(12, len(str(h)) + 4) for h in headers]
+        for idx, width in enumerate(widths, start=1):
+            ws.column_dimensions[get_column_letter(idx)].width = width
+        header_cells = []
+        for h in headers:
+            cell = WriteOnlyCell(ws, value=str(h))
+            cell.font = bold
+            header_cells.append(cell)
+        ws.append(header_cells)
+        for row in rows:
+            ws.append([_xlsx_value(v) for v in row])
+    wb.save(fileobj)
+
+
+def xlsx_spooled(sheets: Iterable[Sheet], max_memory: int = 8 * 1024 * 1024) -> IO[bytes]:
+    # Small workbooks stay in memory, large ones spill to disk transparently.
+    out = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    write_xlsx(out, sheets)
+    out.seek(0)
+    return out
+
+
+def file_chunks(fileobj: IO[bytes], chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    try:
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fileobj.close()
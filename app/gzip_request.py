@@ -0,0 +1,81 @@
+import itertools
+import json
+import zlib
+from typing import Iterable
+
+from app.ndjson import make_decoder
+
+
+# Upper bound for a decompressed request body.
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+
+class GzipRequestMiddleware:
+    # Accepts "Content-Encoding: gzip" request bodies on `paths`: the body
+    # is decompressed (at most `max_bytes`) and handed on without the header,
+    # so the endpoints keep parsing plain JSON. Other paths, including the
+    # streaming NDJSON endpoint that decodes by itself, are passed through.
+    def __init__(self, app, paths: Iterable[str], max_bytes: int = MAX_BODY_BYTES) -> None:
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = int(max_bytes)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        headers = [(k, v) for k, v in scope["headers"] if k != b"content-encoding"]
+        encoding = next((v for k, v in scope["headers"] if k == b"content-encoding"), b"").strip().lower()
+        if encoding not in (b"gzip", b"x-gzip"):
+            await self.app(scope, receive, send)
+            return
+
+        decoder = make_decoder("gzip")
+        parts = []
+        size = 0
+        try:
+            more = True
+            while more:
+                message = await receive()
+                if message["type"] != "http.request":
+                    return
+                more = message.get("more_body", False)
+                outputs = decoder.decompress(message.get("body", b""))
+                if not more:
+                    outputs = itertools.chain(outputs, decoder.flush())
+                # Decoded in bounded steps, so a gzip bomb stops at max_bytes.
+                for out in outputs:
+                    size += len(out)
+                    if size > self.max_bytes:
+                        await self._error(send, 413, f"decompressed body exceeds {self.max_bytes} bytes")
+                        return
+                    parts.append(out)
+        except zlib.error as e:
+            await self._error(send, 400, f"invalid gzip body: {e}")
+            return
+
+        body = b"".join(parts)
+        headers = [(k, v) for k, v in headers if k != b"content-length"]
+        headers.append((b"content-length", str(len(body)).encode("ascii")))
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        await self.app(dict(scope, headers=headers), replay, send)
+
+    @staticmethod
+    async def _error(send, status: int, message: str) -> None:
+        body = json.dumps({"ok": False, "error": message}).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("ascii"))],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -1,15 +1,44 @@
-﻿from fastapi import FastAPI, Query, Body
-from fastapi.responses import HTMLResponse, Response
-from typing import Optional
+﻿from fastapi import FastAPI, Query, Body, Request
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
+from datetime import datetime
+from typing import List, Optional, Tuple
+import hashlib
+import json
 import threading
 import time
+import xmlrpc.client
 
+from app.cache import ResultCache
 from app.config import load_config
+from app.db_executor import DBExecutor
+from app.events import ChangeBroker
+from app.exports import csv_stream
+from app.gzip_request import GzipRequestMiddleware
 from app.ingest import _select_files
 from app.log_parser import iter_printlog_files
+from app.ndjson import NDJSONError, iter_ndjson, validate_client_job
+from app.papercut_cache import CachedPaperCutClient, is_unknown_fault
+from app.papercut_client import build_client
+from app.papercut_joblog import PaperCutJobLogPuller
+from app.papercut_sync import PaperCutUserSync
+from app.presence import AgentPresence
 from app.printer_scraper import fetch_counters
+from app.report_jobs import ReportJobManager, ReportQueueFull, normalize_report_params
+from app.reports import (
+    MEDIA_TYPES,
+    REPORT_FORMATS,
+    counter_report_table,
+    job_detail_table,
+    report_data,
+    report_filename,
+    report_table,
+)
 from app.storage import (
+    PRESENCE_TABLE,
+    add_write_listener,
     create_department,
+    data_generation,
+    decode_job_cursor,
     delete_client_agent,
     delete_department,
     delete_printer_department,
@@ -19,7 +48,7 @@ from app.storage import (
     get_printer_source,
     init_db,
     insert_printer_counter,
-    insert_client_jobs,
+    insert_client_batch,
     list_departments,
     list_known_printers,
     list_client_agents,
@@ -32,11 +61,11 @@ from app.storage import (
     query_counter_report,
     query_counter_daily,
     query_jobs,
-    query_job_printer_readings,
+    query_jobs_page,
     query_recent_counter_events,
-    query_report,
     query_summary,
     set_printer_source_error,
+    touch_client_agents,
     update_department,
     update_client_agent,
     update_printer_source,
@@ -50,20 +79,221 @@ from app.storage import (
 )
 
 app = FastAPI(title="Print Server Dashboard")
+# Agents gzip larger job batches and heartbeats.
+app.add_middleware(GzipRequestMiddleware, paths=("/api/client-jobs", "/api/agents/heartbeat"))
 
 cfg = load_config()
 
 _poll_thread_started = False
+_result_cache = ResultCache(max_entries=cfg.cache_max_entries, ttl_sec=cfg.cache_ttl_sec)
+_change_broker = ChangeBroker()
+_db = DBExecutor(
+    cfg.db_path,
+    readers=cfg.db_read_workers,
+    queue_size=cfg.db_write_queue_size,
+    commit_window_ms=cfg.db_commit_window_ms,
+)
+add_write_listener(_change_broker.publish)
+_report_jobs = ReportJobManager(
+    cfg.db_path,
+    cfg.report_cache_dir,
+    max_workers=cfg.report_workers,
+    processes=cfg.report_processes,
+    ttl_sec=cfg.report_cache_ttl_sec,
+    max_bytes=cfg.report_cache_max_mb * 1024 * 1024,
+)
+
+# Tables whose changes are pushed on /api/stream ("*" = written by another process).
+_STREAM_COUNTER_TABLES = {"printer_counters", "printer_sources", "*"}
+_STREAM_AGENT_TABLES = {"client_agents", PRESENCE_TABLE, "*"}
+# Writes after which the in-memory presence table must be reloaded; the
+# presence flush (tagged PRESENCE_TABLE) only stores what memory already has.
+_PRESENCE_RELOAD_TABLES = {"client_agents", "*"}
+
+_presence = AgentPresence()
+_presence_thread_started = False
+
+_papercut = build_client(
+    cfg.papercut_xmlrpc_url,
+    cfg.papercut_auth_token,
+    cfg.papercut_verify_tls,
+    max_connections=cfg.papercut_max_connections,
+    batch_size=cfg.papercut_batch_size,
+)
+_papercut_sync: Optional[PaperCutUserSync] = None
+# Lookups (names, departments, balances) go through the cache; the sync
+# above needs current values and uses the client directly.
+_papercut_lookup: Optional[CachedPaperCutClient] = None
+if _papercut is not None:
+    _papercut_lookup = CachedPaperCutClient(
+        _papercut,
+        ttl_sec=cfg.papercut_cache_ttl_sec,
+        negative_ttl_sec=cfg.papercut_cache_negative_ttl_sec,
+        max_entries=cfg.papercut_cache_max_entries,
+    )
+
+
+def _on_write(tables) -> None:
+    if _PRESENCE_RELOAD_TABLES.intersection(tables):
+        _presence.mark_stale()
+
+
+add_write_listener(_on_write)
+
+
+def _cached(endpoint: str, params: tuple, compute):
+    # Results are reused until the next write to the database (or TTL expiry).
+    # Cached values are shared between requests and must not be mutated.
+    return _result_cache.get_or_compute((endpoint, params), data_generation(cfg.db_path), compute)
+
+
+# Distinguishes ETags issued by this process from those of a previous run,
+# since the write generation restarts from zero.
+_etag_epoch = f"{int(time.time()):x}"
+
+
+def _etag(endpoint: str, params: tuple) -> str:
+    digest = hashlib.sha1(f"{endpoint}|{params!r}".encode("utf-8")).hexdigest()[:12]
+    return f'"{_etag_epoch}-{data_generation(cfg.db_path)}-{digest}"'
+
+
+def _write(fn, *args, **kwargs):
+    # Blocking form for sync handlers and background threads; all mutations
+    # go through the single writer thread.
+    return _db.submit_write(fn, *args, **kwargs).result()
+
+
+_job_log: Optional[PaperCutJobLogPuller] = None
+if cfg.papercut_job_log_url:
+    _job_log = PaperCutJobLogPuller(
+        cfg.papercut_job_log_url,
+        cfg.db_path,
+        _write,
+        start_days=cfg.default_days,
+        page_bytes=cfg.papercut_job_log_page_kb * 1024,
+        interval_sec=cfg.papercut_job_log_interval_sec,
+        verify_tls=cfg.papercut_verify_tls,
+    )
+
+if _papercut is not None:
+    _papercut_sync = PaperCutUserSync(
+        _papercut,
+        cfg.db_path,
+        _write,
+        page_size=cfg.papercut_sync_page_size,
+        interval_sec=cfg.papercut_sync_interval_sec,
+    )
+
+
+async def _cached_read(endpoint: str, params: tuple, compute):
+    return await _db.read(_cached, endpoint, params, compute)
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match", "")
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return etag in tags or "*" in tags
+
+
+async def _conditional_json(request: Request, endpoint: str, params: tuple, compute):
+    # The ETag is derived from the data generation alone, so a matching
+    # If-None-Match answers 304 without querying or serializing anything.
+    # Reading the generation touches SQLite, so it runs on the DB executor.
+    etag = await _db.read(_etag, endpoint, params)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=await _cached_read(endpoint, params, compute), headers=headers)
+
+
+def _agent_rows():
+    rows = _presence.list()
+    if rows is None:
+        _presence.load(list_client_agents(cfg.db_path))
+        rows = _presence.list(allow_stale=True)
+    return rows
+
+
+def _flush_presence() -> None:
+    seen = _presence.take_dirty()
+    if not seen:
+        return
+    try:
+        _write(touch_client_agents, cfg.db_path, seen)
+    except Exception:
+        _presence.restore_dirty(seen)
+        raise
+    _presence.note_flushed(len(seen))
+
+
+def _presence_flush_loop():
+    while True:
+        time.sleep(max(1, cfg.agent_presence_flush_sec))
+        try:
+            _flush_presence()
+        except Exception:
+            pass
+
+
+def _start_presence_flush_thread():
+    global _presence_thread_started
+    if _presence_thread_started:
+        return
+    _presence_thread_started = True
+    t = threading.Thread(target=_presence_flush_loop, daemon=True)
+    t.start()
+
+
+# Records per write op when importing print logs at startup.
+LOG_IMPORT_CHUNK_RECORDS = 2000
+
+
+def _import_print_logs(files: List[str]) -> None:
+    # Files are parsed on this thread and stored in bounded chunks, so the
+    # writer is never held by the whole import and agent posts and
+    # heartbeats interleave with it.
+    chunk = []
+    try:
+        for rec in iter_printlog_files(files):
+            chunk.append(rec)
+            if len(chunk) >= LOG_IMPORT_CHUNK_RECORDS:
+                _write(upsert_jobs, cfg.db_path, chunk)
+                chunk = []
+        if chunk:
+            _write(upsert_jobs, cfg.db_path, chunk)
+    except Exception:
+        pass
 
 
 @app.on_event("startup")
 def startup() -> None:
     init_db(cfg.db_path)
+    _presence.load(list_client_agents(cfg.db_path))
+    _start_presence_flush_thread()
     if cfg.papercut_log_dir:
         files = _select_files(cfg.papercut_log_dir, cfg.papercut_log_glob, cfg.default_days)
-        upsert_jobs(cfg.db_path, iter_printlog_files(files))
+        if files:
+            threading.Thread(target=_import_print_logs, args=(files,), name="log-import", daemon=True).start()
     if cfg.printer_poll_enabled:
         _start_printer_poll_thread()
+    if _papercut_sync is not None and cfg.papercut_sync_interval_sec > 0:
+        _papercut_sync.start()
+    if _job_log is not None:
+        _job_log.start()
+
+
+@app.on_event("shutdown")
+def shutdown() -> None:
+    _report_jobs.shutdown()
+    try:
+        _flush_presence()
+    except Exception:
+        pass
+    if _papercut is not None:
+        _papercut.close()
+    _db.shutdown()
 
 
 def _scan_all_printers():
@@ -74,7 +304,8 @@ def _scan_all_printers():
             continue
         try:
             counters = fetch_counters(src.get("counter_url", ""), src.get("brand", ""))
-            insert_printer_counter(
+            _write(
+                insert_printer_counter,
                 cfg.db_path,
                 printer_name=src.get("name", ""),
                 ip=src.get("ip", ""),
@@ -84,10 +315,10 @@ def _scan_all_printers():
                 total_copy=counters.get("copy", 0),
                 total_scan=counters.get("scan", 0),
             )
-            set_printer_source_error(cfg.db_path, int(src.get("id", 0)), None)
+            _write(set_printer_source_error, cfg.db_path, int(src.get("id", 0)), None)
             results.append({"printer": src.get("name", ""), "ok": True})
         except Exception as e:
-            set_printer_source_error(cfg.db_path, int(src.get("id", 0)), str(e))
+            _write(set_printer_source_error, cfg.db_path, int(src.get("id", 0)), str(e))
             results.append({"printer": src.get("name", ""), "ok": False, "error": str(e)})
     return results
 
@@ -110,21 +341,56 @@ def _start_printer_poll_thread():
     t.start()
 
 
+_scan_lock = threading.Lock()
+_scan_state = {"running": False, "started_at": None, "finished_at": None, "results": []}
+
+
+def _run_manual_scan():
+    try:
+        results = _scan_all_printers()
+    except Exception as e:
+        results = [{"printer": "", "ok": False, "error": str(e)}]
+    with _scan_lock:
+        _scan_state.update(running=False, finished_at=datetime.now().isoformat(), results=results)
+
+
 @app.get("/api/summary")
-def api_summary(days: int = Query(default=None)):
+async def api_summary(days: int = Query(default=None)):
     d = days if days is not None else cfg.default_days
-    return query_summary(cfg.db_path, d)
+    return await _cached_read("summary", (d,), lambda: query_summary(cfg.db_path, d))
 
 
 @app.get("/api/jobs")
-def api_jobs(
+async def api_jobs(
+    request: Request,
     limit: int = 50,
     user: Optional[str] = None,
     printer: Optional[str] = None,
     since: Optional[str] = None,
     until: Optional[str] = None,
+    cursor: Optional[str] = None,
 ):
-    return query_jobs(cfg.db_path, limit=limit, user=user, printer=printer, since=since, until=until)
+    # Without `cursor` the legacy plain list is returned. Passing `cursor`
+    # (empty for the first page) switches to {"items", "next_cursor"} pages.
+    if cursor is None:
+        return await _conditional_json(
+            request,
+            "jobs",
+            (limit, user, printer, since, until),
+            lambda: query_jobs(cfg.db_path, limit=limit, user=user, printer=printer, since=since, until=until),
+        )
+    try:
+        decode_job_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}
+    return await _conditional_json(
+        request,
+        "jobs-page",
+        (limit, user, printer, since, until, cursor),
+        lambda: query_jobs_page(
+            cfg.db_path, limit=limit, user=user, printer=printer, since=since, until=until, cursor=cursor or None
+        ),
+    )
 
 
 @app.get("/api/user-departments")
@@ -139,7 +405,7 @@ def api_user_departments_upsert(payload: dict = Body(...)):
     source = str(payload.get("source", "manual")).strip() or "manual"
     if not user or not department:
         return {"ok": False, "error": "user and department are required"}
-    upsert_user_department(cfg.db_path, user, department, source)
+    _write(upsert_user_department, cfg.db_path, user, department, source)
     return {"ok": True}
 
 
@@ -155,7 +421,7 @@ def api_printer_models_upsert(payload: dict = Body(...)):
     source = str(payload.get("source", "manual")).strip() or "manual"
     if not printer or not model:
         return {"ok": False, "error": "printer and model are required"}
-    upsert_printer_model(cfg.db_path, printer, model, source)
+    _write(upsert_printer_model, cfg.db_path, printer, model, source)
     return {"ok": True}
 
 
@@ -170,7 +436,7 @@ def api_departments_create(payload: dict = Body(...)):
     if not name:
         return {"ok": False, "error": "name is required"}
     try:
-        create_department(cfg.db_path, name)
+        _write(create_department, cfg.db_path, name)
         return {"ok": True}
     except Exception as e:
         return {"ok": False, "error": str(e)}
@@ -182,7 +448,7 @@ def api_departments_update(department_id: int, payload: dict = Body(...)):
     if not name:
         return {"ok": False, "error": "name is required"}
     try:
-        update_department(cfg.db_path, department_id, name)
+        _write(update_department, cfg.db_path, department_id, name)
         return {"ok": True}
     except Exception as e:
         return {"ok": False, "error": str(e)}
@@ -190,7 +456,7 @@ def api_departments_update(department_id: int, payload: dict = Body(...)):
 
 @app.delete("/api/departments/{department_id}")
 def api_departments_delete(department_id: int):
-    delete_department(cfg.db_path, department_id)
+    _write(delete_department, cfg.db_path, department_id)
     return {"ok": True}
 
 
@@ -210,7 +476,7 @@ def api_printer_departments_upsert(payload: dict = Body(...)):
     department_id = payload.get("department_id")
     if not printer or not department_id:
         return {"ok": False, "error": "printer and department_id are required"}
-    upsert_printer_department(cfg.db_path, printer, int(department_id))
+    _write(upsert_printer_department, cfg.db_path, printer, int(department_id))
     return {"ok": True}
 
 
@@ -219,69 +485,174 @@ def api_printer_departments_delete(printer: str):
     p = str(printer or "").strip()
     if not p:
         return {"ok": False, "error": "printer is required"}
-    delete_printer_department(cfg.db_path, p)
+    _write(delete_printer_department, cfg.db_path, p)
     return {"ok": True}
 
 
-@app.post("/api/client-jobs")
-def api_client_jobs(payload: list = Body(...)):
-    if not isinstance(payload, list):
-        return {"ok": False, "error": "payload must be a list"}
-    # Auto-register agents/printers coming from client payload
+def _client_agents(payload: list):
+    # Auto-register agents/printers coming from client payload. A batch
+    # usually repeats the same agent on every record; keep one row per
+    # agent_id (the last record wins) and one model per printer.
+    agents = {}
+    printer_models = {}
     for rec in payload:
         host = str(rec.get("client_host", "")).strip()
         printer_name = str(rec.get("printer", "")).strip()
         printer_model = str(rec.get("printer_model", "")).strip()
-        printer_serial = str(rec.get("printer_serial", "")).strip()
-        location = str(rec.get("location", "")).strip()
         agent_id = str(rec.get("agent_id", "")).strip() or (f"{host}|{printer_name}" if host and printer_name else "")
         if agent_id and host and printer_name:
-            upsert_client_agent(
-                cfg.db_path,
-                agent_id=agent_id,
-                host=host,
-                printer_name=printer_name,
-                printer_model=printer_model,
-                serial=printer_serial,
-                location=location,
-                ip=str(rec.get("client_ip", "")).strip(),
-                version=str(rec.get("agent_version", "")).strip(),
-            )
+            agents[agent_id] = {
+                "agent_id": agent_id,
+                "host": host,
+                "printer_name": printer_name,
+                "printer_model": printer_model,
+                "serial": str(rec.get("printer_serial", "")).strip(),
+                "location": str(rec.get("location", "")).strip(),
+                "ip": str(rec.get("client_ip", "")).strip(),
+                "version": str(rec.get("agent_version", "")).strip(),
+            }
             if printer_model:
-                upsert_printer_model(cfg.db_path, printer_name, printer_model, "agent")
-    inserted = insert_client_jobs(cfg.db_path, payload)
-    return {"ok": True, "inserted": inserted}
+                printer_models[printer_name] = printer_model
+    return list(agents.values()), printer_models
 
 
-@app.post("/api/agents/heartbeat")
-def api_agents_heartbeat(payload: dict = Body(...)):
-    host = str(payload.get("host", "")).strip()
-    printer_name = str(payload.get("printer_name", "")).strip()
-    agent_id = str(payload.get("agent_id", "")).strip() or (f"{host}|{printer_name}" if host and printer_name else "")
+async def _store_client_records(records: list) -> Tuple[int, int]:
+    agents, printer_models = _client_agents(records)
+    return await _db.write(insert_client_batch, cfg.db_path, agents, printer_models, records)
+
+
+@app.post("/api/client-jobs")
+async def api_client_jobs(payload: list = Body(...)):
+    if not isinstance(payload, list):
+        return {"ok": False, "error": "payload must be a list"}
+    # Records that cannot be stored at all (not a JSON object) are skipped
+    # and reported by index; everything else is stored as before.
+    errors = [
+        {"index": i, "error": "record must be a JSON object"} for i, r in enumerate(payload) if not isinstance(r, dict)
+    ]
+    inserted, updated = await _store_client_records([r for r in payload if isinstance(r, dict)])
+    if errors:
+        return {"ok": True, "inserted": inserted, "updated": updated, "rejected": len(errors), "errors": errors}
+    return {"ok": True, "inserted": inserted, "updated": updated}
+
+
+NDJSON_CHUNK_RECORDS = 500
+
+
+@app.post("/api/client-jobs/ndjson")
+async def api_client_jobs_ndjson(request: Request):
+    # Bulk upload for agent catch-up: one /api/client-jobs record per line,
+    # optionally Content-Encoding gzip or zstd. The body is decoded and
+    # parsed while it streams in and stored every NDJSON_CHUNK_RECORDS
+    # records, so memory stays flat regardless of the upload size. Invalid
+    # lines are skipped and reported; valid ones are stored.
+    received = inserted = updated = rejected = 0
+    errors = []
+    chunk = []
+    try:
+        async for lineno, record, error in iter_ndjson(request.stream(), request.headers.get("content-encoding")):
+            received += 1
+            error = error or validate_client_job(record)
+            if error:
+                rejected += 1
+                if len(errors) < 20:
+                    errors.append({"line": lineno, "error": error})
+                continue
+            chunk.append(record)
+            if len(chunk) >= NDJSON_CHUNK_RECORDS:
+                added, changed = await _store_client_records(chunk)
+                inserted, updated = inserted + added, updated + changed
+                chunk = []
+        if chunk:
+            added, changed = await _store_client_records(chunk)
+            inserted, updated = inserted + added, updated + changed
+    except NDJSONError as e:
+        return JSONResponse(
+            status_code=e.status,
+            content={
+                "ok": False,
+                "error": str(e),
+                "received": received,
+                "inserted": inserted,
+                "updated": updated,
+                "rejected": rejected,
+            },
+        )
+    return {
+        "ok": True,
+        "received": received,
+        "inserted": inserted,
+        "updated": updated,
+        "rejected": rejected,
+        "errors": errors,
+    }
+
+
+def _store_heartbeats(items: List[Tuple[str, dict]]) -> None:
+    for agent_id, fields in items:
+        upsert_client_agent(cfg.db_path, agent_id=agent_id, **fields)
+        if fields["printer_model"]:
+            upsert_printer_model(cfg.db_path, fields["printer_name"], fields["printer_model"], "agent")
+
+
+def _heartbeat_fields(payload: dict, item: dict) -> Optional[Tuple[str, dict]]:
+    # Per-printer values in `item` override the host-level ones in `payload`.
+    def value(key: str) -> str:
+        return str(item.get(key, payload.get(key, "")) or "").strip()
+
+    host = value("host")
+    printer_name = value("printer_name")
+    agent_id = str(item.get("agent_id", "")).strip() or (f"{host}|{printer_name}" if host and printer_name else "")
     if not agent_id or not host or not printer_name:
+        return None
+    return agent_id, {
+        "host": host,
+        "printer_name": printer_name,
+        "printer_model": value("printer_model"),
+        "serial": value("printer_serial"),
+        "location": value("location"),
+        "ip": value("client_ip"),
+        "version": value("agent_version"),
+    }
+
+
+@app.post("/api/agents/heartbeat")
+async def api_agents_heartbeat(payload: dict = Body(...)):
+    # Either one printer, or a host with all its printers under "printers".
+    printers = payload.get("printers")
+    if isinstance(printers, list):
+        items = [_heartbeat_fields(payload, p) for p in printers if isinstance(p, dict)]
+    else:
+        items = [_heartbeat_fields(payload, payload)]
+    items = [i for i in items if i is not None]
+    if not items:
         return {"ok": False, "error": "agent_id/host/printer_name are required"}
-    printer_model = str(payload.get("printer_model", "")).strip()
-    printer_serial = str(payload.get("printer_serial", "")).strip()
-    location = str(payload.get("location", "")).strip()
-    upsert_client_agent(
-        cfg.db_path,
-        agent_id=agent_id,
-        host=host,
-        printer_name=printer_name,
-        printer_model=printer_model,
-        serial=printer_serial,
-        location=location,
-        ip=str(payload.get("client_ip", "")).strip(),
-        version=str(payload.get("agent_version", "")).strip(),
-    )
-    if printer_model:
-        upsert_printer_model(cfg.db_path, printer_name, printer_model, "agent")
-    return {"ok": True}
+    stats = payload.get("stats") if isinstance(payload.get("stats"), dict) else None
+    # Plain "still alive" heartbeats only touch memory and are flushed in
+    # batches every agent_presence_flush_sec; new metadata is written now.
+    changed = [(agent_id, fields) for agent_id, fields in items if _presence.heartbeat(agent_id, fields, stats)]
+    if changed:
+        await _db.write(_store_heartbeats, changed)
+    if len(changed) < len(items):
+        # Coalesced heartbeats reach the database later; push the new
+        # "last seen" to /api/stream now (served from memory).
+        _change_broker.publish((PRESENCE_TABLE,))
+    return {"ok": True, "agents": len(items)}
 
 
 @app.get("/api/agents")
-def api_agents():
-    return list_client_agents(cfg.db_path)
+async def api_agents(request: Request):
+    # Served from the in-memory presence table; the database is read only
+    # after another write to client_agents made it stale.
+    if _presence.stale:
+        rows = await _db.read(_agent_rows)
+    else:
+        rows = None
+    etag = f'"{_etag_epoch}-p{_presence.version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=rows if rows is not None else _agent_rows(), headers=headers)
 
 
 @app.put("/api/agents/{agent_id}")
@@ -298,21 +669,21 @@ def api_agents_update(agent_id: str, payload: dict = Body(...)):
     version = str(payload.get("version", current.get("version", ""))).strip()
     if not host or not printer_name:
         return {"ok": False, "error": "host and printer_name are required"}
-    update_client_agent(cfg.db_path, agent_id, host, printer_name, printer_model, serial, location, ip, version)
+    _write(update_client_agent, cfg.db_path, agent_id, host, printer_name, printer_model, serial, location, ip, version)
     if printer_model:
-        upsert_printer_model(cfg.db_path, printer_name, printer_model, "agent")
+        _write(upsert_printer_model, cfg.db_path, printer_name, printer_model, "agent")
     return {"ok": True}
 
 
 @app.delete("/api/agents/{agent_id}")
 def api_agents_delete(agent_id: str):
-    delete_client_agent(cfg.db_path, agent_id)
+    _write(delete_client_agent, cfg.db_path, agent_id)
     return {"ok": True}
 
 
 @app.get("/api/printer-sources")
-def api_printer_sources():
-    return list_printer_sources(cfg.db_path)
+async def api_printer_sources(request: Request):
+    return await _conditional_json(request, "printer-sources", (), lambda: list_printer_sources(cfg.db_path))
 
 
 @app.post("/api/printer-sources")
@@ -328,15 +699,15 @@ def api_printer_sources_upsert(payload: dict = Body(...)):
     if not name or not ip or not counter_url:
         return {"ok": False, "error": "name, ip and counter_url are required"}
     if source_id:
-        update_printer_source(cfg.db_path, int(source_id), name, ip, brand, model, serial, location, counter_url, True)
+        _write(update_printer_source, cfg.db_path, int(source_id), name, ip, brand, model, serial, location, counter_url, True)
         return {"ok": True, "updated": True}
-    upsert_printer_source(cfg.db_path, name, ip, brand, model, serial, location, counter_url, True)
+    _write(upsert_printer_source, cfg.db_path, name, ip, brand, model, serial, location, counter_url, True)
     return {"ok": True, "created": True}
 
 
 @app.delete("/api/printer-sources/{source_id}")
 def api_printer_sources_delete(source_id: int):
-    delete_printer_source(cfg.db_path, source_id)
+    _write(delete_printer_source, cfg.db_path, source_id)
     return {"ok": True}
 
 
@@ -347,7 +718,8 @@ def api_printer_source_test(source_id: int):
         return {"ok": False, "error": "printer source not found"}
     try:
         counters = fetch_counters(src.get("counter_url", ""), src.get("brand", ""))
-        insert_printer_counter(
+        _write(
+            insert_printer_counter,
             cfg.db_path,
             printer_name=src.get("name", ""),
             ip=src.get("ip", ""),
@@ -357,22 +729,158 @@ def api_printer_source_test(source_id: int):
             total_copy=counters.get("copy", 0),
             total_scan=counters.get("scan", 0),
         )
-        set_printer_source_error(cfg.db_path, source_id, None)
+        _write(set_printer_source_error, cfg.db_path, source_id, None)
         return {"ok": True, "counters": counters}
     except Exception as e:
-        set_printer_source_error(cfg.db_path, source_id, str(e))
+        _write(set_printer_source_error, cfg.db_path, source_id, str(e))
         return {"ok": False, "error": str(e)}
 
 
 @app.post("/api/printer-scan")
-def api_printer_scan():
-    results = _scan_all_printers()
-    return {"ok": True, "results": results}
+async def api_printer_scan():
+    # Scanning waits on every printer's web page; run it in the background
+    # and let the dashboard follow via /api/stream or GET /api/printer-scan.
+    with _scan_lock:
+        if _scan_state["running"]:
+            return {"ok": True, "started": False}
+        _scan_state.update(running=True, started_at=datetime.now().isoformat(), finished_at=None, results=[])
+    threading.Thread(target=_run_manual_scan, daemon=True).start()
+    return {"ok": True, "started": True}
+
+
+@app.get("/api/printer-scan")
+async def api_printer_scan_status():
+    with _scan_lock:
+        return {"ok": True, **_scan_state}
+
+
+@app.post("/api/papercut-sync")
+async def api_papercut_sync():
+    # Starts a user/department sweep now instead of waiting for the interval.
+    if _papercut_sync is None:
+        return {"ok": False, "error": "PaperCut not configured"}
+    return {"ok": True, "started": _papercut_sync.trigger()}
+
+
+# Read in one getUserProperties call per user by /api/papercut-users.
+PAPERCUT_USER_PROPERTIES = ("full-name", "department", "office")
+
+
+@app.get("/api/papercut-users/{user}")
+def api_papercut_user(user: str):
+    # PaperCut's name and department for one user, e.g. to prefill the
+    # department form. Goes through the lookup cache: repeated and unknown
+    # users do not reach the server every time.
+    if _papercut_lookup is None:
+        return {"ok": False, "error": "PaperCut not configured"}
+    try:
+        values = _papercut_lookup.call("getUserProperties", user, list(PAPERCUT_USER_PROPERTIES))
+    except xmlrpc.client.Fault as e:
+        status = 404 if is_unknown_fault(e) else 502
+        return JSONResponse(status_code=status, content={"ok": False, "error": e.faultString})
+    except Exception as e:
+        return JSONResponse(status_code=502, content={"ok": False, "error": str(e)})
+    props = dict(zip(PAPERCUT_USER_PROPERTIES, [str(v or "").strip() for v in values or []]))
+    return {
+        "ok": True,
+        "user": user,
+        "full_name": props.get("full-name", ""),
+        "department": props.get("department") or props.get("office", ""),
+    }
+
+
+@app.get("/api/papercut-sync")
+async def api_papercut_sync_status():
+    if _papercut_sync is None:
+        return {"ok": False, "error": "PaperCut not configured"}
+    return {"ok": True, **await _db.read(_papercut_sync.status)}
+
+
+@app.post("/api/papercut-job-log")
+async def api_papercut_job_log():
+    if _job_log is None:
+        return {"ok": False, "error": "papercut_job_log_url not configured"}
+    return {"ok": True, "started": _job_log.trigger()}
+
+
+@app.get("/api/papercut-job-log")
+async def api_papercut_job_log_status():
+    if _job_log is None:
+        return {"ok": False, "error": "papercut_job_log_url not configured"}
+    return {"ok": True, **await _db.read(_job_log.status)}
 
 
 @app.get("/api/printer-counters")
-def api_printer_counters():
-    return list_latest_counters(cfg.db_path)
+async def api_printer_counters(request: Request):
+    return await _conditional_json(request, "printer-counters", (), lambda: list_latest_counters(cfg.db_path))
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _diff_rows(previous: dict, rows: list, key: str):
+    current = {str(r.get(key) or ""): r for r in rows}
+    upsert = [r for k, r in current.items() if previous.get(k) != r]
+    remove = [k for k in previous if k not in current]
+    return current, upsert, remove
+
+
+async def _stream_events(request: Request):
+    sub = _change_broker.subscribe()
+    sent = {"counters": {}, "agents": {}}
+    loaders = {
+        "counters": ("printer_name", lambda: _cached("printer-counters", (), lambda: list_latest_counters(cfg.db_path))),
+        "agents": ("agent_id", _agent_rows),
+    }
+    try:
+        # Full snapshot on (re)connect, then deltas only when something is written.
+        for name, (key, load) in loaders.items():
+            rows = await _db.read(load)
+            sent[name], upsert, _ = _diff_rows({}, rows, key)
+            yield _sse(name, {"reset": True, "upsert": upsert, "remove": []})
+        while True:
+            changed = await sub.wait(timeout=15.0, debounce=0.25)
+            if await request.is_disconnected():
+                break
+            if not changed:
+                yield ": keepalive\n\n"
+                continue
+            todo = []
+            if changed & _STREAM_COUNTER_TABLES:
+                todo.append("counters")
+            if changed & _STREAM_AGENT_TABLES:
+                todo.append("agents")
+            for name in todo:
+                key, load = loaders[name]
+                rows = await _db.read(load)
+                sent[name], upsert, remove = _diff_rows(sent[name], rows, key)
+                if upsert or remove:
+                    yield _sse(name, {"reset": False, "upsert": upsert, "remove": remove})
+    finally:
+        _change_broker.unsubscribe(sub)
+
+
+@app.get("/api/stream")
+async def api_stream(request: Request):
+    return StreamingResponse(
+        _stream_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/metrics")
+async def api_metrics():
+    return {
+        "cache": _result_cache.stats(),
+        "db": _db.stats(),
+        "agent_presence": _presence.stats(),
+        "data_generation": await _db.read(data_generation, cfg.db_path),
+        "stream_clients": _change_broker.subscriber_count(),
+        "reports": _report_jobs.stats(),
+        "papercut": _papercut_lookup.stats() if _papercut_lookup is not None else None,
+    }
 
 
 @app.get("/api/exclusions")
@@ -390,7 +898,7 @@ def api_exclusions_upsert(payload: dict = Body(...)):
     if not value:
         return {"ok": False, "error": "value is required"}
     try:
-        upsert_report_exclusion(cfg.db_path, kind, value, note)
+        _write(upsert_report_exclusion, cfg.db_path, kind, value, note)
     except Exception as e:
         return {"ok": False, "error": str(e)}
     return {"ok": True}
@@ -398,10 +906,23 @@ def api_exclusions_upsert(payload: dict = Body(...)):
 
 @app.delete("/api/exclusions")
 def api_exclusions_delete(kind: str = Query(...), value: str = Query(...)):
-    delete_report_exclusion(cfg.db_path, kind, value)
+    _write(delete_report_exclusion, cfg.db_path, kind, value)
     return {"ok": True}
 
 
+def _download(path: str, fmt: str, filename: str) -> FileResponse:
+    return FileResponse(path, media_type=MEDIA_TYPES[fmt], filename=filename)
+
+
+def _export(params: dict):
+    # PDF/XLSX go through the report workers and the on-disk artifact cache.
+    try:
+        path = _report_jobs.get_or_render(params)
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}
+    return _download(path, params["format"], report_filename(params["kind"], params["group_by"], params["format"]))
+
+
 @app.get("/report-counters")
 def report_counters_export(
     format: str = "csv",
@@ -413,148 +934,19 @@ def report_counters_export(
     fmt = (format or "csv").lower()
     group = (group_by or "printer").lower()
     metric = (metric or "print").lower()
-    rows = query_counter_report(cfg.db_path, since=since, until=until, group_by=group, metric=metric)
-    group_labels = {
-        "printer": "Impressora",
-        "brand": "Marca",
-        "model": "Modelo",
-        "serial": "Serial",
-    }
-    metric_labels = {
-        "print": "Impressões",
-        "copy": "Cópias",
-        "scan": "Scans",
-    }
-    headers = ["grupo", "impressora", "marca", "modelo", "serial", "local", "leitura_inicial", "leitura_final", "diferenca"]
+    if fmt not in REPORT_FORMATS:
+        return {"ok": False, "error": "format must be csv, xlsx, or pdf"}
 
     if fmt == "csv":
-        import csv
-        import io
-
-        buf = io.StringIO()
-        writer = csv.writer(buf)
-        writer.writerow(headers)
-        for r in rows:
-            writer.writerow(
-                [
-                    r.get("group_name", ""),
-                    r.get("printer_name", ""),
-                    r.get("brand", ""),
-                    r.get("model", ""),
-                    r.get("serial", ""),
-                    r.get("location", ""),
-                    r.get("reading_initial", 0),
-                    r.get("reading_final", 0),
-                    r.get("difference", 0),
-                ]
-            )
-        data = buf.getvalue().encode("utf-8")
-        return Response(
-            content=data,
+        rows = query_counter_report(cfg.db_path, since=since, until=until, group_by=group, metric=metric)
+        headers, values, _ = counter_report_table(rows)
+        return StreamingResponse(
+            csv_stream(headers, values),
             media_type="text/csv",
             headers={"Content-Disposition": "attachment; filename=relatorio-contadores.csv"},
         )
 
-    if fmt == "xlsx":
-        import io
-        from openpyxl import Workbook
-
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Relatório"
-        ws.append(headers)
-        for r in rows:
-            ws.append(
-                [
-                    r.get("group_name", ""),
-                    r.get("printer_name", ""),
-                    r.get("brand", ""),
-                    r.get("model", ""),
-                    r.get("serial", ""),
-                    r.get("location", ""),
-                    r.get("reading_initial", 0),
-                    r.get("reading_final", 0),
-                    r.get("difference", 0),
-                ]
-            )
-        out = io.BytesIO()
-        wb.save(out)
-        return Response(
-            content=out.getvalue(),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": "attachment; filename=relatorio-contadores.xlsx"},
-        )
-
-    if fmt == "pdf":
-        import io
-        from reportlab.lib.pagesizes import A4, landscape
-        from reportlab.pdfgen import canvas
-
-        out = io.BytesIO()
-        c = canvas.Canvas(out, pagesize=landscape(A4))
-        width, height = landscape(A4)
-        x = 24
-        y = height - 50
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(x, y, "Relatório de Contadores")
-        y -= 20
-        c.setFont("Helvetica", 10)
-        c.drawString(x, y, f"Agrupar por: {group_labels.get(group, group)}")
-        y -= 20
-        c.drawString(x, y, f"Métrica: {metric_labels.get(metric, metric)}")
-        y -= 20
-        c.drawString(x, y, f"Período: {since or '-'} até {until or '-'}")
-        y -= 30
-        c.setFont("Helvetica-Bold", 8)
-        c.drawString(x, y, "Grupo")
-        c.drawString(x + 110, y, "Impressora")
-        c.drawString(x + 220, y, "Marca")
-        c.drawString(x + 290, y, "Modelo")
-        c.drawString(x + 390, y, "Serial")
-        c.drawString(x + 490, y, "Local")
-        c.drawRightString(x + 600, y, "Inicial")
-        c.drawRightString(x + 680, y, "Final")
-        c.drawRightString(x + 760, y, "Diferença")
-        y -= 14
-        c.setFont("Helvetica", 8)
-        for r in rows:
-            if y < 60:
-                c.showPage()
-                y = height - 50
-                c.setFont("Helvetica-Bold", 8)
-                c.drawString(x, y, "Grupo")
-                c.drawString(x + 110, y, "Impressora")
-                c.drawString(x + 220, y, "Marca")
-                c.drawString(x + 290, y, "Modelo")
-                c.drawString(x + 390, y, "Serial")
-                c.drawString(x + 490, y, "Local")
-                c.drawRightString(x + 600, y, "Inicial")
-                c.drawRightString(x + 680, y, "Final")
-                c.drawRightString(x + 760, y, "Diferença")
-                y -= 14
-                c.setFont("Helvetica", 8)
-            c.drawString(x, y, str(r.get("group_name", ""))[:18])
-            c.drawString(x + 110, y, str(r.get("printer_name", ""))[:18])
-            c.drawString(x + 220, y, str(r.get("brand", ""))[:12])
-            c.drawString(x + 290, y, str(r.get("model", ""))[:16])
-            c.drawString(x + 390, y, str(r.get("serial", ""))[:16])
-            c.drawString(x + 490, y, str(r.get("location", ""))[:16])
-            c.drawRightString(x + 600, y, str(r.get("reading_initial", 0)))
-            c.drawRightString(x + 680, y, str(r.get("reading_final", 0)))
-            c.drawRightString(x + 760, y, str(r.get("difference", 0)))
-            y -= 12
-        c.save()
-        return Response(
-            content=out.getvalue(),
-            media_type="application/pdf",
-            headers={"Content-Disposition": "attachment; filename=relatorio-contadores.pdf"},
-        )
-
-    return {"ok": False, "error": "format must be csv, xlsx, or pdf"}
-
-
-def _build_report_rows(since: Optional[str], until: Optional[str], group_by: str):
-    return query_report(cfg.db_path, since=since, until=until, group_by=group_by)
+    return _export(normalize_report_params({"kind": "counters", "format": fmt, "group_by": group, "metric": metric, "since": since, "until": until}))
 
 
 @app.get("/report")
@@ -566,262 +958,58 @@ def report_export(
 ):
     fmt = (format or "csv").lower()
     group = (group_by or "user").lower()
-    rows = _build_report_rows(since, until, group)
-    # Fallback: if there are no job logs, use printer counter deltas.
-    if not rows and group in ("printer", "model"):
-        by = "printer" if group == "printer" else "model"
-        r_print = query_counter_report(cfg.db_path, since=since, until=until, group_by=by, metric="print")
-        r_copy = query_counter_report(cfg.db_path, since=since, until=until, group_by=by, metric="copy")
-        merged = {}
-        for r in r_print:
-            key = str(r.get("group_name", ""))
-            merged[key] = {"group_name": key, "jobs": int(r.get("jobs", 0) or 0), "pages": int(r.get("difference", 0) or 0)}
-        for r in r_copy:
-            key = str(r.get("group_name", ""))
-            if key not in merged:
-                merged[key] = {"group_name": key, "jobs": int(r.get("jobs", 0) or 0), "pages": 0}
-            merged[key]["pages"] += int(r.get("difference", 0) or 0)
-            merged[key]["jobs"] = max(int(merged[key]["jobs"]), int(r.get("jobs", 0) or 0))
-        rows = sorted(merged.values(), key=lambda x: int(x.get("pages", 0)), reverse=True)
-    group_labels = {
-        "user": "Usuário",
-        "department": "Setor",
-        "printer": "Impressora",
-        "model": "Modelo",
-    }
-
-    # Relatório detalhado por impressora com leitura anterior/final e diferença.
-    detailed_printer_rows = None
-    if group == "printer":
-        r_print = query_counter_report(cfg.db_path, since=since, until=until, group_by="printer", metric="print")
-        r_copy = query_counter_report(cfg.db_path, since=since, until=until, group_by="printer", metric="copy")
-        r_jobs = query_job_printer_readings(cfg.db_path, since=since, until=until)
-        merged = {}
-        for src in (r_print, r_copy):
-            for r in src:
-                key = str(r.get("printer_name") or r.get("group_name") or "").strip()
-                if not key:
-                    continue
-                item = merged.setdefault(
-                    key,
-                    {
-                        "impressora": key,
-                        "serial": str(r.get("serial") or "").strip() or "Não definido",
-                        "leitura_anterior": 0,
-                        "leitura_final": 0,
-                        "diferenca": 0,
-                    },
-                )
-                item["leitura_anterior"] += int(r.get("reading_initial", 0) or 0)
-                item["leitura_final"] += int(r.get("reading_final", 0) or 0)
-                item["diferenca"] += int(r.get("difference", 0) or 0)
-                if item["serial"] == "Não definido":
-                    item["serial"] = str(r.get("serial") or "").strip() or "Não definido"
-
-        # Fallback para impressoras de agent (ou outras) sem contador IP:
-        # usa acumulado de jobs para leitura anterior/final.
-        for r in r_jobs:
-            key = str(r.get("printer_name") or "").strip()
-            if not key or key in merged:
-                continue
-            merged[key] = {
-                "impressora": key,
-                "serial": str(r.get("serial") or "").strip() or "Não definido",
-                "leitura_anterior": int(r.get("reading_initial", 0) or 0),
-                "leitura_final": int(r.get("reading_final", 0) or 0),
-                "diferenca": int(r.get("difference", 0) or 0),
-            }
-
-        leitura_anterior_data = "-"
-        if since:
-            try:
-                from datetime import datetime, timedelta
-
-                leitura_anterior_data = (datetime.fromisoformat(str(since)[:10]) - timedelta(days=1)).strftime("%Y-%m-%d")
-            except Exception:
-                leitura_anterior_data = str(since)
-        leitura_final_data = str(until or "-")
-
-        detailed_printer_rows = []
-        for _, v in sorted(merged.items(), key=lambda kv: int(kv[1].get("diferenca", 0)), reverse=True):
-            detailed_printer_rows.append(
-                {
-                    "impressora": v["impressora"],
-                    "serial": v["serial"],
-                    "leitura_anterior_data": leitura_anterior_data,
-                    "leitura_anterior": v["leitura_anterior"],
-                    "leitura_final_data": leitura_final_data,
-                    "leitura_final": v["leitura_final"],
-                    "diferenca": v["diferenca"],
-                }
-            )
-
-    headers = ["group", "jobs", "pages"]
-    if detailed_printer_rows is not None:
-        headers = [
-            "impressora",
-            "serial",
-            "leitura_anterior_data",
-            "leitura_anterior",
-            "leitura_final_data",
-            "leitura_final",
-            "diferenca",
-        ]
+    try:
+        params = normalize_report_params({"kind": "jobs", "format": fmt, "group_by": group, "since": since, "until": until})
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}
 
     if fmt == "csv":
-        import csv
-        import io
-
-        buf = io.StringIO()
-        writer = csv.writer(buf)
-        writer.writerow(headers)
-        if detailed_printer_rows is not None:
-            for r in detailed_printer_rows:
-                writer.writerow(
-                    [
-                        r.get("impressora", ""),
-                        r.get("serial", ""),
-                        r.get("leitura_anterior_data", ""),
-                        r.get("leitura_anterior", 0),
-                        r.get("leitura_final_data", ""),
-                        r.get("leitura_final", 0),
-                        r.get("diferenca", 0),
-                    ]
-                )
+        if group == "job":
+            headers, values, _ = job_detail_table(cfg.db_path, since, until)
         else:
-            for r in rows:
-                writer.writerow([r.get("group_name", ""), r.get("jobs", 0), r.get("pages", 0)])
-        data = buf.getvalue().encode("utf-8")
-        return Response(
-            content=data,
+            rows, detailed_printer_rows = _cached("report", (group, since, until), lambda: report_data(cfg.db_path, since, until, group))
+            headers, values, _ = report_table(rows, detailed_printer_rows)
+        return StreamingResponse(
+            csv_stream(headers, values),
             media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=relatorio.csv"},
+            headers={"Content-Disposition": f"attachment; filename={report_filename('jobs', group, fmt)}"},
         )
 
-    if fmt == "xlsx":
-        import io
-        from openpyxl import Workbook
-
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Relatório"
-        ws.append(headers)
-        if detailed_printer_rows is not None:
-            for r in detailed_printer_rows:
-                ws.append(
-                    [
-                        r.get("impressora", ""),
-                        r.get("serial", ""),
-                        r.get("leitura_anterior_data", ""),
-                        r.get("leitura_anterior", 0),
-                        r.get("leitura_final_data", ""),
-                        r.get("leitura_final", 0),
-                        r.get("diferenca", 0),
-                    ]
-                )
-        else:
-            for r in rows:
-                ws.append([r.get("group_name", ""), r.get("jobs", 0), r.get("pages", 0)])
-        out = io.BytesIO()
-        wb.save(out)
-        return Response(
-            content=out.getvalue(),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": "attachment; filename=relatorio.xlsx"},
-        )
+    return _export(params)
+
+
+@app.post("/api/reports")
+def api_reports_create(payload: dict = Body(...)):
+    try:
+        job = _report_jobs.submit(normalize_report_params(payload))
+    except (ValueError, ReportQueueFull) as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "job": job}
+
+
+@app.get("/api/reports/{job_id}")
+def api_reports_status(job_id: str):
+    job = _report_jobs.get(job_id)
+    if job is None:
+        return {"ok": False, "error": "report job not found"}
+    return {"ok": True, "job": job}
 
-    if fmt == "pdf":
-        import io
-        from reportlab.lib.pagesizes import A4, landscape
-        from reportlab.pdfgen import canvas
-
-        page_size = landscape(A4) if detailed_printer_rows is not None else A4
-        out = io.BytesIO()
-        c = canvas.Canvas(out, pagesize=page_size)
-        width, height = page_size
-        x = 24 if detailed_printer_rows is not None else 40
-        y = height - 50
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(x, y, "Relatório de Impressão")
-        y -= 20
-        c.setFont("Helvetica", 10)
-        c.drawString(x, y, f"Agrupar por: {group_labels.get(group, group)}")
-        y -= 20
-        c.drawString(x, y, f"Período: {since or '-'} até {until or '-'}")
-        y -= 30
-        if detailed_printer_rows is not None:
-            col_printer = x
-            col_serial = x + 175
-            col_data_ant = x + 305
-            col_leitura_ant = x + 410
-            col_data_final = x + 520
-            col_leitura_final = x + 635
-            col_dif = x + 770
-            c.setFont("Helvetica-Bold", 8)
-            c.drawString(col_printer, y, "Impressora")
-            c.drawString(col_serial, y, "Serial")
-            c.drawString(col_data_ant, y, "Data ant.")
-            c.drawRightString(col_leitura_ant, y, "Leitura ant.")
-            c.drawString(col_data_final, y, "Data final")
-            c.drawRightString(col_leitura_final, y, "Leitura final")
-            c.drawRightString(col_dif, y, "Diferença")
-            y -= 14
-            c.setFont("Helvetica", 8)
-            for r in detailed_printer_rows:
-                if y < 60:
-                    c.showPage()
-                    y = height - 50
-                    c.setFont("Helvetica-Bold", 8)
-                    c.drawString(col_printer, y, "Impressora")
-                    c.drawString(col_serial, y, "Serial")
-                    c.drawString(col_data_ant, y, "Data ant.")
-                    c.drawRightString(col_leitura_ant, y, "Leitura ant.")
-                    c.drawString(col_data_final, y, "Data final")
-                    c.drawRightString(col_leitura_final, y, "Leitura final")
-                    c.drawRightString(col_dif, y, "Diferença")
-                    y -= 14
-                    c.setFont("Helvetica", 8)
-                c.drawString(col_printer, y, str(r.get("impressora", ""))[:30])
-                c.drawString(col_serial, y, str(r.get("serial", ""))[:22])
-                c.drawString(col_data_ant, y, str(r.get("leitura_anterior_data", ""))[:10])
-                c.drawRightString(col_leitura_ant, y, str(r.get("leitura_anterior", 0)))
-                c.drawString(col_data_final, y, str(r.get("leitura_final_data", ""))[:10])
-                c.drawRightString(col_leitura_final, y, str(r.get("leitura_final", 0)))
-                c.drawRightString(col_dif, y, str(r.get("diferenca", 0)))
-                y -= 12
-        else:
-            c.setFont("Helvetica-Bold", 10)
-            c.drawString(x, y, "Grupo")
-            c.drawString(x + 260, y, "Jobs")
-            c.drawString(x + 340, y, "Páginas")
-            y -= 14
-            c.setFont("Helvetica", 10)
-            for r in rows:
-                if y < 60:
-                    c.showPage()
-                    y = height - 50
-                    c.setFont("Helvetica-Bold", 10)
-                    c.drawString(x, y, "Grupo")
-                    c.drawString(x + 260, y, "Jobs")
-                    c.drawString(x + 340, y, "Páginas")
-                    y -= 14
-                    c.setFont("Helvetica", 10)
-                c.drawString(x, y, str(r.get("group_name", ""))[:40])
-                c.drawRightString(x + 300, y, str(r.get("jobs", 0)))
-                c.drawRightString(x + 380, y, str(r.get("pages", 0)))
-                y -= 12
-        c.save()
-        return Response(
-            content=out.getvalue(),
-            media_type="application/pdf",
-            headers={"Content-Disposition": "attachment; filename=relatorio.pdf"},
-        )
 
-    return {"ok": False, "error": "format must be csv, xlsx, or pdf"}
+@app.get("/api/reports/{job_id}/download")
+def api_reports_download(job_id: str):
+    found = _report_jobs.artifact(job_id)
+    if found is None:
+        return JSONResponse(status_code=404, content={"ok": False, "error": "report not ready or expired"})
+    path, params = found
+    return _download(path, params["format"], report_filename(params["kind"], params["group_by"], params["format"]))
 
 
 @app.get("/", response_class=HTMLResponse)
-def home():
+async def home():
+    return HTMLResponse(await _cached_read("home", (), _render_home))
+
+
+def _render_home() -> str:
     def _fmt_ts(value: str) -> str:
         try:
             from datetime import datetime
@@ -1294,24 +1482,31 @@ def home():
               alert(out.error || "Erro ao atualizar contadores");
               return false;
             }}
+            // The scan runs in the background; wait for it, then refresh.
+            let status = {{ running: true }};
+            while (status.running) {{
+              await new Promise(r => setTimeout(r, 2000));
+              status = await (await fetch("/api/printer-scan")).json();
+            }}
             await refreshCounters();
             return false;
           }}
-          async function refreshCounters() {{
+          const counterState = new Map();
+          const agentState = new Map();
+          function applyDelta(state, key, msg) {{
+            if (msg.reset) state.clear();
+            (msg.upsert || []).forEach(r => state.set(String(r[key] || ""), r));
+            (msg.remove || []).forEach(k => state.delete(String(k)));
+            renderCounters();
+          }}
+          function renderCounters() {{
             const fmtTs = (v) => {{
               if (!v) return "";
               const d = new Date(v);
               if (Number.isNaN(d.getTime())) return String(v);
               return d.toLocaleString("pt-BR", {{ hour12: false }});
             }};
-            const [resCounters, resAgents] = await Promise.all([
-              fetch("/api/printer-counters"),
-              fetch("/api/agents")
-            ]);
-            const counters = await resCounters.json();
-            const agents = await resAgents.json();
-
-            const ipRows = counters.map(c => ({{
+            const ipRows = [...counterState.values()].map(c => ({{
               origem: "IP",
               printer_name: c.printer_name || "",
               ip: c.ip || "",
@@ -1323,7 +1518,7 @@ def home():
               timestamp: c.timestamp || ""
             }}));
 
-            const agentRows = agents.map(a => ({{
+            const agentRows = [...agentState.values()].map(a => ({{
               origem: "Agent",
               printer_name: a.printer_name || "",
               ip: a.ip || "",
@@ -1355,13 +1550,42 @@ def home():
               </tr>
             `).join("");
           }}
-          refreshCounters();
-          setInterval(refreshCounters, 5000);
+          const etagCache = new Map();
+          async function fetchJson(url) {{
+            // Conditional GET: a 304 reuses the body kept from the last 200.
+            const prev = etagCache.get(url);
+            const res = await fetch(url, {{ cache: "no-store", headers: prev ? {{ "If-None-Match": prev.etag }} : {{}} }});
+            if (res.status === 304 && prev) return prev.body;
+            const body = await res.json();
+            const etag = res.headers.get("ETag");
+            if (etag) etagCache.set(url, {{ etag, body }});
+            return body;
+          }}
+          async function refreshCounters() {{
+            const [counters, agents] = await Promise.all([
+              fetchJson("/api/printer-counters"),
+              fetchJson("/api/agents")
+            ]);
+            applyDelta(counterState, "printer_name", {{ reset: true, upsert: counters }});
+            applyDelta(agentState, "agent_id", {{ reset: true, upsert: agents }});
+          }}
+          function startStream() {{
+            // Server pushes a snapshot on connect and deltas only when counters/agents change.
+            if (!window.EventSource) {{
+              refreshCounters();
+              setInterval(refreshCounters, 5000);
+              return;
+            }}
+            const es = new EventSource("/api/stream");
+            es.addEventListener("counters", ev => applyDelta(counterState, "printer_name", JSON.parse(ev.data)));
+            es.addEventListener("agents", ev => applyDelta(agentState, "agent_id", JSON.parse(ev.data)));
+          }}
+          startStream();
         </script>
       </body>
     </html>
     """
-    return HTMLResponse(html)
+    return html
 
 
 @app.get("/configuracoes", response_class=HTMLResponse)
@@ -1399,7 +1623,7 @@ def settings_page():
             <h3>Setor por Usuário</h3>
             <form id="userDeptForm" onsubmit="return saveUserDept(event);">
               <div class="row">
-                <input id="ud_user" placeholder="Usuário (ex: joao)" required />
+                <input id="ud_user" placeholder="Usuário (ex: joao)" onchange="fillUserDept()" required />
                 <input id="ud_department" placeholder="Setor (ex: Financeiro)" required />
                 <select id="ud_source">
                   <option value="manual">manual</option>
@@ -1545,9 +1769,20 @@ def settings_page():
             return d.toLocaleString("pt-BR", { hour12: false });
           };
 
+          const etagCache = new Map();
           async function j(url, opt) {
-            const r = await fetch(url, opt);
-            return await r.json();
+            if (opt && opt.method && opt.method !== "GET") {
+              const r = await fetch(url, opt);
+              return await r.json();
+            }
+            // Conditional GET: a 304 reuses the body kept from the last 200.
+            const prev = etagCache.get(url);
+            const r = await fetch(url, { cache: "no-store", headers: prev ? { "If-None-Match": prev.etag } : {} });
+            if (r.status === 304 && prev) return prev.body;
+            const body = await r.json();
+            const etag = r.headers.get("ETag");
+            if (etag) etagCache.set(url, { etag, body });
+            return body;
           }
 
           let ipRowsData = [];
@@ -1562,6 +1797,14 @@ def settings_page():
               <tr><td>${esc(r.user)}</td><td>${esc(r.department)}</td><td>${esc(r.source)}</td><td>${fmtTs(r.updated_at)}</td></tr>
             `).join("");
           }
+          async function fillUserDept(){
+            // Suggests the department PaperCut has for the user, if any.
+            const user = ud_user.value.trim();
+            if(!user || ud_department.value) return;
+            const out = await j("/api/papercut-users/" + encodeURIComponent(user));
+            if(out.ok && out.department && !ud_department.value) ud_department.value = out.department;
+            ud_user.title = out.ok ? (out.full_name || "") : "";
+          }
           async function saveUserDept(ev){
             ev.preventDefault();
             const payload = {user:ud_user.value, department:ud_department.value, source:ud_source.value};
@@ -1807,13 +2050,14 @@ def reports_page():
 
           <div class="card">
             <h3>Relatório de Impressões</h3>
-            <form method="get" action="/report">
+            <form method="get" action="/report" data-kind="jobs">
               <div class="row">
                 <select name="group_by">
                   <option value="user">Usuário</option>
                   <option value="department">Setor</option>
                   <option value="printer">Impressora</option>
                   <option value="model">Modelo</option>
+                  <option value="job">Jobs (detalhado, CSV/Excel)</option>
                 </select>
                 <input type="date" name="since" />
                 <input type="date" name="until" />
@@ -1826,14 +2070,14 @@ def reports_page():
                   <option value="pdf">PDF</option>
                 </select>
                 <button type="submit">Gerar relatório</button>
-                <div></div>
+                <div class="status"></div>
               </div>
             </form>
           </div>
 
           <div class="card">
             <h3>Relatório de Contadores (Cópias/Scans)</h3>
-            <form method="get" action="/report-counters">
+            <form method="get" action="/report-counters" data-kind="counters">
               <div class="row">
                 <select name="group_by">
                   <option value="printer">Impressora</option>
@@ -1858,9 +2102,48 @@ def reports_page():
                 </select>
                 <button type="submit">Gerar relatório</button>
               </div>
+              <div class="status" style="margin-top:8px;"></div>
             </form>
           </div>
         </div>
+        <script>
+          // PDF/Excel are generated in the background (POST /api/reports) and
+          // downloaded when ready; CSV keeps the direct streaming link.
+          function sleep(ms) { return new Promise(r => setTimeout(r, ms)); }
+          async function generate(form) {
+            const data = Object.fromEntries(new FormData(form).entries());
+            const status = form.querySelector('.status');
+            const button = form.querySelector('button');
+            data.kind = form.dataset.kind;
+            button.disabled = true;
+            status.textContent = 'Gerando relatório...';
+            try {
+              let r = await (await fetch('/api/reports', {method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify(data)})).json();
+              if (!r.ok) { status.textContent = 'Erro: ' + r.error; return; }
+              let job = r.job;
+              while (job.status === 'queued' || job.status === 'running') {
+                await sleep(1000);
+                r = await (await fetch('/api/reports/' + job.id)).json();
+                if (!r.ok) { status.textContent = 'Erro: ' + r.error; return; }
+                job = r.job;
+              }
+              if (job.status !== 'done') { status.textContent = 'Erro: ' + (job.error || job.status); return; }
+              status.textContent = '';
+              window.location = '/api/reports/' + job.id + '/download';
+            } catch (e) {
+              status.textContent = 'Erro: ' + e;
+            } finally {
+              button.disabled = false;
+            }
+          }
+          document.querySelectorAll('form[data-kind]').forEach(form => {
+            form.addEventListener('submit', ev => {
+              if (form.elements.format.value === 'csv') return;
+              ev.preventDefault();
+              generate(form);
+            });
+          });
+        </script>
       </body>
     </html>
     """
@@ -0,0 +1,237 @@
+import json
+import queue
+import threading
+import zlib
+from typing import Any, AsyncIterator, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for Content-Encoding: zstd
+    zstandard = None
+
+
+# Upper bound for one decompressed NDJSON line; protects against a
+# compressed body that expands into one huge record.
+MAX_LINE_BYTES = 1024 * 1024
+_OUTPUT_STEP = 64 * 1024
+
+
+class NDJSONError(Exception):
+    # status: HTTP status for the response (400 malformed, 413 too large).
+    def __init__(self, message: str, status: int = 400) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class _GzipDecoder:
+    def __init__(self) -> None:
+        self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes):
+        # Output is produced in bounded steps rather than all at once.
+        while data:
+            out = self._d.decompress(data, _OUTPUT_STEP)
+            if out:
+                yield out
+            if self._d.eof:
+                # Concatenated gzip members are valid gzip.
+                data = self._d.unused_data
+                self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                data = self._d.unconsumed_tail
+
+    def flush(self):
+        out = self._d.flush()
+        if out:
+            yield out
+
+
+_NEED_INPUT = object()
+_END = object()
+
+
+class _ZstdDecoder:
+    # zstandard's push API (decompressobj) has no output limit, only the pull
+    # API (stream_reader) reads _OUTPUT_STEP at a time. The reader runs on
+    # its own thread over a source fed by decompress(); the two hand over
+    # strictly in turn (the reader asks for input only once decompress()
+    # has taken all its output), and one step is in flight at most, so the
+    # output held in memory stays bounded whatever the compression ratio.
+    def __init__(self) -> None:
+        self._input: "queue.Queue[bytes]" = queue.Queue()
+        self._output: "queue.Queue[Any]" = queue.Queue(maxsize=1)
+        self._pending = b""
+        self._closed = False
+        self._done = False
+        self._thread: Optional[threading.Thread] = None
+
+    # --- reader thread ---
+
+    def read(self, size: int) -> bytes:
+        # Source of the stream_reader; b"" is the end of the body.
+        if not self._pending:
+            try:
+                self._pending = self._input.get_nowait()
+            except queue.Empty:
+                self._put(_NEED_INPUT)
+                self._pending = self._input.get()
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def _put(self, item: Any) -> None:
+        while not self._closed:
+            try:
+                self._output.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise EOFError("decoder closed")
+
+    def _run(self) -> None:
+        try:
+            reader = zstandard.ZstdDecompressor().stream_reader(self, read_across_frames=True)
+            while True:
+                out = reader.read(_OUTPUT_STEP)
+                if not out:
+                    break
+                self._put(out)
+            self._put(_END)
+        except EOFError:
+            pass
+        except Exception as e:
+            try:
+                self._put(e)
+            except EOFError:
+                pass
+
+    # --- caller side ---
+
+    def _drain(self):
+        while True:
+            item = self._output.get()
+            if item is _NEED_INPUT:
+                return
+            if item is _END:
+                self._done = True
+                return
+            if isinstance(item, Exception):
+                self._done = True
+                raise item
+            yield item
+
+    def decompress(self, data: bytes):
+        if not data or self._done:
+            return
+        self._input.put(data)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="zstd-decoder", daemon=True)
+            self._thread.start()
+        yield from self._drain()
+
+    def flush(self):
+        if self._thread is None or self._done:
+            return
+        self._input.put(b"")
+        yield from self._drain()
+
+    def close(self) -> None:
+        # Lets the reader thread exit when the body is abandoned half-way.
+        self._closed = True
+        self._input.put(b"")
+
+
+class _IdentityDecoder:
+    def decompress(self, data: bytes):
+        if data:
+            yield data
+
+    def flush(self):
+        return iter(())
+
+
+def make_decoder(content_encoding: Optional[str]):
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding in ("identity", ""):
+        return _IdentityDecoder()
+    if encoding in ("gzip", "x-gzip"):
+        return _GzipDecoder()
+    if encoding == "zstd":
+        if zstandard is None:
+            raise NDJSONError("zstd encoding requires the 'zstandard' package on the server", status=415)
+        return _ZstdDecoder()
+    raise NDJSONError(f"unsupported Content-Encoding: {encoding}", status=415)
+
+
+async def iter_ndjson(
+    chunks: AsyncIterator[bytes], content_encoding: Optional[str] = None
+) -> AsyncIterator[Tuple[int, Any, Optional[str]]]:
+    # Yields (line_number, record, error) for every non-empty line while the
+    # body is still being received; only the current partial line is kept.
+    decoder = make_decoder(content_encoding)
+    buf = b""
+    lineno = 0
+
+    def parse(line: bytes):
+        try:
+            return json.loads(line), None
+        except ValueError as e:
+            return None, f"invalid JSON: {e}"
+
+    async def pieces():
+        try:
+            async for chunk in chunks:
+                for out in decoder.decompress(chunk):
+                    yield out
+            for out in decoder.flush():
+                yield out
+        except zlib.error as e:
+            raise NDJSONError(f"invalid compressed body: {e}")
+        except Exception as e:
+            if zstandard is not None and isinstance(e, zstandard.ZstdError):
+                raise NDJSONError(f"invalid compressed body: {e}")
+            raise
+
+    try:
+        async for data in pieces():
+            buf += data
+            start = 0
+            while True:
+                end = buf.find(b"\n", start)
+                if end < 0:
+                    break
+                line = buf[start:end].strip()
+                start = end + 1
+                lineno += 1
+                if line:
+                    record, error = parse(line)
+                    yield lineno, record, error
+            buf = buf[start:]
+            if len(buf) > MAX_LINE_BYTES:
+                raise NDJSONError(f"line {lineno + 1} exceeds {MAX_LINE_BYTES} bytes", status=413)
+        line = buf.strip()
+        if line:
+            record, error = parse(line)
+            yield lineno + 1, record, error
+    finally:
+        close = getattr(decoder, "close", None)
+        if close is not None:
+            close()
+
+
+def validate_client_job(record: Any) -> Optional[str]:
+    # Same record shape as /api/client-jobs; returns an error message or None.
+    if not isinstance(record, dict):
+        return "record must be a JSON object"
+    if not str(record.get("printer", "")).strip():
+        return "printer is required"
+    if not (record.get("submitted") or record.get("timestamp")):
+        return "submitted is required"
+    for field in ("pages", "copies"):
+        value = record.get(field)
+        if value in (None, ""):
+            continue
+        try:
+            int(value)
+        except (TypeError, ValueError):
+            return f"{field} must be an integer"
+    return None
@@ -0,0 +1,183 @@
+import argparse
+import json
+import random
+import threading
+import time
+import xmlrpc.client
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from app.papercut_cache import CachedPaperCutClient
+from app.papercut_client import PaperCutClient
+from app.papercut_stub import PaperCutStubServer
+
+
+# Measures PaperCutClient throughput, connection reuse and multicall
+# batching against the local stand-in server (or any --url):
+#
+#   python -m app.papercut_bench --users 20000 --lookups 5000 --latency-ms 5
+#
+# Each scenario prints one JSON line; server-side counts are only available
+# for the in-process stub.
+
+
+def _lookup_users(count: int, users: int, unknown_rate: float, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    names = []
+    for _ in range(count):
+        if rng.random() < unknown_rate:
+            names.append(f"unknown{rng.randrange(50):02d}")
+        else:
+            names.append(f"user{rng.randrange(max(1, users)):05d}")
+    return names
+
+
+def _run(
+    name: str,
+    client: PaperCutClient,
+    server: Optional[PaperCutStubServer],
+    lookups: int,
+    work: Callable[[], int],
+    extra: Optional[Callable[[], Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    if server is not None:
+        server.reset_stats()
+    started = time.perf_counter()
+    errors = 0
+    try:
+        errors = work()
+    except Exception as e:
+        errors = -1
+        print(json.dumps({"scenario": name, "error": str(e)}))
+    seconds = time.perf_counter() - started
+    result: Dict[str, Any] = {
+        "scenario": name,
+        "lookups": lookups,
+        "seconds": round(seconds, 3),
+        "lookups_per_sec": round(lookups / seconds, 1) if seconds > 0 else 0.0,
+        "faults": errors,
+        "client": client.stats(),
+    }
+    if server is not None:
+        result["server"] = server.stats()
+    if extra is not None:
+        result.update(extra())
+    print(json.dumps(result))
+    return result
+
+
+def _sequential(client: PaperCutClient, users: List[str]) -> int:
+    faults = 0
+    for user in users:
+        try:
+            client.call("getUserProperty", user, "department")
+        except xmlrpc.client.Fault:
+            faults += 1
+    return faults
+
+
+def _threaded(client: Any, users: List[str], threads: int) -> int:
+    faults = [0]
+    lock = threading.Lock()
+
+    def one(user: str) -> None:
+        try:
+            client.call("getUserProperty", user, "department")
+        except xmlrpc.client.Fault:
+            with lock:
+                faults[0] += 1
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, users))
+    return faults[0]
+
+
+def _mapped(client: PaperCutClient, users: List[str]) -> int:
+    values = client.map("getUserProperty", [(u, "department") for u in users])
+    return sum(1 for v in values if isinstance(v, xmlrpc.client.Fault))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark PaperCutClient against the local PaperCut stub.")
+    parser.add_argument("--url", default="", help="benchmark this server instead of an in-process stub")
+    parser.add_argument("--token", default="bench")
+    parser.add_argument("--users", type=int, default=10000, help="stub dataset size")
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--unknown-rate", type=float, default=0.02, help="fraction of lookups for unknown users")
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="stub latency per request")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--max-connections", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    stubs: Dict[bool, PaperCutStubServer] = {}
+    if not args.url:
+        for multicall in (True, False):
+            stubs[multicall] = PaperCutStubServer(
+                port=0,
+                users=args.users,
+                latency_ms=args.latency_ms,
+                error_rate=args.error_rate,
+                drop_rate=args.drop_rate,
+                multicall=multicall,
+                token=args.token,
+                seed=args.seed,
+            ).start()
+
+    def make(max_connections: int, multicall: bool = True) -> PaperCutClient:
+        url = args.url or stubs[multicall].url
+        return PaperCutClient(url, args.token, max_connections=max_connections, batch_size=args.batch_size)
+
+    server = stubs.get(True)
+    users = _lookup_users(args.lookups, args.users, args.unknown_rate, args.seed)
+    # Repeated lookups of a small working set, as when resolving the users
+    # of a report row by row.
+    hot = _lookup_users(200, args.users, args.unknown_rate, args.seed + 1)
+    rng = random.Random(args.seed)
+    repeated = [rng.choice(hot) for _ in range(args.lookups)]
+
+    client = make(1)
+    _run("sequential_1_connection", client, server, len(users), lambda: _sequential(client, users))
+    client.close()
+
+    for connections in sorted({1, args.max_connections}):
+        client = make(connections)
+        _run(
+            f"threads_{args.threads}_pool_{connections}",
+            client,
+            server,
+            len(users),
+            lambda: _threaded(client, users, args.threads),
+        )
+        client.close()
+
+    client = make(args.max_connections)
+    _run("map_multicall", client, server, len(users), lambda: _mapped(client, users))
+    client.close()
+
+    if not args.url:
+        client = make(args.max_connections, multicall=False)
+        _run("map_without_multicall", client, stubs[False], len(users), lambda: _mapped(client, users))
+        client.close()
+
+    client = make(args.max_connections)
+    cached = CachedPaperCutClient(client)
+    _run(
+        "cached_repeated_lookups",
+        client,
+        server,
+        len(repeated),
+        lambda: _threaded(cached, repeated, args.threads),
+        lambda: {"cache": {k: v for k, v in cached.stats().items() if k != "client"}},
+    )
+    cached.close()
+
+    for stub in stubs.values():
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
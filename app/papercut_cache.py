@@ -0,0 +1,198 @@
+import threading
+import xmlrpc.client
+from concurrent.futures import Future
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from app.cache import MISSING, ResultCache
+from app.papercut_client import PaperCutClient
+
+
+# Read-only API methods that may be cached, with their TTL in seconds; None
+# uses the cache's ttl_sec. Anything else (adjustments, updates) always goes
+# to the server.
+METHOD_TTLS: Dict[str, Optional[float]] = {
+    "getUserProperty": None,
+    "getUserProperties": None,
+    "isUserExists": None,
+    "listUserAccounts": 300.0,
+    "getTotalUsers": 300.0,
+    # Balances move with every job.
+    "getUserAccountBalance": 30.0,
+}
+
+
+def is_unknown_fault(fault: xmlrpc.client.Fault) -> bool:
+    # PaperCut's answer for a user (or property) that does not exist; the
+    # only Fault worth caching. Auth errors, server exceptions and transient
+    # faults are raised and asked again next time.
+    message = str(fault.faultString).lower()
+    return any(text in message for text in ("does not exist", "not found", "unknown user", "no such user"))
+
+
+def _freeze(value: Any) -> Hashable:
+    # Parameters such as getUserProperties' property list must be hashable.
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+class CachedPaperCutClient:
+    # Cache in front of PaperCutClient for per-job / per-row lookups such as
+    # a user's full name or department. Results are kept in a bounded LRU
+    # with a TTL per method; a "user does not exist" Fault is cached for
+    # `negative_ttl_sec` and raised again on a hit, so unknown users in the
+    # logs do not hit the server every time. Other Faults are not cached. Concurrent lookups
+    # of the same key share one in-flight call, and map() sends only the
+    # missing keys, in multicall batches.
+    def __init__(
+        self,
+        client: PaperCutClient,
+        ttl_sec: float = 3600.0,
+        negative_ttl_sec: float = 300.0,
+        max_entries: int = 10000,
+        method_ttls: Optional[Dict[str, Optional[float]]] = None,
+    ) -> None:
+        self.client = client
+        self.ttl_sec = float(ttl_sec)
+        self.negative_ttl_sec = float(negative_ttl_sec)
+        self.method_ttls = dict(METHOD_TTLS if method_ttls is None else method_ttls)
+        self._cache = ResultCache(max_entries=max_entries, ttl_sec=self.ttl_sec)
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+        self.negative_hits = 0
+        self.coalesced = 0
+        self.passthrough = 0
+
+    def _ttl(self, method: str, value: Any) -> float:
+        if isinstance(value, xmlrpc.client.Fault):
+            return self.negative_ttl_sec
+        ttl = self.method_ttls.get(method)
+        return self.ttl_sec if ttl is None else float(ttl)
+
+    def _lookup(self, key: Hashable) -> Tuple[Any, Optional[Future], bool]:
+        # -> (cached value or MISSING, future to wait on or None, owner).
+        # The owner must fetch the value and resolve the future.
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not MISSING:
+                if isinstance(value, xmlrpc.client.Fault):
+                    self.negative_hits += 1
+                return value, None, False
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return MISSING, future, False
+            future = self._inflight[key] = Future()
+            return MISSING, future, True
+
+    def _resolve(
+        self,
+        key: Hashable,
+        method: str,
+        future: Future,
+        value: Any = MISSING,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        with self._lock:
+            if error is None and not (isinstance(value, xmlrpc.client.Fault) and not is_unknown_fault(value)):
+                self._cache.set(key, value, ttl_sec=self._ttl(method, value))
+            self._inflight.pop(key, None)
+        if error is None:
+            future.set_result(value)
+        else:
+            # Connection errors are not cached; waiters see the same error.
+            future.set_exception(error)
+
+    @staticmethod
+    def _unwrap(value: Any) -> Any:
+        if isinstance(value, xmlrpc.client.Fault):
+            raise value
+        return value
+
+    def call(self, method: str, *params: Any) -> Any:
+        if method not in self.method_ttls:
+            with self._lock:
+                self.passthrough += 1
+            return self.client.call(method, *params)
+        key = (method, _freeze(params))
+        value, future, owner = self._lookup(key)
+        if value is not MISSING:
+            return self._unwrap(value)
+        if not owner:
+            return self._unwrap(future.result())
+        try:
+            value = self.client.call(method, *params)
+        except xmlrpc.client.Fault as e:
+            value = e
+        except BaseException as e:
+            self._resolve(key, method, future, error=e)
+            raise
+        self._resolve(key, method, future, value)
+        return self._unwrap(value)
+
+    def map(self, method: str, params_list: Sequence[Sequence[Any]]) -> List[Any]:
+        # Same contract as PaperCutClient.map: values or Fault objects.
+        if method not in self.method_ttls:
+            with self._lock:
+                self.passthrough += len(params_list)
+            return self.client.map(method, params_list)
+        results: List[Any] = [MISSING] * len(params_list)
+        waiting: List[Tuple[int, Future]] = []
+        owned: Dict[Hashable, Tuple[Future, Sequence[Any], List[int]]] = {}
+        for i, params in enumerate(params_list):
+            key = (method, _freeze(params))
+            if key in owned:
+                owned[key][2].append(i)
+                continue
+            value, future, owner = self._lookup(key)
+            if value is not MISSING:
+                results[i] = value
+            elif owner:
+                owned[key] = (future, params, [i])
+            else:
+                waiting.append((i, future))
+        if owned:
+            keys = list(owned)
+            try:
+                values = self.client.map(method, [owned[key][1] for key in keys])
+            except BaseException as e:
+                for key in keys:
+                    self._resolve(key, method, owned[key][0], error=e)
+                raise
+            for key, value in zip(keys, values):
+                future, _, indexes = owned[key]
+                self._resolve(key, method, future, value)
+                for i in indexes:
+                    results[i] = value
+        for i, future in waiting:
+            results[i] = future.result()
+        return results
+
+    def get_user_properties(self, users: Sequence[str], prop: str) -> Dict[str, Any]:
+        values = self.map("getUserProperty", [(u, prop) for u in users])
+        return {u: v for u, v in zip(users, values) if not isinstance(v, xmlrpc.client.Fault)}
+
+    def get_user_balances(self, users: Sequence[str]) -> Dict[str, float]:
+        values = self.map("getUserAccountBalance", [(u, "") for u in users])
+        return {u: float(v) for u, v in zip(users, values) if not isinstance(v, xmlrpc.client.Fault)}
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._cache.stats()
+        with self._lock:
+            stats.update(
+                negative_ttl_sec=self.negative_ttl_sec,
+                negative_hits=self.negative_hits,
+                coalesced=self.coalesced,
+                inflight=len(self._inflight),
+                passthrough=self.passthrough,
+            )
+        stats["client"] = self.client.stats()
+        return stats
+
+    def close(self) -> None:
+        self.client.close()
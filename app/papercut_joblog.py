@@ -0,0 +1,242 @@
+import os
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from app.log_parser import parse_printlog_line
+from app.storage import get_sync_state, upsert_jobs
+
+
+SYNC_STATE_NAME = "papercut_job_log"
+
+
+class PaperCutJobLogPuller:
+    # Pulls PaperCut's daily print log incrementally from another machine, so
+    # the dashboard does not need papercut_log_dir on a local disk nor
+    # re-scan whole files. `url_template` names one day's log, e.g.
+    # "http://print-server/logs/printlog_{date:%Y-%m-%d}.log" (an HTTP(S) URL
+    # or a file/UNC path). Each day is read in pages of `page_bytes` with
+    # Range requests from the stored byte offset; only complete lines are
+    # parsed and passed to upsert_jobs together with the new high-water mark
+    # (day + offset), in one transaction. Past days are finished before
+    # moving on; today's log is re-read from its offset every `interval_sec`.
+    # A past day without a log is skipped only once a later day's log can be
+    # read (no jobs that day); while none can, the server or share may just
+    # be unreachable, so the watermark stays put and an error is reported.
+    def __init__(
+        self,
+        url_template: str,
+        db_path: str,
+        write: Callable[..., Any],
+        start_days: int = 7,
+        page_bytes: int = 1024 * 1024,
+        interval_sec: float = 300,
+        verify_tls: bool = True,
+        timeout: float = 30.0,
+    ) -> None:
+        self.url_template = url_template
+        self.db_path = db_path
+        self.write = write
+        self.start_days = max(0, int(start_days))
+        self.page_bytes = max(4096, int(page_bytes))
+        self.interval_sec = float(interval_sec)
+        self.verify_tls = verify_tls
+        self.timeout = float(timeout)
+        self._session = requests.Session()
+        # (location, whole file) from a server that ignored Range, so the
+        # next pages are cut from memory instead of downloading it again.
+        self._body: Optional[Tuple[str, bytes]] = None
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._status: Dict[str, Any] = {
+            "running": False,
+            "started_at": None,
+            "finished_at": None,
+            "bytes": 0,
+            "lines": 0,
+            "inserted": 0,
+            "error": None,
+        }
+
+    def _location(self, day: date) -> str:
+        return self.url_template.format(date=day)
+
+    def _read(self, location: str, offset: int) -> Tuple[Optional[bytes], bool]:
+        # -> (bytes from offset, at most page_bytes, or None when the day has
+        # no log; True when the end of the file was reached).
+        if self._body is not None and self._body[0] == location:
+            return self._page(self._body[1], offset)
+        if not location.lower().startswith(("http://", "https://")):
+            if not os.path.exists(location):
+                return None, True
+            with open(location, "rb") as f:
+                f.seek(offset)
+                data = f.read(self.page_bytes)
+            return data, len(data) < self.page_bytes
+        resp = self._session.get(
+            location,
+            headers={"Range": f"bytes={offset}-{offset + self.page_bytes - 1}"},
+            timeout=self.timeout,
+            verify=self.verify_tls,
+        )
+        if resp.status_code == 404:
+            return None, True
+        if resp.status_code == 416:
+            # Nothing past the offset yet.
+            return b"", True
+        resp.raise_for_status()
+        if resp.status_code == 206:
+            data = resp.content
+            return data, len(data) < self.page_bytes
+        # The server ignored Range and sent the whole file.
+        self._body = (location, resp.content)
+        return self._page(resp.content, offset)
+
+    def _page(self, body: bytes, offset: int) -> Tuple[bytes, bool]:
+        data = body[offset : offset + self.page_bytes]
+        return data, offset + len(data) >= len(body)
+
+    def _exists(self, location: str) -> bool:
+        if not location.lower().startswith(("http://", "https://")):
+            return os.path.exists(location)
+        resp = self._session.get(
+            location, headers={"Range": "bytes=0-0"}, timeout=self.timeout, verify=self.verify_tls, stream=True
+        )
+        resp.close()
+        if resp.status_code == 404:
+            return False
+        if resp.status_code == 416:
+            # An empty log.
+            return True
+        resp.raise_for_status()
+        return True
+
+    def _later_log(self, day: date, today: date) -> Optional[date]:
+        # First day after `day`, up to today, whose log can be read.
+        while day < today:
+            day += timedelta(days=1)
+            if self._exists(self._location(day)):
+                return day
+        return None
+
+    def _records(self, data: bytes) -> List[Dict[str, Any]]:
+        records = []
+        for line in data.decode("utf-8", errors="ignore").splitlines():
+            rec = parse_printlog_line(line)
+            if rec:
+                records.append(rec)
+        return records
+
+    def run_once(self) -> Dict[str, Any]:
+        with self._run_lock:
+            self._update(
+                running=True,
+                started_at=datetime.now().isoformat(),
+                finished_at=None,
+                bytes=0,
+                lines=0,
+                inserted=0,
+                error=None,
+            )
+            try:
+                self._pull()
+            except Exception as e:
+                self._update(error=str(e))
+            finally:
+                self._body = None
+                self._update(running=False, finished_at=datetime.now().isoformat())
+            return self.status()
+
+    def _pull(self) -> None:
+        state = get_sync_state(self.db_path, SYNC_STATE_NAME)
+        today = date.today()
+        try:
+            day = date.fromisoformat(state["day"])
+            offset = int(state.get("offset") or 0)
+        except (KeyError, TypeError, ValueError):
+            day, offset = today - timedelta(days=self.start_days), 0
+        while True:
+            data, at_end = self._read(self._location(day), offset)
+            following = day + timedelta(days=1)
+            if data is None and day < today:
+                later = self._later_log(day, today)
+                if later is None:
+                    raise RuntimeError(
+                        f"print log for {day.isoformat()} not found and no later log is reachable; "
+                        "keeping the position until it is"
+                    )
+                # Days without a log had no jobs: go straight to the next one.
+                following = later
+            data = data or b""
+            if not at_end and b"\n" in data:
+                # Stop at the last complete line; the rest is read next page.
+                data = data[: data.rindex(b"\n") + 1]
+            elif day >= today and not data.endswith(b"\n"):
+                # Today's log may still be half-way through writing a line.
+                data = data[: data.rindex(b"\n") + 1] if b"\n" in data else b""
+            next_day = at_end and day < today
+            if not data and not next_day:
+                # Nothing new: leave the database (and its caches) alone.
+                break
+            offset += len(data)
+            records = self._records(data)
+            state = {
+                **state,
+                "day": following.isoformat() if next_day else day.isoformat(),
+                "offset": 0 if next_day else offset,
+                "last_page_at": datetime.now().isoformat(),
+            }
+            stamps = [r["timestamp"].isoformat() for r in records if isinstance(r.get("timestamp"), datetime)]
+            if stamps and max(stamps) > (state.get("last_job_at") or ""):
+                state["last_job_at"] = max(stamps)
+            inserted = self.write(upsert_jobs, self.db_path, records, SYNC_STATE_NAME, state)
+            with self._lock:
+                self._status["bytes"] += len(data)
+                self._status["lines"] += len(records)
+                self._status["inserted"] += inserted
+            if next_day:
+                day, offset = following, 0
+                self._body = None
+            elif at_end:
+                break
+
+    def _update(self, **fields: Any) -> None:
+        with self._lock:
+            self._status.update(fields)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            status = dict(self._status)
+        status["watermark"] = get_sync_state(self.db_path, SYNC_STATE_NAME)
+        return status
+
+    def trigger(self) -> bool:
+        # Starts a pull now; False when one is already running or queued.
+        with self._lock:
+            if self._status["running"]:
+                return False
+            self._status["running"] = True
+        if self._thread is None:
+            threading.Thread(target=self.run_once, name="papercut-job-log-once", daemon=True).start()
+        else:
+            self._wake.set()
+        return True
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                pass
+            self._wake.wait(timeout=max(10.0, self.interval_sec))
+            self._wake.clear()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="papercut-job-log", daemon=True)
+        self._thread.start()
@@ -0,0 +1,271 @@
+import argparse
+import random
+import threading
+import time
+import xmlrpc.client
+from socketserver import ThreadingMixIn
+from typing import Any, Dict, List, Optional
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+
+# Local stand-in for the PaperCut MF XML-RPC web services API, covering the
+# api.* methods this project calls. For integration and load tests only:
+#
+#   python -m app.papercut_stub --port 9191 --users 20000 --latency-ms 20
+#
+# then point papercut_xmlrpc_url at http://127.0.0.1:9191/rpc/api/xmlrpc
+# (any auth token unless --token is given).
+
+RPC_PATH = "/rpc/api/xmlrpc"
+DEPARTMENTS = ("Financeiro", "RH", "TI", "Comercial", "Juridico", "Operacoes", "Diretoria")
+OFFICES = ("Matriz", "Filial Norte", "Filial Sul")
+
+
+class _Handler(SimpleXMLRPCRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive, as with PaperCut.
+    protocol_version = "HTTP/1.1"
+    rpc_paths = (RPC_PATH,)
+
+    def do_POST(self):
+        server = self.server
+        if server.drop_rate and server.rng_random() < server.drop_rate:
+            # Simulates an idle keep-alive socket closed by the server.
+            self.rfile.read(int(self.headers.get("content-length") or 0))
+            with server.stats_lock:
+                server.dropped += 1
+            self.close_connection = True
+            return
+        super().do_POST()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PaperCutStubServer(ThreadingMixIn, SimpleXMLRPCServer):
+    # Users are generated deterministically from their index ("user00042"),
+    # so datasets of any size cost no memory until a user's balance or
+    # properties are changed. `latency_ms` is added to every HTTP request
+    # (a multicall pays it once), `error_rate` turns that fraction of calls
+    # into an injected Fault and `drop_rate` closes that fraction of
+    # connections without answering.
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 9191,
+        users: int = 1000,
+        latency_ms: float = 0.0,
+        error_rate: float = 0.0,
+        drop_rate: float = 0.0,
+        multicall: bool = True,
+        token: Optional[str] = None,
+        seed: int = 1,
+    ) -> None:
+        super().__init__((host, port), requestHandler=_Handler, allow_none=True, logRequests=False)
+        self.users = max(0, int(users))
+        self.latency_sec = max(0.0, float(latency_ms)) / 1000.0
+        self.error_rate = float(error_rate)
+        self.drop_rate = float(drop_rate)
+        self.token = token
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._overrides: Dict[str, Dict[str, Any]] = {}
+        self.stats_lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.calls = 0
+        self.faults = 0
+        self.dropped = 0
+        self._thread: Optional[threading.Thread] = None
+
+        for name in (
+            "isUserExists",
+            "getTotalUsers",
+            "listUserAccounts",
+            "getUserProperty",
+            "getUserProperties",
+            "setUserProperty",
+            "getUserAccountBalance",
+            "adjustUserAccountBalance",
+        ):
+            self.register_function(getattr(self, f"_api_{name}"), f"api.{name}")
+        if multicall:
+            self.register_multicall_functions()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{RPC_PATH}"
+
+    def rng_random(self) -> float:
+        with self._rng_lock:
+            return self._rng.random()
+
+    # --- server hooks ---
+
+    def process_request(self, request, client_address):
+        with self.stats_lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def _marshaled_dispatch(self, data, dispatch_method=None, path=None):
+        with self.stats_lock:
+            self.requests += 1
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+        return super()._marshaled_dispatch(data, dispatch_method, path)
+
+    def _dispatch(self, method, params):
+        # Also called once per entry of a system.multicall.
+        if method.startswith("api."):
+            with self.stats_lock:
+                self.calls += 1
+            if self.error_rate and self.rng_random() < self.error_rate:
+                self._fault(-1, "injected error")
+            if self.token is not None and (not params or params[0] != self.token):
+                self._fault(-32500, "Invalid authentication token")
+        try:
+            return super()._dispatch(method, params)
+        except xmlrpc.client.Fault:
+            with self.stats_lock:
+                self.faults += 1
+            raise
+
+    def _fault(self, code: int, message: str) -> None:
+        with self.stats_lock:
+            self.faults += 1
+        raise xmlrpc.client.Fault(code, message)
+
+    # --- dataset ---
+
+    def _index(self, user: str) -> Optional[int]:
+        if not user.startswith("user") or not user[4:].isdigit():
+            return None
+        index = int(user[4:])
+        return index if 0 <= index < self.users else None
+
+    def _user(self, user: str) -> Dict[str, Any]:
+        index = self._index(str(user))
+        if index is None:
+            raise xmlrpc.client.Fault(-32500, f"User does not exist: {user}")
+        override = self._overrides.get(user)
+        if override is not None:
+            return override
+        return {
+            "username": user,
+            "full-name": f"Usuario {index:05d}",
+            "email": f"{user}@example.com",
+            "department": DEPARTMENTS[index % len(DEPARTMENTS)],
+            "office": OFFICES[index % len(OFFICES)],
+            "card-number": f"{100000 + index}",
+            "balance": float(index % 50),
+            "restricted": index % 10 == 0,
+        }
+
+    def _editable(self, user: str) -> Dict[str, Any]:
+        data = self._user(user)
+        return self._overrides.setdefault(user, dict(data))
+
+    # --- api.* methods (the first parameter is the auth token) ---
+
+    def _api_isUserExists(self, token: str, user: str) -> bool:
+        return self._index(str(user)) is not None
+
+    def _api_getTotalUsers(self, token: str) -> int:
+        return self.users
+
+    def _api_listUserAccounts(self, token: str, offset: int, limit: int) -> List[str]:
+        start = max(0, int(offset))
+        stop = min(self.users, start + max(0, int(limit)))
+        return [f"user{i:05d}" for i in range(start, stop)]
+
+    def _api_getUserProperty(self, token: str, user: str, prop: str) -> str:
+        data = self._user(user)
+        if prop not in data:
+            raise xmlrpc.client.Fault(-32500, f"Unknown property: {prop}")
+        return str(data[prop]).lower() if isinstance(data[prop], bool) else str(data[prop])
+
+    def _api_getUserProperties(self, token: str, user: str, props: List[str]) -> List[str]:
+        return [self._api_getUserProperty(token, user, p) for p in props]
+
+    def _api_setUserProperty(self, token: str, user: str, prop: str, value: str) -> bool:
+        with self.stats_lock:
+            self._editable(user)[prop] = value
+        return True
+
+    def _api_getUserAccountBalance(self, token: str, user: str, account: str = "") -> float:
+        return float(self._user(user)["balance"])
+
+    def _api_adjustUserAccountBalance(
+        self, token: str, user: str, amount: float, comment: str = "", account: str = ""
+    ) -> bool:
+        with self.stats_lock:
+            data = self._editable(user)
+            data["balance"] = float(data["balance"]) + float(amount)
+        return True
+
+    # --- lifecycle ---
+
+    def start(self) -> "PaperCutStubServer":
+        # Serves in a background thread; returns self for chaining.
+        self._thread = threading.Thread(target=self.serve_forever, name="papercut-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.stats_lock:
+            return {
+                "users": self.users,
+                "connections": self.connections,
+                "requests": self.requests,
+                "calls": self.calls,
+                "faults": self.faults,
+                "dropped": self.dropped,
+            }
+
+    def reset_stats(self) -> None:
+        with self.stats_lock:
+            self.connections = self.requests = self.calls = self.faults = self.dropped = 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for the PaperCut XML-RPC API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9191)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added to every HTTP request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with a Fault")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of requests whose connection is closed")
+    parser.add_argument("--no-multicall", action="store_true")
+    parser.add_argument("--token", default=None, help="accept only this auth token")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    server = PaperCutStubServer(
+        args.host,
+        args.port,
+        users=args.users,
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        drop_rate=args.drop_rate,
+        multicall=not args.no_multicall,
+        token=args.token,
+        seed=args.seed,
+    )
+    print(f"PaperCut stub on {server.url} ({args.users} users)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import threading
+import xmlrpc.client
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.papercut_client import PaperCutClient
+from app.storage import get_sync_state, sync_user_departments
+
+
+SYNC_STATE_NAME = "papercut_users"
+# Read in one getUserProperties call; the first non-empty one is used.
+DEPARTMENT_PROPERTIES = ("department", "office")
+
+
+class PaperCutUserSync:
+    # Copies each PaperCut user's department (or office) into
+    # user_departments with source='papercut'. Users are paged through with
+    # listUserAccounts, `page_size` at a time, and their properties fetched
+    # with multicall batches. Per page, only rows that differ from the stored
+    # ones are written, manual entries are left alone, and the watermark (last
+    # username done, plus its offset as a hint) is saved in the same
+    # transaction, so an interrupted sweep resumes where it stopped; pages
+    # that change nothing write nothing. listUserAccounts is sorted by
+    # username, so users added or removed meanwhile shift the offset but not
+    # the position after the last username. A sweep runs every `interval_sec`.
+    def __init__(
+        self,
+        client: PaperCutClient,
+        db_path: str,
+        write: Callable[..., Any],
+        page_size: int = 500,
+        interval_sec: float = 3600,
+    ) -> None:
+        self.client = client
+        self.db_path = db_path
+        self.write = write
+        self.page_size = max(1, int(page_size))
+        self.interval_sec = float(interval_sec)
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._status: Dict[str, Any] = {
+            "running": False,
+            "started_at": None,
+            "finished_at": None,
+            "users": 0,
+            "changed": 0,
+            "error": None,
+        }
+
+    def _departments(self, users: List[str]) -> List[Tuple[str, str]]:
+        values = self.client.map("getUserProperties", [(u, list(DEPARTMENT_PROPERTIES)) for u in users])
+        rows = []
+        for user, value in zip(users, values):
+            if isinstance(value, xmlrpc.client.Fault) or not isinstance(value, list):
+                continue
+            department = next((str(v).strip() for v in value if v and str(v).strip()), "")
+            rows.append((user, department))
+        return rows
+
+    def _page(self, offset: int, last_user: str) -> Tuple[List[str], int, bool]:
+        # -> (users after last_user, offset after the listing, end reached).
+        # When resuming, the listing starts one user early so that finding
+        # last_user in it confirms nothing before the offset was removed.
+        while True:
+            start = offset - 1 if last_user and offset > 0 else offset
+            limit = self.page_size + (offset - start)
+            users = [str(u) for u in (self.client.call("listUserAccounts", start, limit) or [])]
+            end = start + len(users), len(users) < limit
+            if not last_user:
+                return (users, *end)
+            if last_user in users:
+                return (users[users.index(last_user) + 1 :], *end)
+            if start > 0 and (not users or users[0] > last_user):
+                # Users before the offset were removed: back up to last_user.
+                offset = max(0, start - self.page_size)
+                continue
+            return ([u for u in users if u > last_user], *end)
+
+    def run_once(self) -> Dict[str, Any]:
+        with self._run_lock:
+            self._update(running=True, started_at=datetime.now().isoformat(), finished_at=None, users=0, changed=0, error=None)
+            try:
+                state = get_sync_state(self.db_path, SYNC_STATE_NAME)
+                offset = int(state.get("offset") or 0)
+                last_user = str(state.get("last_user") or "")
+                total = int(state.get("users_done") or 0) if last_user else 0
+                while True:
+                    users, offset, done = self._page(offset, last_user)
+                    rows = self._departments(users) if users else []
+                    total += len(users)
+                    if users:
+                        last_user = users[-1]
+                    state = {
+                        **state,
+                        "offset": 0 if done else offset,
+                        "last_user": "" if done else last_user,
+                        "users_done": 0 if done else total,
+                        "last_page_at": datetime.now().isoformat(),
+                    }
+                    if done:
+                        state["last_completed_at"] = state["last_page_at"]
+                        state["last_total_users"] = total
+                    # Unchanged pages are not saved; the end of a sweep is.
+                    changed = self.write(
+                        sync_user_departments,
+                        self.db_path,
+                        rows,
+                        "papercut",
+                        SYNC_STATE_NAME,
+                        state,
+                        save_unchanged_state=done,
+                    )
+                    with self._lock:
+                        self._status["users"] += len(users)
+                        self._status["changed"] += changed
+                    if done:
+                        break
+            except Exception as e:
+                self._update(error=str(e))
+            finally:
+                self._update(running=False, finished_at=datetime.now().isoformat())
+            return self.status()
+
+    def _update(self, **fields: Any) -> None:
+        with self._lock:
+            self._status.update(fields)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            status = dict(self._status)
+        status["watermark"] = get_sync_state(self.db_path, SYNC_STATE_NAME)
+        return status
+
+    def trigger(self) -> bool:
+        # Starts a sweep now; False when one is already running or queued.
+        with self._lock:
+            if self._status["running"]:
+                return False
+            # Marked here, not by run_once, so a second trigger in between
+            # does not queue another sweep.
+            self._status["running"] = True
+        if self._thread is None:
+            # Periodic sync disabled: run this sweep on its own.
+            threading.Thread(target=self.run_once, name="papercut-sync-once", daemon=True).start()
+        else:
+            self._wake.set()
+        return True
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                pass
+            self._wake.wait(timeout=max(60.0, self.interval_sec))
+            self._wake.clear()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="papercut-sync", daemon=True)
+        self._thread.start()
@@ -0,0 +1,113 @@
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+AGENT_FIELDS = ("host", "printer_name", "printer_model", "serial", "location", "ip", "version")
+
+
+class AgentPresence:
+    # In-memory copy of client_agents. Heartbeats that only prove the agent
+    # is alive update `updated_at` here and are collected by take_dirty() to
+    # be written to the database in one batch; heartbeats carrying new
+    # metadata (or from an unknown agent) are reported back to the caller to
+    # be written at once.
+    #
+    # Poll statistics sent with the heartbeat (interval, miss rate, CPU) are
+    # kept in memory only, under "stats".
+    #
+    # The table is reloaded lazily after any other write to client_agents
+    # (admin edits, /api/client-jobs registration), keeping the newer of the
+    # in-memory and stored `updated_at`.
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._agents: Dict[str, Dict[str, Any]] = {}
+        self._dirty: Dict[str, str] = {}
+        self._loaded = False
+        self._stale = True
+        self.version = 0
+        self.heartbeats = 0
+        self.coalesced = 0
+        self.flushed = 0
+
+    def mark_stale(self) -> None:
+        with self._lock:
+            self._stale = True
+
+    @property
+    def stale(self) -> bool:
+        return self._stale
+
+    def load(self, rows: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            agents = {}
+            for row in rows:
+                row = dict(row)
+                current = self._agents.get(row["agent_id"])
+                if current is not None and str(current.get("updated_at") or "") > str(row.get("updated_at") or ""):
+                    row["updated_at"] = current["updated_at"]
+                if current is not None and "stats" in current:
+                    row["stats"] = current["stats"]
+                agents[row["agent_id"]] = row
+            # Unflushed heartbeats of agents deleted meanwhile are dropped.
+            self._dirty = {k: v for k, v in self._dirty.items() if k in agents}
+            self._agents = agents
+            self._loaded = True
+            self._stale = False
+            self.version += 1
+
+    def heartbeat(self, agent_id: str, fields: Dict[str, str], stats: Optional[Dict[str, Any]] = None) -> bool:
+        # Returns True when the caller must persist the heartbeat now.
+        now = datetime.now().isoformat()
+        with self._lock:
+            self.heartbeats += 1
+            self.version += 1
+            current = self._agents.get(agent_id)
+            if current is None or any(str(current.get(f) or "") != fields.get(f, "") for f in AGENT_FIELDS):
+                self._agents[agent_id] = {"agent_id": agent_id, **{f: fields.get(f, "") for f in AGENT_FIELDS}, "updated_at": now}
+                if stats:
+                    self._agents[agent_id]["stats"] = stats
+                self._dirty.pop(agent_id, None)
+                return True
+            current["updated_at"] = now
+            if stats:
+                current["stats"] = stats
+            self._dirty[agent_id] = now
+            self.coalesced += 1
+            return False
+
+    def take_dirty(self) -> List[Tuple[str, str]]:
+        # (updated_at, agent_id) pairs for storage.touch_client_agents.
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        return [(ts, agent_id) for agent_id, ts in dirty.items()]
+
+    def restore_dirty(self, pairs: List[Tuple[str, str]]) -> None:
+        # Flush failed: keep the timestamps for the next attempt.
+        with self._lock:
+            for ts, agent_id in pairs:
+                if agent_id in self._agents and self._dirty.get(agent_id, "") < ts:
+                    self._dirty[agent_id] = ts
+
+    def note_flushed(self, count: int) -> None:
+        with self._lock:
+            self.flushed += count
+
+    def list(self, allow_stale: bool = False) -> Optional[List[Dict[str, Any]]]:
+        # None until loaded (or after mark_stale), so the caller reloads first.
+        with self._lock:
+            if not self._loaded or (self._stale and not allow_stale):
+                return None
+            rows = [dict(a) for a in self._agents.values()]
+        rows.sort(key=lambda r: str(r.get("updated_at") or ""), reverse=True)
+        return rows
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "agents": len(self._agents),
+                "pending_flush": len(self._dirty),
+                "heartbeats": self.heartbeats,
+                "coalesced": self.coalesced,
+                "flushed": self.flushed,
+            }
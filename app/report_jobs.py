@@ -0,0 +1,345 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+from app.reports import REPORT_FORMATS, render_to_file, report_rows
+from app.storage import table_versions
+
+
+REPORT_KINDS = ("jobs", "counters")
+
+# Tables each kind of report reads (directly or through its fallbacks).
+_COUNTER_TABLES = ("printer_counters", "printer_sources", "client_agents", "report_exclusions")
+_JOB_TABLES = (
+    "jobs",
+    "report_exclusions",
+    "departments",
+    "printer_departments",
+    "printer_models",
+    "user_departments",
+)
+
+
+class ReportQueueFull(Exception):
+    pass
+
+
+def normalize_report_params(payload: Dict[str, Any]) -> Dict[str, Any]:
+    # Canonical form of a report request; raises ValueError on bad input.
+    kind = str(payload.get("kind") or "jobs").strip().lower()
+    fmt = str(payload.get("format") or "pdf").strip().lower()
+    if kind not in REPORT_KINDS:
+        raise ValueError("kind must be jobs or counters")
+    if fmt not in REPORT_FORMATS:
+        raise ValueError("format must be csv, xlsx, or pdf")
+    default_group = "printer" if kind == "counters" else "user"
+    group = str(payload.get("group_by") or default_group).strip().lower()
+    if kind == "jobs" and group == "job" and fmt == "pdf":
+        raise ValueError("group_by=job supports csv or xlsx")
+    params = {
+        "kind": kind,
+        "format": fmt,
+        "group_by": group,
+        "since": payload.get("since") or None,
+        "until": payload.get("until") or None,
+    }
+    if kind == "counters":
+        params["metric"] = str(payload.get("metric") or "print").strip().lower()
+    return params
+
+
+class ReportJobManager:
+    # Renders reports on a small worker pool and keeps the finished files in
+    # `artifact_dir`. Artifacts are named after a hash of the parameters and
+    # the persistent versions of the tables the report reads, so a repeated
+    # request is served from disk (also after a restart) until one of those
+    # tables changes; heartbeats or syncs touching other tables do not count.
+    # Old files are removed by age (ttl_sec) and by total size (max_bytes),
+    # oldest first.
+    #
+    # Queries run on the worker threads; PDF/XLSX drawing (pure Python, holds
+    # the GIL) runs in a pool of `processes` renderer processes so it does not
+    # slow down the API threads. processes=0 renders in the worker thread.
+    def __init__(
+        self,
+        db_path: str,
+        artifact_dir: str,
+        max_workers: int = 2,
+        processes: int = 2,
+        ttl_sec: float = 3600,
+        max_bytes: int = 512 * 1024 * 1024,
+        max_queue: int = 32,
+        max_jobs: int = 500,
+    ) -> None:
+        self.db_path = db_path
+        self.artifact_dir = artifact_dir
+        self.ttl_sec = float(ttl_sec)
+        self.max_bytes = int(max_bytes)
+        self.max_queue = max(1, int(max_queue))
+        self.max_jobs = max(1, int(max_jobs))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="report")
+        self.processes = max(0, int(processes))
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._process_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, Tuple[str, Future]] = {}
+        self.cache_hits = 0
+        self.rendered = 0
+        self.evicted = 0
+        os.makedirs(artifact_dir, exist_ok=True)
+        self.evict()
+
+    @staticmethod
+    def _tables(params: Dict[str, Any]) -> Tuple[str, ...]:
+        if params["kind"] == "counters":
+            return _COUNTER_TABLES
+        if params["group_by"] in ("printer", "model"):
+            # Printer/model reports fall back to, and printer ones show, counters.
+            return _JOB_TABLES + _COUNTER_TABLES
+        return _JOB_TABLES
+
+    def _key(self, params: Dict[str, Any]) -> str:
+        versions = table_versions(self.db_path, self._tables(params))
+        raw = json.dumps(params, sort_keys=True) + "|" + json.dumps(versions, sort_keys=True)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _artifact_path(self, key: str, fmt: str) -> str:
+        return os.path.join(self.artifact_dir, f"{key}.{fmt}")
+
+    def _cached_artifact(self, key: str, fmt: str) -> Optional[str]:
+        path = self._artifact_path(key, fmt)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if time.time() - st.st_mtime > self.ttl_sec:
+            return None
+        return path
+
+    def _render(self, key: str, params: Dict[str, Any]) -> str:
+        path = self._artifact_path(key, params["format"])
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            payload = report_rows(self.db_path, params)
+            if self.processes and params["format"] != "csv":
+                self._render_in_process(tmp, params, payload)
+            else:
+                render_to_file(self.db_path, tmp, params, payload)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self.rendered += 1
+        self.evict()
+        return path
+
+    def _render_in_process(self, tmp: str, params: Dict[str, Any], payload: Any) -> None:
+        with self._process_lock:
+            if self._process_pool is None:
+                # spawn: forking a process that runs uvicorn and other threads
+                # is unsafe, and it is the only method on Windows anyway.
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                )
+            pool = self._process_pool
+        try:
+            pool.submit(render_to_file, self.db_path, tmp, params, payload).result()
+        except BrokenProcessPool:
+            # A renderer died (killed, out of memory); start a fresh pool next time.
+            with self._process_lock:
+                if self._process_pool is pool:
+                    self._process_pool = None
+            pool.shutdown(wait=False)
+            raise RuntimeError("report renderer process exited unexpectedly")
+
+    def _run(self, key: str, params: Dict[str, Any]) -> str:
+        # Updates whichever job record currently follows `key`; submit() may
+        # have replaced one evicted by max_jobs while this render ran.
+        self._update(key, status="running", started_at=time.time())
+        try:
+            path = self._render(key, params)
+            self._update(key, status="done", path=path, size=os.path.getsize(path), finished_at=time.time())
+            return path
+        except Exception as e:
+            self._update(key, status="error", error=str(e), finished_at=time.time())
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _update(self, key: str, **fields: Any) -> None:
+        with self._lock:
+            inflight = self._inflight.get(key)
+            job = self._jobs.get(inflight[0]) if inflight is not None else None
+            if job is not None:
+                job.update(fields)
+
+    def _new_job(self, params: Dict[str, Any], key: str, **fields: Any) -> Dict[str, Any]:
+        job = {
+            "id": uuid.uuid4().hex,
+            "key": key,
+            "params": params,
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "path": None,
+            "size": None,
+            "cached": False,
+        }
+        job.update(fields)
+        self._jobs[job["id"]] = job
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+        return job
+
+    def submit(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        # Returns a public job snapshot. Identical requests share one render:
+        # a finished artifact is returned as "done" immediately and an
+        # in-flight one is joined instead of queued twice.
+        key = self._key(params)
+        path = self._cached_artifact(key, params["format"])
+        with self._lock:
+            if path is not None:
+                self.cache_hits += 1
+                job = self._new_job(
+                    params, key, status="done", path=path, size=os.path.getsize(path), cached=True, finished_at=time.time()
+                )
+                return self._public(job)
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                job_id, future = inflight
+                job = self._jobs.get(job_id)
+                if job is None:
+                    # Its record was evicted by max_jobs; follow the same
+                    # render with a new one rather than rendering twice.
+                    job = self._new_job(params, key, status="running" if future.running() else "queued")
+                    self._inflight[key] = (job["id"], future)
+                return self._public(job)
+            pending = sum(1 for j in self._jobs.values() if j["status"] == "queued")
+            if pending >= self.max_queue:
+                raise ReportQueueFull("report queue is full, try again later")
+            job = self._new_job(params, key)
+            future = self._executor.submit(self._run, key, params)
+            self._inflight[key] = (job["id"], future)
+            return self._public(job)
+
+    def get_or_render(self, params: Dict[str, Any], timeout: Optional[float] = None) -> str:
+        # Synchronous path for the GET export URLs: same cache and worker
+        # pool, but the caller waits for the file.
+        key = self._key(params)
+        path = self._cached_artifact(key, params["format"])
+        if path is not None:
+            with self._lock:
+                self.cache_hits += 1
+            return path
+        with self._lock:
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                job = self._new_job(params, key)
+                future = self._executor.submit(self._run, key, params)
+                self._inflight[key] = (job["id"], future)
+            else:
+                future = inflight[1]
+        return future.result(timeout=timeout)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._public(job) if job is not None else None
+
+    def artifact(self, job_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "done" or not job["path"]:
+                return None
+            path, params = job["path"], job["params"]
+        if not os.path.exists(path):
+            return None
+        return path, params
+
+    def evict(self) -> None:
+        now = time.time()
+        files = []
+        try:
+            names = os.listdir(self.artifact_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.artifact_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if name.endswith(".tmp"):
+                # Leftover from an interrupted render.
+                if now - st.st_mtime > self.ttl_sec:
+                    self._remove(path)
+                continue
+            if now - st.st_mtime > self.ttl_sec:
+                self._remove(path)
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        total = sum(f[1] for f in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                total -= size
+
+    def _remove(self, path: str) -> bool:
+        try:
+            os.remove(path)
+        except OSError:
+            # Still open by a download on Windows; retried on the next pass.
+            return False
+        with self._lock:
+            self.evicted += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses: Dict[str, int] = {}
+            for job in self._jobs.values():
+                statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+            return {
+                "jobs": statuses,
+                "cache_hits": self.cache_hits,
+                "rendered": self.rendered,
+                "evicted": self.evicted,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+        with self._process_lock:
+            pool, self._process_pool = self._process_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    @staticmethod
+    def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": job["id"],
+            "status": job["status"],
+            "params": job["params"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "error": job["error"],
+            "size": job["size"],
+            "cached": job["cached"],
+        }
@@ -0,0 +1,445 @@
+﻿from datetime import datetime, timedelta
+from typing import IO, Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.exports import XLSX_MEDIA_TYPE, csv_stream, write_xlsx
+from app.storage import iter_jobs, query_counter_report, query_job_printer_readings, query_report
+
+
+REPORT_FORMATS = ("csv", "xlsx", "pdf")
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "xlsx": XLSX_MEDIA_TYPE,
+    "pdf": "application/pdf",
+}
+
+REPORT_GROUP_LABELS = {
+    "user": "Usuário",
+    "department": "Setor",
+    "printer": "Impressora",
+    "model": "Modelo",
+    "job": "Job",
+}
+
+COUNTER_GROUP_LABELS = {
+    "printer": "Impressora",
+    "brand": "Marca",
+    "model": "Modelo",
+    "serial": "Serial",
+}
+
+METRIC_LABELS = {
+    "print": "Impressões",
+    "copy": "Cópias",
+    "scan": "Scans",
+}
+
+REPORT_HEADERS = ["group", "jobs", "pages"]
+PRINTER_DETAIL_HEADERS = [
+    "impressora",
+    "serial",
+    "leitura_anterior_data",
+    "leitura_anterior",
+    "leitura_final_data",
+    "leitura_final",
+    "diferenca",
+]
+COUNTER_HEADERS = ["grupo", "impressora", "marca", "modelo", "serial", "local", "leitura_inicial", "leitura_final", "diferenca"]
+JOB_DETAIL_HEADERS = ["timestamp", "user", "printer", "document", "pages", "copies", "source", "client_host"]
+
+REPORT_WIDTHS = [40, 12, 12]
+PRINTER_DETAIL_WIDTHS = [30, 22, 20, 16, 18, 16, 14]
+COUNTER_WIDTHS = [22, 22, 14, 20, 18, 18, 16, 16, 14]
+JOB_DETAIL_WIDTHS = [22, 18, 26, 40, 10, 10, 10, 18]
+
+# Table = (headers, rows as value lists, xlsx column widths)
+Table = Tuple[List[str], Iterable[Sequence[Any]], List[float]]
+
+
+def counter_report_values(r: Dict[str, Any]) -> list:
+    return [
+        r.get("group_name", ""),
+        r.get("printer_name", ""),
+        r.get("brand", ""),
+        r.get("model", ""),
+        r.get("serial", ""),
+        r.get("location", ""),
+        r.get("reading_initial", 0),
+        r.get("reading_final", 0),
+        r.get("difference", 0),
+    ]
+
+
+def printer_detail_values(r: Dict[str, Any]) -> list:
+    return [
+        r.get("impressora", ""),
+        r.get("serial", ""),
+        r.get("leitura_anterior_data", ""),
+        r.get("leitura_anterior", 0),
+        r.get("leitura_final_data", ""),
+        r.get("leitura_final", 0),
+        r.get("diferenca", 0),
+    ]
+
+
+def group_values(r: Dict[str, Any]) -> list:
+    return [r.get("group_name", ""), r.get("jobs", 0), r.get("pages", 0)]
+
+
+def job_detail_values(r: Dict[str, Any]) -> list:
+    return [
+        r.get("timestamp", ""),
+        r.get("user", ""),
+        r.get("printer", ""),
+        r.get("document", ""),
+        r.get("pages") or 0,
+        r.get("copies") or 1,
+        r.get("source", ""),
+        r.get("client_host", ""),
+    ]
+
+
+def report_data(db_path: str, since: Optional[str], until: Optional[str], group: str):
+    rows = query_report(db_path, since=since, until=until, group_by=group)
+    # Fallback: if there are no job logs, use printer counter deltas.
+    if not rows and group in ("printer", "model"):
+        by = "printer" if group == "printer" else "model"
+        r_print = query_counter_report(db_path, since=since, until=until, group_by=by, metric="print")
+        r_copy = query_counter_report(db_path, since=since, until=until, group_by=by, metric="copy")
+        merged = {}
+        for r in r_print:
+            key = str(r.get("group_name", ""))
+            merged[key] = {"group_name": key, "jobs": int(r.get("jobs", 0) or 0), "pages": int(r.get("difference", 0) or 0)}
+        for r in r_copy:
+            key = str(r.get("group_name", ""))
+            if key not in merged:
+                merged[key] = {"group_name": key, "jobs": int(r.get("jobs", 0) or 0), "pages": 0}
+            merged[key]["pages"] += int(r.get("difference", 0) or 0)
+            merged[key]["jobs"] = max(int(merged[key]["jobs"]), int(r.get("jobs", 0) or 0))
+        rows = sorted(merged.values(), key=lambda x: int(x.get("pages", 0)), reverse=True)
+
+    # Relatório detalhado por impressora com leitura anterior/final e diferença.
+    detailed_printer_rows = None
+    if group == "printer":
+        r_print = query_counter_report(db_path, since=since, until=until, group_by="printer", metric="print")
+        r_copy = query_counter_report(db_path, since=since, until=until, group_by="printer", metric="copy")
+        r_jobs = query_job_printer_readings(db_path, since=since, until=until)
+        merged = {}
+        for src in (r_print, r_copy):
+            for r in src:
+                key = str(r.get("printer_name") or r.get("group_name") or "").strip()
+                if not key:
+                    continue
+                item = merged.setdefault(
+                    key,
+                    {
+                        "impressora": key,
+                        "serial": str(r.get("serial") or "").strip() or "Não definido",
+                        "leitura_anterior": 0,
+                        "leitura_final": 0,
+                        "diferenca": 0,
+                    },
+                )
+                item["leitura_anterior"] += int(r.get("reading_initial", 0) or 0)
+                item["leitura_final"] += int(r.get("reading_final", 0) or 0)
+                item["diferenca"] += int(r.get("difference", 0) or 0)
+                if item["serial"] == "Não definido":
+                    item["serial"] = str(r.get("serial") or "").strip() or "Não definido"
+
+        # Fallback para impressoras de agent (ou outras) sem contador IP:
+        # usa acumulado de jobs para leitura anterior/final.
+        for r in r_jobs:
+            key = str(r.get("printer_name") or "").strip()
+            if not key or key in merged:
+                continue
+            merged[key] = {
+                "impressora": key,
+                "serial": str(r.get("serial") or "").strip() or "Não definido",
+                "leitura_anterior": int(r.get("reading_initial", 0) or 0),
+                "leitura_final": int(r.get("reading_final", 0) or 0),
+                "diferenca": int(r.get("difference", 0) or 0),
+            }
+
+        leitura_anterior_data = "-"
+        if since:
+            try:
+                leitura_anterior_data = (datetime.fromisoformat(str(since)[:10]) - timedelta(days=1)).strftime("%Y-%m-%d")
+            except Exception:
+                leitura_anterior_data = str(since)
+        leitura_final_data = str(until or "-")
+
+        detailed_printer_rows = []
+        for _, v in sorted(merged.items(), key=lambda kv: int(kv[1].get("diferenca", 0)), reverse=True):
+            detailed_printer_rows.append(
+                {
+                    "impressora": v["impressora"],
+                    "serial": v["serial"],
+                    "leitura_anterior_data": leitura_anterior_data,
+                    "leitura_anterior": v["leitura_anterior"],
+                    "leitura_final_data": leitura_final_data,
+                    "leitura_final": v["leitura_final"],
+                    "diferenca": v["diferenca"],
+                }
+            )
+
+    return rows, detailed_printer_rows
+
+
+def report_table(rows: List[Dict[str, Any]], detailed_printer_rows: Optional[List[Dict[str, Any]]]) -> Table:
+    if detailed_printer_rows is not None:
+        return (
+            PRINTER_DETAIL_HEADERS,
+            (printer_detail_values(r) for r in detailed_printer_rows),
+            PRINTER_DETAIL_WIDTHS,
+        )
+    return REPORT_HEADERS, (group_values(r) for r in rows), REPORT_WIDTHS
+
+
+def counter_report_table(rows: List[Dict[str, Any]]) -> Table:
+    return COUNTER_HEADERS, (counter_report_values(r) for r in rows), COUNTER_WIDTHS
+
+
+def job_detail_table(db_path: str, since: Optional[str], until: Optional[str]) -> Table:
+    # One line per job. Rows come from iter_jobs (keyset pages), never from a
+    # materialized list, so this works for years of history.
+    values = (job_detail_values(r) for r in iter_jobs(db_path, since=since, until=until))
+    return JOB_DETAIL_HEADERS, values, JOB_DETAIL_WIDTHS
+
+
+def write_csv(out: IO[bytes], table: Table) -> None:
+    headers, values, _ = table
+    for chunk in csv_stream(headers, values):
+        out.write(chunk)
+
+
+def write_report_pdf(
+    out: IO[bytes],
+    rows: Iterable[Sequence[Any]],
+    detailed: bool,
+    group: str,
+    since: Optional[str],
+    until: Optional[str],
+) -> None:
+    # rows are value lists: printer_detail_values() when detailed, else group_values().
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.pdfgen import canvas
+
+    page_size = landscape(A4) if detailed else A4
+    c = canvas.Canvas(out, pagesize=page_size)
+    width, height = page_size
+    x = 24 if detailed else 40
+    y = height - 50
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(x, y, "Relatório de Impressão")
+    y -= 20
+    c.setFont("Helvetica", 10)
+    c.drawString(x, y, f"Agrupar por: {REPORT_GROUP_LABELS.get(group, group)}")
+    y -= 20
+    c.drawString(x, y, f"Período: {since or '-'} até {until or '-'}")
+    y -= 30
+    if detailed:
+        col_printer = x
+        col_serial = x + 175
+        col_data_ant = x + 305
+        col_leitura_ant = x + 410
+        col_data_final = x + 520
+        col_leitura_final = x + 635
+        col_dif = x + 770
+        c.setFont("Helvetica-Bold", 8)
+        c.drawString(col_printer, y, "Impressora")
+        c.drawString(col_serial, y, "Serial")
+        c.drawString(col_data_ant, y, "Data ant.")
+        c.drawRightString(col_leitura_ant, y, "Leitura ant.")
+        c.drawString(col_data_final, y, "Data final")
+        c.drawRightString(col_leitura_final, y, "Leitura final")
+        c.drawRightString(col_dif, y, "Diferença")
+        y -= 14
+        c.setFont("Helvetica", 8)
+        for r in rows:
+            if y < 60:
+                c.showPage()
+                y = height - 50
+                c.setFont("Helvetica-Bold", 8)
+                c.drawString(col_printer, y, "Impressora")
+                c.drawString(col_serial, y, "Serial")
+                c.drawString(col_data_ant, y, "Data ant.")
+                c.drawRightString(col_leitura_ant, y, "Leitura ant.")
+                c.drawString(col_data_final, y, "Data final")
+                c.drawRightString(col_leitura_final, y, "Leitura final")
+                c.drawRightString(col_dif, y, "Diferença")
+                y -= 14
+                c.setFont("Helvetica", 8)
+            c.drawString(col_printer, y, str(r[0])[:30])
+            c.drawString(col_serial, y, str(r[1])[:22])
+            c.drawString(col_data_ant, y, str(r[2])[:10])
+            c.drawRightString(col_leitura_ant, y, str(r[3]))
+            c.drawString(col_data_final, y, str(r[4])[:10])
+            c.drawRightString(col_leitura_final, y, str(r[5]))
+            c.drawRightString(col_dif, y, str(r[6]))
+            y -= 12
+    else:
+        c.setFont("Helvetica-Bold", 10)
+        c.drawString(x, y, "Grupo")
+        c.drawString(x + 260, y, "Jobs")
+        c.drawString(x + 340, y, "Páginas")
+        y -= 14
+        c.setFont("Helvetica", 10)
+        for r in rows:
+            if y < 60:
+                c.showPage()
+                y = height - 50
+                c.setFont("Helvetica-Bold", 10)
+                c.drawString(x, y, "Grupo")
+                c.drawString(x + 260, y, "Jobs")
+                c.drawString(x + 340, y, "Páginas")
+                y -= 14
+                c.setFont("Helvetica", 10)
+            c.drawString(x, y, str(r[0])[:40])
+            c.drawRightString(x + 300, y, str(r[1]))
+            c.drawRightString(x + 380, y, str(r[2]))
+            y -= 12
+    c.save()
+
+
+def write_counter_report_pdf(
+    out: IO[bytes],
+    rows: Iterable[Sequence[Any]],
+    group: str,
+    metric: str,
+    since: Optional[str],
+    until: Optional[str],
+) -> None:
+    # rows are counter_report_values() lists.
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(out, pagesize=landscape(A4))
+    width, height = landscape(A4)
+    x = 24
+    y = height - 50
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(x, y, "Relatório de Contadores")
+    y -= 20
+    c.setFont("Helvetica", 10)
+    c.drawString(x, y, f"Agrupar por: {COUNTER_GROUP_LABELS.get(group, group)}")
+    y -= 20
+    c.drawString(x, y, f"Métrica: {METRIC_LABELS.get(metric, metric)}")
+    y -= 20
+    c.drawString(x, y, f"Período: {since or '-'} até {until or '-'}")
+    y -= 30
+    c.setFont("Helvetica-Bold", 8)
+    c.drawString(x, y, "Grupo")
+    c.drawString(x + 110, y, "Impressora")
+    c.drawString(x + 220, y, "Marca")
+    c.drawString(x + 290, y, "Modelo")
+    c.drawString(x + 390, y, "Serial")
+    c.drawString(x + 490, y, "Local")
+    c.drawRightString(x + 600, y, "Inicial")
+    c.drawRightString(x + 680, y, "Final")
+    c.drawRightString(x + 760, y, "Diferença")
+    y -= 14
+    c.setFont("Helvetica", 8)
+    for r in rows:
+        if y < 60:
+            c.showPage()
+            y = height - 50
+            c.setFont("Helvetica-Bold", 8)
+            c.drawString(x, y, "Grupo")
+            c.drawString(x + 110, y, "Impressora")
+            c.drawString(x + 220, y, "Marca")
+            c.drawString(x + 290, y, "Modelo")
+            c.drawString(x + 390, y, "Serial")
+            c.drawString(x + 490, y, "Local")
+            c.drawRightString(x + 600, y, "Inicial")
+            c.drawRightString(x + 680, y, "Final")
+            c.drawRightString(x + 760, y, "Diferença")
+            y -= 14
+            c.setFont("Helvetica", 8)
+        c.drawString(x, y, str(r[0])[:18])
+        c.drawString(x + 110, y, str(r[1])[:18])
+        c.drawString(x + 220, y, str(r[2])[:12])
+        c.drawString(x + 290, y, str(r[3])[:16])
+        c.drawString(x + 390, y, str(r[4])[:16])
+        c.drawString(x + 490, y, str(r[5])[:16])
+        c.drawRightString(x + 600, y, str(r[6]))
+        c.drawRightString(x + 680, y, str(r[7]))
+        c.drawRightString(x + 760, y, str(r[8]))
+        y -= 12
+    c.save()
+
+
+# Payload = (detailed, rows): rows are plain tuples in table column order, so
+# they pickle small and fast when handed to a renderer process. None means the
+# renderer reads the rows itself (per-job detail, which can be millions of rows).
+Payload = Optional[Tuple[bool, Tuple[Tuple[Any, ...], ...]]]
+
+
+def report_rows(db_path: str, params: Dict[str, Any]) -> Payload:
+    since, until, group = params["since"], params["until"], params["group_by"]
+    if params["kind"] == "counters":
+        rows = query_counter_report(db_path, since=since, until=until, group_by=group, metric=params["metric"])
+        return False, tuple(tuple(counter_report_values(r)) for r in rows)
+    if group == "job":
+        return None
+    rows, detailed_printer_rows = report_data(db_path, since, until, group)
+    if detailed_printer_rows is not None:
+        return True, tuple(tuple(printer_detail_values(r)) for r in detailed_printer_rows)
+    return False, tuple(tuple(group_values(r)) for r in rows)
+
+
+def _write_job_detail(db_path: str, out: IO[bytes], fmt: str, since: Optional[str], until: Optional[str]) -> None:
+    table = job_detail_table(db_path, since, until)
+    if fmt == "csv":
+        write_csv(out, table)
+    elif fmt == "xlsx":
+        summary = query_report(db_path, since=since, until=until, group_by="user")
+        headers, values, widths = table
+        write_xlsx(
+            out,
+            [
+                ("Resumo", ["user", "jobs", "pages"], (group_values(r) for r in summary), [30, 12, 12]),
+                ("Jobs", headers, values, widths),
+            ],
+        )
+    else:
+        raise ValueError("group_by=job supports csv or xlsx")
+
+
+def write_report(db_path: str, out: IO[bytes], params: Dict[str, Any], payload: Payload) -> None:
+    fmt = params["format"]
+    if fmt not in REPORT_FORMATS:
+        raise ValueError("format must be csv, xlsx, or pdf")
+    since, until, group = params["since"], params["until"], params["group_by"]
+    if payload is None:
+        _write_job_detail(db_path, out, fmt, since, until)
+        return
+    detailed, rows = payload
+    if params["kind"] == "counters":
+        headers, widths = COUNTER_HEADERS, COUNTER_WIDTHS
+    elif detailed:
+        headers, widths = PRINTER_DETAIL_HEADERS, PRINTER_DETAIL_WIDTHS
+    else:
+        headers, widths = REPORT_HEADERS, REPORT_WIDTHS
+    if fmt == "csv":
+        write_csv(out, (headers, rows, widths))
+    elif fmt == "xlsx":
+        write_xlsx(out, [("Relatório", headers, rows, widths)])
+    elif params["kind"] == "counters":
+        write_counter_report_pdf(out, rows, group, params["metric"], since, until)
+    else:
+        write_report_pdf(out, rows, detailed, group, since, until)
+
+
+def render_to_file(db_path: str, path: str, params: Dict[str, Any], payload: Payload) -> None:
+    # Top-level so it can run in a renderer process.
+    with open(path, "wb") as out:
+        write_report(db_path, out, params, payload)
+
+
+def report_filename(kind: str, group: str, fmt: str) -> str:
+    if kind == "counters":
+        return f"relatorio-contadores.{fmt}"
+    if group == "job":
+        return f"relatorio-jobs.{fmt}"
+    return f"relatorio.{fmt}"
+
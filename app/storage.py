@@ -1,16 +1,201 @@
-﻿import os
+﻿import base64
+import json
+import os
 import sqlite3
+import threading
 from datetime import datetime, timedelta
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# Write generation: bumped after every commit done through this module so
+# callers (response cache, ETags, push channel) can tell when data changed.
+_generation = 0
+_generation_lock = threading.Lock()
+_write_listeners: List[Callable[[Tuple[str, ...]], None]] = []
+# One long-lived connection per database, used only to read PRAGMA data_version
+# and detect commits made by other processes (e.g. `python -m app.ingest`).
+_version_conns: Dict[str, sqlite3.Connection] = {}
+_version_seen: Dict[str, int] = {}
+
+
+# Change-notification name of the batched agent "last seen" flush.
+PRESENCE_TABLE = "client_agents_presence"
+
+# Set on the writer thread while a WriteBatch operation runs.
+_batch_local = threading.local()
 
 
 def _connect(db_path: str) -> sqlite3.Connection:
+    batch = getattr(_batch_local, "batch", None)
+    if batch is not None and batch.db_path == db_path:
+        return batch.shared
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
     return conn
 
 
+class _SharedConnection:
+    # What _connect() hands to storage functions running inside a WriteBatch:
+    # the batch's connection, with commit/close deferred to the batch.
+    def __init__(self, conn: sqlite3.Connection, batch: "WriteBatch") -> None:
+        self._conn = conn
+        self._batch = batch
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+    def commit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class WriteBatch:
+    # Group commit: runs several write functions of this module in a single
+    # transaction, so N small writes cost one fsync instead of N. Each
+    # operation is wrapped in a savepoint; a failing one is rolled back on its
+    # own and the rest of the batch still commits. Used by the single writer
+    # thread in app.db_executor.
+    def __init__(self, db_path: str) -> None:
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.shared = _SharedConnection(self.conn, self)
+        self.tables: set = set()
+
+    def begin(self) -> None:
+        self.tables = set()
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        self.conn.execute("SAVEPOINT op")
+        _batch_local.batch = self
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            _batch_local.batch = None
+            self.conn.execute("ROLLBACK TO op")
+            self.conn.execute("RELEASE op")
+            raise
+        _batch_local.batch = None
+        self.conn.execute("RELEASE op")
+        return result
+
+    def commit(self) -> None:
+        _bump_table_versions(self.conn, self.tables)
+        self.conn.execute("COMMIT")
+        with _generation_lock:
+            try:
+                _version_seen[self.db_path] = _read_data_version(self.db_path)
+            except sqlite3.Error:
+                pass
+        if self.tables:
+            _bump_generation(tuple(sorted(self.tables)))
+
+    def rollback(self) -> None:
+        if self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def add_write_listener(fn: Callable[[Tuple[str, ...]], None]) -> None:
+    # fn receives the names of the tables touched by the commit ("*" = unknown).
+    _write_listeners.append(fn)
+
+
+def _read_data_version(db_path: str) -> int:
+    conn = _version_conns.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        _version_conns[db_path] = conn
+    return int(conn.execute("PRAGMA data_version").fetchone()[0])
+
+
+def _bump_generation(tables: Tuple[str, ...]) -> int:
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        gen = _generation
+    for fn in list(_write_listeners):
+        try:
+            fn(tables)
+        except Exception:
+            pass
+    return gen
+
+
+def _bump_table_versions(conn: Any, tables: Iterable[str]) -> None:
+    # Part of the committing transaction, so unlike the in-memory generation
+    # the counters survive restarts and count other processes' writes too.
+    for table in sorted(set(tables)):
+        try:
+            conn.execute(
+                """
+                INSERT INTO table_versions (name, version) VALUES (?, 1)
+                ON CONFLICT(name) DO UPDATE SET version = version + 1
+                """,
+                (table,),
+            )
+        except sqlite3.OperationalError:
+            # Database not upgraded by init_db yet.
+            return
+
+
+def table_versions(db_path: str, tables: Iterable[str]) -> Dict[str, int]:
+    # {table: version} for the given tables; 0 for tables never written.
+    names = sorted(set(tables))
+    versions = {name: 0 for name in names}
+    if not names:
+        return versions
+    conn = _connect(db_path)
+    try:
+        cur = conn.execute(
+            f"SELECT name, version FROM table_versions WHERE name IN ({','.join('?' * len(names))})", names
+        )
+        versions.update({r[0]: int(r[1]) for r in cur.fetchall()})
+    except sqlite3.OperationalError:
+        pass
+    finally:
+        conn.close()
+    return versions
+
+
+def _commit(conn: sqlite3.Connection, db_path: str, *tables: str) -> None:
+    if isinstance(conn, _SharedConnection):
+        # Inside a WriteBatch: the batch commits and notifies once for all.
+        conn._batch.tables.update(tables)
+        return
+    _bump_table_versions(conn, tables)
+    conn.commit()
+    with _generation_lock:
+        try:
+            # Our own commit also moves data_version; absorb it so that
+            # data_generation() only reacts to writes from other processes.
+            _version_seen[db_path] = _read_data_version(db_path)
+        except sqlite3.Error:
+            pass
+    _bump_generation(tables)
+
+
+def data_generation(db_path: str) -> int:
+    with _generation_lock:
+        try:
+            version = _read_data_version(db_path)
+        except sqlite3.Error:
+            return _generation
+        previous = _version_seen.get(db_path)
+        _version_seen[db_path] = version
+        gen = _generation
+    if previous is not None and previous != version:
+        gen = _bump_generation(("*",))
+    return gen
+
+
 def _ensure_report_exclusions_table(cur: sqlite3.Cursor) -> None:
     cur.execute(
         """
@@ -28,6 +213,8 @@ def _ensure_report_exclusions_table(cur: sqlite3.Cursor) -> None:
 def init_db(db_path: str) -> None:
     conn = _connect(db_path)
     cur = conn.cursor()
+    # WAL lets the API's reader threads run while a write is in progress.
+    cur.execute("PRAGMA journal_mode=WAL")
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS jobs (
@@ -65,6 +252,8 @@ def init_db(db_path: str) -> None:
         cur.execute("ALTER TABLE jobs ADD COLUMN client_host TEXT")
     if "job_id" not in cols:
         cur.execute("ALTER TABLE jobs ADD COLUMN job_id TEXT")
+    if "pages_final" not in cols:
+        cur.execute("ALTER TABLE jobs ADD COLUMN pages_final INTEGER")
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS user_departments (
@@ -150,6 +339,24 @@ def init_db(db_path: str) -> None:
         )
         """
     )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            name TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TEXT
+        )
+        """
+    )
+    # Persistent per-table write counters (see _bump_table_versions).
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+        """
+    )
     cur.execute("PRAGMA table_info(printer_sources)")
     ps_cols = {row[1] for row in cur.fetchall()}
     if "serial" not in ps_cols:
@@ -162,11 +369,38 @@ def init_db(db_path: str) -> None:
         cur.execute("ALTER TABLE client_agents ADD COLUMN serial TEXT")
     if "location" not in ca_cols:
         cur.execute("ALTER TABLE client_agents ADD COLUMN location TEXT")
+    _migrate_client_job_keys(cur)
     _ensure_report_exclusions_table(cur)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_timestamp ON jobs(timestamp)")
+    # Backs ORDER BY COALESCE(timestamp, ''), id and the keyset cursor of
+    # query_jobs (the rowid is implicitly the last column of the index).
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_timestamp_key ON jobs(COALESCE(timestamp, ''))")
     conn.commit()
     conn.close()
 
 
+_CLIENT_JOB_KEYS_MIGRATION = "migration_client_job_keys"
+
+
+def _migrate_client_job_keys(cur: sqlite3.Cursor) -> None:
+    # Agent jobs stored before they were keyed by _client_job_key carry the
+    # content hash of _job_hash; re-key them once so a resent or final record
+    # updates the row instead of adding a second one. Should two old rows map
+    # to the same key, the first keeps it and the other is left as it was.
+    cur.execute("SELECT 1 FROM sync_state WHERE name=?", (_CLIENT_JOB_KEYS_MIGRATION,))
+    if cur.fetchone():
+        return
+    cur.execute(
+        """
+        UPDATE OR IGNORE jobs
+        SET job_hash = 'client|' || client_host || '|' || COALESCE(printer, '') || '|' || job_id
+            || '|' || COALESCE(timestamp, '')
+        WHERE source = 'client' AND COALESCE(job_id, '') <> '' AND COALESCE(client_host, '') <> ''
+        """
+    )
+    _set_sync_state(cur, _CLIENT_JOB_KEYS_MIGRATION, {"rekeyed": cur.rowcount})
+
+
 def _to_int(value: Any) -> Optional[int]:
     try:
         return int(float(value))
@@ -248,15 +482,33 @@ def _job_hash(rec: Dict[str, Any]) -> str:
     return "|".join(parts)
 
 
-def upsert_jobs(db_path: str, records: Iterable[Dict[str, Any]]) -> int:
+def upsert_jobs(
+    db_path: str,
+    records: Iterable[Dict[str, Any]],
+    state_name: Optional[str] = None,
+    state: Optional[Dict[str, Any]] = None,
+) -> int:
+    # With state_name, `state` (e.g. an ingest high-water mark) is saved in
+    # the same transaction as the rows.
     conn = _connect(db_path)
     cur = conn.cursor()
+    inserted = _insert_job_rows(cur, records)
+    if state_name:
+        _set_sync_state(cur, state_name, state or {})
+        _commit(conn, db_path, "jobs", "sync_state")
+    else:
+        _commit(conn, db_path, "jobs")
+    conn.close()
+    return inserted
+
+
+def _insert_job_rows(cur: sqlite3.Cursor, records: Iterable[Dict[str, Any]]) -> int:
     inserted = 0
 
     for rec in records:
         ts = rec.get("timestamp")
         ts_str = ts.isoformat() if isinstance(ts, datetime) else (ts or "")
-        job_hash = _job_hash({**rec, "timestamp": ts_str})
+        job_hash = rec.get("job_hash") or _job_hash({**rec, "timestamp": ts_str})
 
         cur.execute(
             """
@@ -296,9 +548,6 @@ def upsert_jobs(db_path: str, records: Iterable[Dict[str, Any]]) -> int:
         )
         if cur.rowcount:
             inserted += 1
-
-    conn.commit()
-    conn.close()
     return inserted
 
 
@@ -370,16 +619,28 @@ def query_summary(db_path: str, days: int = 7) -> Dict[str, Any]:
     }
 
 
-def query_jobs(
-    db_path: str,
-    limit: int = 50,
-    user: Optional[str] = None,
-    printer: Optional[str] = None,
-    since: Optional[str] = None,
-    until: Optional[str] = None,
-) -> List[Dict[str, Any]]:
-    conn = _connect(db_path)
-    cur = conn.cursor()
+def encode_job_cursor(timestamp: str, job_rowid: int) -> str:
+    raw = json.dumps([str(timestamp or ""), int(job_rowid)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_job_cursor(token: str) -> Tuple[str, int]:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        ts, job_rowid = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        return str(ts), int(job_rowid)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def _jobs_where(
+    conn: sqlite3.Connection,
+    user: Optional[str],
+    printer: Optional[str],
+    since: Optional[str],
+    until: Optional[str],
+    cursor: Optional[str] = None,
+) -> Tuple[str, List[Any]]:
     ex = _get_exclusions(conn)
 
     clauses = []
@@ -400,40 +661,225 @@ def query_jobs(
     if until:
         clauses.append("timestamp <= ?")
         params.append(until)
+    if cursor:
+        # Keyset: continue strictly after the last (timestamp, id) already returned.
+        # A row-value comparison (unlike an OR) keeps the index walk in order.
+        # Undated rows (NULL timestamp) sort as "" so they are not skipped;
+        # the extra <= gives SQLite a range on the expression index.
+        ts, job_rowid = decode_job_cursor(cursor)
+        clauses.append("COALESCE(timestamp, '') <= ? AND (COALESCE(timestamp, ''), id) < (?, ?)")
+        params.extend([ts, ts, job_rowid])
     _add_exclusion_where(clauses, params, ex)
 
     where = "WHERE " + " AND ".join(clauses) if clauses else ""
+    return where, params
+
+
+def query_jobs(
+    db_path: str,
+    limit: int = 50,
+    user: Optional[str] = None,
+    printer: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    cursor: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    where, params = _jobs_where(conn, user, printer, since, until, cursor)
 
     sql = f"""
         SELECT * FROM jobs
         {where}
-        ORDER BY timestamp DESC
+        ORDER BY COALESCE(timestamp, '') DESC, id DESC
         LIMIT ?
     """
     params.append(limit)
 
     cur.execute(sql, params)
     rows = [dict(r) for r in cur.fetchall()]
+    conn.close()
     return rows
 
 
-def insert_client_jobs(db_path: str, records: Iterable[Dict[str, Any]]) -> int:
-    normalized = []
+def query_jobs_page(
+    db_path: str,
+    limit: int = 50,
+    user: Optional[str] = None,
+    printer: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    limit = max(1, int(limit))
+    rows = query_jobs(db_path, limit=limit + 1, user=user, printer=printer, since=since, until=until, cursor=cursor)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_job_cursor(rows[-1].get("timestamp") or "", rows[-1]["id"])
+    return {"items": rows, "next_cursor": next_cursor}
+
+
+def iter_jobs(
+    db_path: str,
+    user: Optional[str] = None,
+    printer: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    page_size: int = 1000,
+) -> Iterator[Dict[str, Any]]:
+    # Walks the whole range page by page with the keyset cursor, so memory is
+    # bounded by page_size and no read transaction is held between pages.
+    cursor = None
+    while True:
+        page = query_jobs_page(db_path, limit=page_size, user=user, printer=printer, since=since, until=until, cursor=cursor)
+        yield from page["items"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+
+def _client_job_record(rec: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "timestamp": rec.get("submitted") or rec.get("timestamp") or "",
+        "user": rec.get("user", ""),
+        "printer": rec.get("printer", ""),
+        "document": rec.get("document", ""),
+        "pages": rec.get("pages", 0),
+        "copies": rec.get("copies", 1),
+        "source": "client",
+        "client_host": rec.get("client_host", ""),
+        "job_id": rec.get("job_id", ""),
+    }
+
+
+def _client_job_key(row: Dict[str, Any]) -> str:
+    # Must match the expression of _migrate_client_job_keys.
+    return f"client|{row['client_host']}|{row['printer']}|{row['job_id']}|{row['timestamp']}"
+
+
+def _upsert_client_job_rows(cur: sqlite3.Cursor, records: Iterable[Dict[str, Any]]) -> Tuple[int, int]:
+    # Agent jobs carrying a spooler job_id are keyed by (agent, printer,
+    # job_id, submitted) instead of by content, so a later record for the
+    # same job corrects its page count: a "final" record (sent once the job
+    # left the queue) replaces it and marks it pages_final, a provisional one
+    # can only raise a count that is not final yet. Returns (inserted, updated).
+    inserted = updated = 0
+    plain = []
+    keyed = []
     for rec in records:
-        normalized.append(
-            {
-                "timestamp": rec.get("submitted") or rec.get("timestamp") or "",
-                "user": rec.get("user", ""),
-                "printer": rec.get("printer", ""),
-                "document": rec.get("document", ""),
-                "pages": rec.get("pages", 0),
-                "copies": rec.get("copies", 1),
-                "source": "client",
-                "client_host": rec.get("client_host", ""),
-                "job_id": rec.get("job_id", ""),
-            }
+        row = _client_job_record(rec)
+        if row["job_id"] in (None, "") or not row["client_host"]:
+            plain.append(row)
+        else:
+            keyed.append((_client_job_key(row), row, 1 if rec.get("final") else None))
+    # key -> (id, pages, pages_final) of the stored rows, looked up in chunks.
+    stored: Dict[str, Tuple[int, Optional[int], Optional[int]]] = {}
+    keys = list({k for k, _, _ in keyed})
+    for i in range(0, len(keys), 500):
+        part = keys[i : i + 500]
+        cur.execute(
+            f"SELECT job_hash, id, pages, pages_final FROM jobs WHERE job_hash IN ({','.join('?' * len(part))})",
+            part,
         )
-    return upsert_jobs(db_path, normalized)
+        stored.update({r[0]: (r[1], r[2], r[3]) for r in cur.fetchall()})
+    for key, row, final in keyed:
+        existing = stored.get(key)
+        if existing is None:
+            if _insert_job_rows(cur, [{**row, "job_hash": key}]):
+                inserted += 1
+                job_rowid = cur.lastrowid
+                if final:
+                    cur.execute("UPDATE jobs SET pages_final=1 WHERE id=?", (job_rowid,))
+                stored[key] = (job_rowid, _to_int(row["pages"]), final)
+            continue
+        pages = _to_int(row["pages"]) or 0
+        if not final:
+            if existing[2]:
+                continue
+            pages = max(pages, existing[1] or 0)
+        if pages != existing[1] or final != existing[2]:
+            cur.execute("UPDATE jobs SET pages=?, pages_final=? WHERE id=?", (pages, final, existing[0]))
+            stored[key] = (existing[0], pages, final)
+            updated += 1
+    inserted += _insert_job_rows(cur, plain)
+    return inserted, updated
+
+
+def insert_client_jobs(db_path: str, records: Iterable[Dict[str, Any]]) -> int:
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    inserted, _ = _upsert_client_job_rows(cur, records)
+    _commit(conn, db_path, "jobs")
+    conn.close()
+    return inserted
+
+
+def insert_client_batch(
+    db_path: str,
+    agents: List[Dict[str, Any]],
+    printer_models: Dict[str, str],
+    records: Iterable[Dict[str, Any]],
+) -> Tuple[int, int]:
+    # One /api/client-jobs payload in a single transaction: the (already
+    # deduplicated) agents and printer models, then the jobs themselves.
+    # Returns (inserted, updated) jobs.
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    now = datetime.now().isoformat()
+    if agents:
+        cur.executemany(
+            _UPSERT_CLIENT_AGENT_SQL,
+            [
+                (
+                    a["agent_id"],
+                    a["host"],
+                    a["printer_name"],
+                    a.get("printer_model", ""),
+                    a.get("serial", ""),
+                    a.get("location", ""),
+                    a.get("ip", ""),
+                    a.get("version", ""),
+                    now,
+                )
+                for a in agents
+            ],
+        )
+    if printer_models:
+        cur.executemany(
+            _UPSERT_PRINTER_MODEL_SQL,
+            [(printer, model, "agent", now) for printer, model in printer_models.items()],
+        )
+    inserted, updated = _upsert_client_job_rows(cur, records)
+    tables = ["jobs"]
+    if agents:
+        tables.append("client_agents")
+    if printer_models:
+        tables.append("printer_models")
+    _commit(conn, db_path, *tables)
+    conn.close()
+    return inserted, updated
+
+
+_UPSERT_CLIENT_AGENT_SQL = """
+    INSERT INTO client_agents (agent_id, host, printer_name, printer_model, serial, location, ip, version, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(agent_id) DO UPDATE SET
+        host=excluded.host,
+        printer_name=excluded.printer_name,
+        printer_model=excluded.printer_model,
+        serial=excluded.serial,
+        location=excluded.location,
+        ip=excluded.ip,
+        version=excluded.version,
+        updated_at=excluded.updated_at
+"""
+
+_UPSERT_PRINTER_MODEL_SQL = """
+    INSERT INTO printer_models (printer, model, source, updated_at)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(printer) DO UPDATE SET model=excluded.model, source=excluded.source, updated_at=excluded.updated_at
+"""
 
 
 def upsert_client_agent(
@@ -450,19 +896,7 @@ def upsert_client_agent(
     conn = _connect(db_path)
     cur = conn.cursor()
     cur.execute(
-        """
-        INSERT INTO client_agents (agent_id, host, printer_name, printer_model, serial, location, ip, version, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(agent_id) DO UPDATE SET
-            host=excluded.host,
-            printer_name=excluded.printer_name,
-            printer_model=excluded.printer_model,
-            serial=excluded.serial,
-            location=excluded.location,
-            ip=excluded.ip,
-            version=excluded.version,
-            updated_at=excluded.updated_at
-        """,
+        _UPSERT_CLIENT_AGENT_SQL,
         (
             agent_id,
             host,
@@ -475,7 +909,18 @@ def upsert_client_agent(
             datetime.now().isoformat(),
         ),
     )
-    conn.commit()
+    _commit(conn, db_path, "client_agents")
+    conn.close()
+
+
+def touch_client_agents(db_path: str, seen: List[Tuple[str, str]]) -> None:
+    # Batched presence flush: (updated_at, agent_id) pairs. Tagged
+    # PRESENCE_TABLE rather than client_agents: it only persists timestamps
+    # the in-memory presence table already holds.
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    cur.executemany("UPDATE client_agents SET updated_at=? WHERE agent_id=?", seen)
+    _commit(conn, db_path, PRESENCE_TABLE)
     conn.close()
 
 
@@ -514,7 +959,7 @@ def update_client_agent(
         """,
         (host, printer_name, printer_model, serial, location, ip, version, datetime.now().isoformat(), agent_id),
     )
-    conn.commit()
+    _commit(conn, db_path, "client_agents")
     conn.close()
 
 
@@ -522,7 +967,7 @@ def delete_client_agent(db_path: str, agent_id: str) -> None:
     conn = _connect(db_path)
     cur = conn.cursor()
     cur.execute("DELETE FROM client_agents WHERE agent_id = ?", (agent_id,))
-    conn.commit()
+    _commit(conn, db_path, "client_agents")
     conn.close()
 
 
@@ -553,22 +998,100 @@ def upsert_user_department(db_path: str, user: str, department: str, source: str
         """,
         (user, department, source, datetime.now().isoformat()),
     )
-    conn.commit()
+    _commit(conn, db_path, "user_departments")
+    conn.close()
+
+
+def _set_sync_state(cur: sqlite3.Cursor, name: str, value: Dict[str, Any]) -> None:
+    cur.execute(
+        """
+        INSERT INTO sync_state (name, value, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at
+        """,
+        (name, json.dumps(value), datetime.now().isoformat()),
+    )
+
+
+def get_sync_state(db_path: str, name: str) -> Dict[str, Any]:
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT value FROM sync_state WHERE name = ?", (name,))
+    row = cur.fetchone()
     conn.close()
+    if not row or not row[0]:
+        return {}
+    try:
+        return json.loads(row[0])
+    except ValueError:
+        return {}
+
+
+def set_sync_state(db_path: str, name: str, value: Dict[str, Any]) -> None:
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    _set_sync_state(cur, name, value)
+    _commit(conn, db_path, "sync_state")
+    conn.close()
+
+
+def sync_user_departments(
+    db_path: str,
+    rows: List[Tuple[str, str]],
+    source: str,
+    state_name: str,
+    state: Dict[str, Any],
+    save_unchanged_state: bool = True,
+) -> int:
+    # Writes only the (user, department) pairs that differ from what is
+    # stored, never overriding a manual entry, and saves the sync watermark
+    # in the same transaction. With save_unchanged_state=False nothing at all
+    # is written when no pair differs. Returns the number of rows changed.
+    conn = _connect(db_path)
+    cur = conn.cursor()
+    current: Dict[str, Tuple[str, str]] = {}
+    users = [u for u, _ in rows]
+    for i in range(0, len(users), 500):
+        part = users[i : i + 500]
+        cur.execute(
+            f"SELECT user, department, source FROM user_departments WHERE user IN ({','.join('?' * len(part))})",
+            part,
+        )
+        current.update({r[0]: (r[1] or "", r[2] or "") for r in cur.fetchall()})
+    now = datetime.now().isoformat()
+    changed = []
+    for user, department in rows:
+        stored = current.get(user)
+        if stored is None and not department:
+            continue
+        if stored is not None and (stored[1] == "manual" or stored[0] == department):
+            continue
+        changed.append((user, department, source, now))
+    if not changed and not save_unchanged_state:
+        conn.close()
+        return 0
+    if changed:
+        cur.executemany(
+            """
+            INSERT INTO user_departments (user, department, source, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(user) DO UPDATE SET department=excluded.department, source=excluded.source, updated_at=excluded.updated_at
+            """,
+            changed,
+        )
+    _set_sync_state(cur, state_name, state)
+    _commit(conn, db_path, "sync_state", *(["user_departments"] if changed else []))
+    conn.close()
+    return len(changed)
 
 
 def upsert_printer_model(db_path: str, printer: str, model: str, source: str = "manual") -> None:
     conn = _connect(db_path)
     cur = conn.cursor()
     cur.execute(
-        """
-        INSERT INTO printer_models (printer, model, source, updated_at)
-        VALUES (?, ?, ?, ?)
-        ON CONFLICT(printer) DO UPDATE SET model=excluded.model, source=excluded.source, updated_at=excluded.updated_at
-        """,
+        _UPSERT_PRINTER_MODEL_SQL,
         (printer, model, source, datetime.now().isoformat()),
     )
-    conn.commit()
+    _commit(conn, db_path, "printer_models")
     conn.close()
 
 
@@ -736,7 +1259,7 @@ def upsert_printer_source(
         """,
         (name, ip, brand, model, serial, location, counter_url, 1 if enabled else 0, datetime.now().isoformat()),
     )
-    conn.commit()
+    _commit(conn, db_path, "printer_sources")
     conn.close()
 
 
@@ -756,7 +1279,7 @@ def create_department(db_path: str, name: str) -> None:
         "INSERT INTO departments (name, updated_at) VALUES (?, ?)",
         (str(name).strip(), datetime.now().isoformat()),
     )
-    conn.commit()
+    _commit(conn, db_path, "departments")
     conn.close()
 
 
@@ -767,7 +1290,7 @@ def update_department(db_path: str, department_id: int, name: str) -> None:
         "UPDATE departments SET name = ?, updated_at = ? WHERE id = ?",
         (str(name).strip(), datetime.now().isoformat(), int(department_id)),
     )
-    conn.commit()
+    _commit(conn, db_path, "departments")
     conn.close()
 
 
@@ -776,7 +1299,7 @@ def delete_department(db_path: str, department_id: int) -> None:
     cur = conn.cursor()
     cur.execute("DELETE FROM printer_departments WHERE department_id = ?", (int(department_id),))
     cur.execute("DELETE FROM departments WHERE id = ?", (int(department_id),))
-    conn.commit()
+    _commit(conn, db_path, "departments", "printer_departments")
     conn.close()
 
 
@@ -791,7 +1314,7 @@ def upsert_printer_department(db_path: str, printer: str, department_id: int) ->
         """,
         (str(printer).strip(), int(department_id), datetime.now().isoformat()),
     )
-    conn.commit()
+    _commit(conn, db_path, "printer_departments")
     conn.close()
 
 
@@ -799,7 +1322,7 @@ def delete_printer_department(db_path: str, printer: str) -> None:
     conn = _connect(db_path)
     cur = conn.cursor()
     cur.execute("DELETE FROM printer_departments WHERE printer = ?", (str(printer).strip(),))
-    conn.commit()
+    _commit(conn, db_path, "printer_departments")
     conn.close()
 
 
@@ -868,7 +1391,7 @@ def update_printer_source(
             int(source_id),
         ),
     )
-    conn.commit()
+    _commit(conn, db_path, "printer_sources")
     conn.close()
 
 
@@ -876,7 +1399,7 @@ def delete_printer_source(db_path: str, source_id: int) -> None:
     conn = _connect(db_path)
     cur = conn.cursor()
     cur.execute("DELETE FROM printer_sources WHERE id = ?", (int(source_id),))
-    conn.commit()
+    _commit(conn, db_path, "printer_sources")
     conn.close()
 
 
@@ -922,7 +1445,7 @@ def set_printer_source_error(db_path: str, source_id: int, error: Optional[str])
         """,
         (error, datetime.now().isoformat(), source_id),
     )
-    conn.commit()
+    _commit(conn, db_path, "printer_sources")
     conn.close()
 
 
@@ -955,7 +1478,7 @@ def insert_printer_counter(
             _to_int(total_scan) or 0,
         ),
     )
-    conn.commit()
+    _commit(conn, db_path, "printer_counters")
     conn.close()
 
 
@@ -1332,7 +1855,7 @@ def upsert_report_exclusion(db_path: str, kind: str, value: str, note: str = "")
         """,
         (k, v, str(note or "").strip(), datetime.now().isoformat()),
     )
-    conn.commit()
+    _commit(conn, db_path, "report_exclusions")
     conn.close()
 
 
@@ -1341,5 +1864,5 @@ def delete_report_exclusion(db_path: str, kind: str, value: str) -> None:
     cur = conn.cursor()
     _ensure_report_exclusions_table(cur)
     cur.execute("DELETE FROM report_exclusions WHERE kind = ? AND value = ?", (str(kind).strip().lower(), str(value).strip()))
-    conn.commit()
+    _commit(conn, db_path, "report_exclusions")
     conn.close()
@@ -1,59 +1,79 @@
-﻿import socket
+﻿import gzip
+import json
+import os
+import socket
+import threading
 import time
-from typing import Dict, List
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
 from urllib.parse import urlparse
 
 import requests
-import win32print
+from requests.adapters import HTTPAdapter
 
-from config import AgentConfig, load_config
+from config import AgentConfig, data_dir, load_config
+from dedup import SeenJobs
+from outbox import Outbox, OutboxSender, Rejected
+from polling import AdaptivePoll, PollStats
+from spooler import SpoolerBackend, Win32Spooler
+from tracker import JobTracker
 
 
 AGENT_VERSION = "1.2.0"
 
+# Request bodies at least this large are sent gzip-compressed.
+GZIP_MIN_BYTES = 1024
+
+
+_default_spooler: Optional[SpoolerBackend] = None
+
+
+def default_spooler() -> SpoolerBackend:
+    global _default_spooler
+    if _default_spooler is None:
+        _default_spooler = Win32Spooler()
+    return _default_spooler
+
 
 def list_printers() -> List[str]:
-    flags = win32print.PRINTER_ENUM_LOCAL | win32print.PRINTER_ENUM_CONNECTIONS
-    printers = win32print.EnumPrinters(flags)
-    return [p[2] for p in printers]
+    return default_spooler().list_printers()
 
 
-def _job_hash(job: Dict) -> str:
-    return f"{job.get('JobId')}|{job.get('Submitted')}|{job.get('pPrinterName')}|{job.get('pDocument')}"
+def _job_key(job: Dict) -> str:
+    return f"{job.get('JobId')}|{job.get('Submitted')}"
 
 
 def poll_printer(printer_name: str) -> List[Dict]:
-    handle = win32print.OpenPrinter(printer_name)
-    try:
-        jobs = win32print.EnumJobs(handle, 0, -1, 1)
-        return jobs
-    finally:
-        win32print.ClosePrinter(handle)
+    return default_spooler().enum_jobs(printer_name)
 
 
 def get_printer_model(printer_name: str) -> str:
-    try:
-        handle = win32print.OpenPrinter(printer_name)
-        try:
-            info = win32print.GetPrinter(handle, 2) or {}
-            return str(info.get("pDriverName", "") or "").strip()
-        finally:
-            win32print.ClosePrinter(handle)
-    except Exception:
-        return ""
+    return default_spooler().printer_model(printer_name)
 
 
 def get_default_printer() -> str:
-    try:
-        return str(win32print.GetDefaultPrinter() or "").strip()
-    except Exception:
-        return ""
+    return default_spooler().default_printer()
+
+
+def resolve_printer_names(cfg: AgentConfig, spooler: Optional[SpoolerBackend] = None) -> List[str]:
+    spooler = spooler or default_spooler()
+    if bool(getattr(cfg, "monitor_all_printers", False)):
+        names = spooler.list_printers()
+    else:
+        names = [cfg.printer_name] + list(getattr(cfg, "printer_names", None) or [])
+        if bool(getattr(cfg, "monitor_default_printer", False)):
+            names.insert(0, spooler.default_printer())
+    result = []
+    for name in names:
+        name = str(name or "").strip()
+        if name and name not in result:
+            result.append(name)
+    return result
 
 
-def resolve_printer_name(cfg: AgentConfig) -> str:
-    if bool(getattr(cfg, "monitor_default_printer", False)):
-        return get_default_printer()
-    return str(cfg.printer_name or "").strip()
+@lru_cache(maxsize=1)
+def host_name() -> str:
+    return socket.gethostname()
 
 
 def _local_ip_for_server(server_url: str) -> str:
@@ -73,14 +93,15 @@ def _local_ip_for_server(server_url: str) -> str:
         return ""
 
 
-def send_jobs(server_url: str, jobs: List[Dict], printer_name: str, printer_model: str, client_ip: str) -> None:
-    if not jobs:
-        return
+def _job_pages(job: Dict) -> int:
+    return job.get("TotalPages", 0) or job.get("PagesPrinted", 0) or 0
 
-    host = socket.gethostname()
+
+def build_job_records(jobs: List[Dict], printer_name: str, printer_model: str, client_ip: str) -> List[Dict]:
+    host = host_name()
     payload = []
     for j in jobs:
-        total_pages = j.get("TotalPages", 0) or j.get("PagesPrinted", 0) or 0
+        total_pages = _job_pages(j)
         payload.append(
             {
                 "job_id": j.get("JobId"),
@@ -97,68 +118,210 @@ def send_jobs(server_url: str, jobs: List[Dict], printer_name: str, printer_mode
                 "agent_version": AGENT_VERSION,
             }
         )
+    return payload
 
-    url = server_url.rstrip("/") + "/api/client-jobs"
-    requests.post(url, json=payload, timeout=5)
+
+def build_final_record(state: Dict, printer_model: str, client_ip: str) -> Dict:
+    # Same record as the first sighting, with the definitive page count; the
+    # server replaces the stored count for (agent, job_id).
+    record = build_job_records([state["job"]], state["printer"], printer_model, client_ip)[0]
+    record["pages"] = JobTracker.final_pages(state)
+    record["final"] = True
+    return record
+
+
+def make_session() -> requests.Session:
+    # Keep-alive connections shared by the outbox sender and the poll loop.
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+    session.headers["User-Agent"] = f"PrintClientAgent/{AGENT_VERSION}"
+    return session
 
 
-def send_heartbeat(server_url: str, printer_name: str, printer_model: str, client_ip: str) -> None:
-    host = socket.gethostname()
+def _post_json(session: requests.Session, url: str, payload: Any, timeout: float) -> requests.Response:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if len(body) >= GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return session.post(url, data=body, headers=headers, timeout=timeout)
+
+
+def _record_errors(resp: requests.Response) -> Optional[Dict[int, str]]:
+    # {index: error} from the server's per-record "errors", if any.
+    try:
+        errors = resp.json().get("errors")
+        return {int(e["index"]): str(e.get("error") or "invalid record") for e in errors}
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+
+def post_jobs(session: requests.Session, server_url: str, records: List[Dict]) -> Dict[int, str]:
+    # Raises unless the server confirmed the batch, so the outbox keeps it.
+    # Only a refusal that names bad records (a 400 with per-record "errors")
+    # or a 422 raises Rejected and is not retried; any other 4xx (a proxy's
+    # 401/403/413, a 404 from a wrong server_url or an old server) is retried
+    # like an outage. Returns {index: error} for records the server skipped
+    # while storing the rest.
+    url = server_url.rstrip("/") + "/api/client-jobs"
+    resp = _post_json(session, url, records, timeout=30)
+    if resp.status_code in (400, 422):
+        errors = _record_errors(resp)
+        if errors or resp.status_code == 422:
+            raise Rejected(f"HTTP {resp.status_code}: {resp.text[:200]}", list(errors or ()) or None)
+    resp.raise_for_status()
+    body = resp.json()
+    if not body.get("ok"):
+        raise RuntimeError(body.get("error") or "server rejected jobs")
+    return _record_errors(resp) or {}
+
+
+def send_heartbeat(
+    session: requests.Session,
+    server_url: str,
+    printers: Dict[str, str],
+    client_ip: str,
+    stats: Optional[Dict] = None,
+) -> None:
+    # One request per host for all monitored printers ({name: model}).
+    host = host_name()
     payload = {
-        "agent_id": f"{host}|{printer_name}",
         "host": host,
         "client_ip": client_ip,
-        "printer_name": printer_name,
-        "printer_model": printer_model,
         "agent_version": AGENT_VERSION,
+        "stats": stats or {},
+        "printers": [
+            {"agent_id": f"{host}|{name}", "printer_name": name, "printer_model": model}
+            for name, model in printers.items()
+        ],
     }
     url = server_url.rstrip("/") + "/api/agents/heartbeat"
-    requests.post(url, json=payload, timeout=5)
+    _post_json(session, url, payload, timeout=5)
 
 
-def run_agent(cfg: AgentConfig, stop_event=None) -> None:
+def run_agent(
+    cfg: AgentConfig,
+    stop_event=None,
+    spooler: Optional[SpoolerBackend] = None,
+    state_dir: Optional[str] = None,
+) -> None:
+    # `spooler` and `state_dir` default to the Windows spooler and
+    # %PROGRAMDATA%; load tests pass a SimulatedSpooler and a directory per agent.
     if not cfg.server_url:
         raise ValueError("server_url must be configured")
-    if not bool(getattr(cfg, "monitor_default_printer", False)) and not cfg.printer_name:
+    if not (
+        cfg.printer_name
+        or getattr(cfg, "printer_names", None)
+        or bool(getattr(cfg, "monitor_default_printer", False))
+        or bool(getattr(cfg, "monitor_all_printers", False))
+    ):
         raise ValueError("printer_name must be configured")
 
-    seen = set()
+    if stop_event is None:
+        stop_event = threading.Event()
+    spooler = spooler or default_spooler()
+    state_dir = state_dir or data_dir()
+
+    # One keep-alive session for job batches and heartbeats of every printer.
+    session = make_session()
+    # New jobs go to the on-disk outbox first; the sender thread delivers them.
+    outbox = Outbox(os.path.join(state_dir, "outbox.db"))
+    seen = SeenJobs(os.path.join(state_dir, "seen.db"))
+    sender_stop = threading.Event()
+    sender = OutboxSender(outbox, lambda records: post_jobs(session, cfg.server_url, records), stop_event=sender_stop)
+    sender.start()
+    try:
+        _poll_loop(cfg, stop_event, spooler, session, outbox, sender, seen)
+    finally:
+        sender_stop.set()
+        sender.notify()
+        sender.join(timeout=5)
+        seen.close()
+        outbox.close()
+        session.close()
+
+
+def _poll_loop(
+    cfg: AgentConfig,
+    stop_event,
+    spooler: SpoolerBackend,
+    session: requests.Session,
+    outbox: Outbox,
+    sender: OutboxSender,
+    seen: SeenJobs,
+) -> None:
     client_ip = _local_ip_for_server(cfg.server_url)
     last_heartbeat = 0.0
-    current_printer = ""
-    current_model = ""
+    # Monitored printers and their driver names; the set is re-resolved with
+    # every heartbeat, so new mapped printers or a new default are picked up.
+    printers: Dict[str, str] = {}
+    schedule = AdaptivePoll(
+        cfg.poll_interval_sec,
+        fast_sec=getattr(cfg, "poll_fast_sec", 1.0),
+        idle_sec=getattr(cfg, "poll_idle_sec", 30),
+        idle_after_sec=getattr(cfg, "poll_idle_after_sec", 120),
+    )
+    stats = PollStats()
+    tracker = JobTracker(_job_key)
 
     while True:
-        if stop_event is not None and stop_event.is_set():
+        if stop_event.is_set():
             break
-        try:
-            target_printer = resolve_printer_name(cfg)
-            if not target_printer:
-                time.sleep(max(2, cfg.poll_interval_sec))
-                continue
-
-            if target_printer != current_printer:
-                current_printer = target_printer
-                current_model = get_printer_model(current_printer)
-
-            now = time.time()
-            if now - last_heartbeat >= 30:
-                send_heartbeat(cfg.server_url, current_printer, current_model, client_ip)
+        now = time.time()
+        if not printers or now - last_heartbeat >= 30:
+            try:
+                names = resolve_printer_names(cfg, spooler)
+                tracker.drop_printers([name for name in printers if name not in names])
+                printers = {name: printers.get(name) or spooler.printer_model(name) for name in names}
+            except Exception:
+                pass
+            if printers:
+                try:
+                    # The route to the server (VPN, DHCP) may have changed.
+                    client_ip = _local_ip_for_server(cfg.server_url) or client_ip
+                    send_heartbeat(session, cfg.server_url, printers, client_ip, stats.snapshot(schedule.current))
+                except Exception:
+                    pass
                 last_heartbeat = now
 
-            jobs = poll_printer(current_printer)
-            new_jobs = []
-            for j in jobs:
-                key = _job_hash(j)
-                if key in seen:
-                    continue
-                seen.add(key)
-                new_jobs.append(j)
-            if new_jobs:
-                send_jobs(cfg.server_url, new_jobs, current_printer, current_model, client_ip)
+        # Round-robin over the printers; one failing queue does not stop the others.
+        started = time.perf_counter()
+        queued = 0
+        new_jobs = []
+        new_records = []
+        finished = []
+        for printer_name, printer_model in printers.items():
+            try:
+                jobs = spooler.enum_jobs(printer_name)
+            except Exception:
+                continue
+            queued += len(jobs)
+            # Jobs that left the queue get a final record with the
+            # definitive page count, unless the first one already had it.
+            for state in tracker.update(printer_name, jobs):
+                finished.append(state["key"])
+                if JobTracker.needs_final(state):
+                    new_records.append(build_final_record(state, printer_model, client_ip))
+            fresh = [j for j in jobs if _job_key(j) not in seen]
+            if fresh:
+                new_jobs.extend(fresh)
+                new_records.extend(build_job_records(fresh, printer_name, printer_model, client_ip))
+        stats.note_poll(time.perf_counter() - started)
+        try:
+            if new_records:
+                outbox.put(new_records)
+                # Marked seen only once durably queued.
+                seen.add(_job_key(j) for j in new_jobs)
+                stats.note_new_jobs(j.get("JobId") for j in new_jobs)
+                sender.notify()
+            for j in new_jobs:
+                tracker.note_reported(_job_key(j), _job_pages(j))
+            tracker.forget(finished)
+            seen.flush()
         except Exception:
             pass
-        time.sleep(max(2, cfg.poll_interval_sec))
+        stop_event.wait(schedule.next_interval(queued))
 
 
 if __name__ == "__main__":
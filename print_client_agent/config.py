@@ -1,8 +1,8 @@
 ﻿import json
 import os
 import sys
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import List, Optional
 
 
 @dataclass
@@ -12,6 +12,14 @@ class AgentConfig:
     poll_interval_sec: int
     start_with_windows: bool
     monitor_default_printer: bool = False
+    # Extra printers watched by the same agent, besides printer_name.
+    printer_names: List[str] = field(default_factory=list)
+    monitor_all_printers: bool = False
+    # Adaptive polling: fast while jobs are queued, poll_interval_sec right
+    # after, backing off to poll_idle_sec once idle for poll_idle_after_sec.
+    poll_fast_sec: float = 1.0
+    poll_idle_sec: int = 30
+    poll_idle_after_sec: int = 120
 
 
 def app_base_dir() -> str:
@@ -20,6 +28,17 @@ def app_base_dir() -> str:
     return os.path.dirname(os.path.abspath(__file__))
 
 
+def data_dir() -> str:
+    # Machine-wide state (job outbox); shared by the service and the UI worker.
+    base = os.getenv("PROGRAMDATA")
+    if base:
+        path = os.path.join(base, "PrintClientAgent")
+    else:
+        path = app_base_dir()
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
 def default_config_path() -> str:
     local = os.getenv("LOCALAPPDATA")
     if local:
@@ -47,6 +66,11 @@ def load_config(config_path: Optional[str] = None) -> AgentConfig:
         poll_interval_sec=int(data.get("poll_interval_sec", 5)),
         start_with_windows=bool(data.get("start_with_windows", False)),
         monitor_default_printer=bool(data.get("monitor_default_printer", False)),
+        printer_names=[str(p) for p in (data.get("printer_names") or []) if str(p).strip()],
+        monitor_all_printers=bool(data.get("monitor_all_printers", False)),
+        poll_fast_sec=float(data.get("poll_fast_sec", 1.0)),
+        poll_idle_sec=int(data.get("poll_idle_sec", 30)),
+        poll_idle_after_sec=int(data.get("poll_idle_after_sec", 120)),
     )
 
 
@@ -59,6 +83,11 @@ def save_config(config: AgentConfig, config_path: Optional[str] = None) -> None:
         "poll_interval_sec": config.poll_interval_sec,
         "start_with_windows": config.start_with_windows,
         "monitor_default_printer": bool(config.monitor_default_printer),
+        "printer_names": list(config.printer_names or []),
+        "monitor_all_printers": bool(config.monitor_all_printers),
+        "poll_fast_sec": config.poll_fast_sec,
+        "poll_idle_sec": config.poll_idle_sec,
+        "poll_idle_after_sec": config.poll_idle_after_sec,
     }
     with open(cfg_path, "w", encoding="utf-8") as f:
         json.dump(payload, f, indent=2)
@@ -66,7 +66,7 @@ def main():
 
     root = tk.Tk()
     root.title("Print Client Agent")
-    root.geometry("560x360")
+    root.geometry("560x390")
     root.resizable(False, False)
     root.configure(bg="#f5f7fb")
 
@@ -124,23 +124,32 @@ def main():
         variable=monitor_default_var,
     ).grid(row=3, column=1, sticky="w", pady=(2, 2))
 
-    ttk.Label(frm, text="Intervalo (segundos)").grid(row=4, column=0, sticky="w", pady=(6, 2))
+    monitor_all_var = tk.BooleanVar(value=bool(getattr(cfg, "monitor_all_printers", False)))
+    ttk.Checkbutton(
+        frm,
+        text="Monitorar todas as impressoras deste computador",
+        variable=monitor_all_var,
+    ).grid(row=4, column=1, sticky="w", pady=(2, 2))
+
+    ttk.Label(frm, text="Intervalo (segundos)").grid(row=5, column=0, sticky="w", pady=(6, 2))
     interval_var = tk.IntVar(value=cfg.poll_interval_sec)
-    ttk.Entry(frm, textvariable=interval_var, width=10).grid(row=4, column=1, sticky="w", pady=(6, 2))
+    ttk.Entry(frm, textvariable=interval_var, width=10).grid(row=5, column=1, sticky="w", pady=(6, 2))
 
     start_var = tk.BooleanVar(value=cfg.start_with_windows)
-    ttk.Checkbutton(frm, text="Iniciar com Windows", variable=start_var).grid(row=5, column=1, sticky="w", pady=(8, 2))
+    ttk.Checkbutton(frm, text="Iniciar com Windows", variable=start_var).grid(row=6, column=1, sticky="w", pady=(8, 2))
 
     status_var = tk.StringVar(value="Coleta: parada")
-    ttk.Label(frm, textvariable=status_var).grid(row=6, column=1, sticky="w", pady=(8, 2))
+    ttk.Label(frm, textvariable=status_var).grid(row=7, column=1, sticky="w", pady=(8, 2))
 
     def refresh_printer_field_state():
         try:
-            printer_combo.configure(state="disabled" if monitor_default_var.get() else "readonly")
+            disabled = monitor_default_var.get() or monitor_all_var.get()
+            printer_combo.configure(state="disabled" if disabled else "readonly")
         except Exception:
             pass
 
     monitor_default_var.trace_add("write", lambda *_: refresh_printer_field_state())
+    monitor_all_var.trace_add("write", lambda *_: refresh_printer_field_state())
     refresh_printer_field_state()
 
     worker_thread = None
@@ -162,8 +171,10 @@ def main():
         server_url = server_var.get().strip()
         printer_name = printer_var.get().strip()
         auto_default = bool(monitor_default_var.get())
+        monitor_all = bool(monitor_all_var.get())
+        printer_names = list(getattr(cfg, "printer_names", None) or [])
 
-        if not server_url or (not auto_default and not printer_name):
+        if not server_url or (not auto_default and not monitor_all and not printer_name and not printer_names):
             status_var.set("Coleta: configure servidor e impressora")
             if show_errors:
                 messagebox.showwarning("Coleta", "Configure servidor e impressora para iniciar a coleta.")
@@ -177,6 +188,11 @@ def main():
             poll_interval_sec=int(interval_var.get() or 5),
             start_with_windows=bool(start_var.get()),
             monitor_default_printer=auto_default,
+            printer_names=printer_names,
+            monitor_all_printers=monitor_all,
+            poll_fast_sec=cfg.poll_fast_sec,
+            poll_idle_sec=cfg.poll_idle_sec,
+            poll_idle_after_sec=cfg.poll_idle_after_sec,
         )
         worker_stop = threading.Event()
 
@@ -188,7 +204,9 @@ def main():
 
         worker_thread = threading.Thread(target=_runner, daemon=True)
         worker_thread.start()
-        if auto_default:
+        if monitor_all:
+            status_var.set("Coleta: ativa (todas as impressoras)")
+        elif auto_default:
             status_var.set("Coleta: ativa (impressora padrao)")
         else:
             status_var.set("Coleta: ativa")
@@ -201,6 +219,11 @@ def main():
             poll_interval_sec=int(interval_var.get() or 5),
             start_with_windows=bool(start_var.get()),
             monitor_default_printer=bool(monitor_default_var.get()),
+            printer_names=list(getattr(cfg, "printer_names", None) or []),
+            monitor_all_printers=bool(monitor_all_var.get()),
+            poll_fast_sec=cfg.poll_fast_sec,
+            poll_idle_sec=cfg.poll_idle_sec,
+            poll_idle_after_sec=cfg.poll_idle_after_sec,
         )
         save_config(new_cfg, cfg_path)
         set_startup(new_cfg.start_with_windows)
@@ -211,7 +234,7 @@ def main():
             else:
                 messagebox.showinfo("Salvo", "Configuracoes salvas. Configure servidor/impressora para iniciar a coleta.")
 
-    ttk.Button(frm, text="Salvar", command=on_save).grid(row=7, column=1, sticky="e", pady=16)
+    ttk.Button(frm, text="Salvar", command=on_save).grid(row=8, column=1, sticky="e", pady=16)
 
     icon = None
 
@@ -260,4 +283,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    main()
@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Tuple
+
+
+class SeenJobs:
+    # Bounded record of jobs already queued for the server, keyed by
+    # "JobId|Submitted". Entries are kept in LRU order: a job still sitting in
+    # the spooler is hit on every poll and stays at the recent end, finished
+    # jobs drift to the old end and are dropped after `ttl_sec` or once more
+    # than `max_entries` are held, so memory stays constant.
+    #
+    # The set is mirrored to SQLite so a restart does not re-send jobs that are
+    # still in the spooler. Changes are written by flush(), once per poll;
+    # hits only refresh the stored timestamp when it is older than
+    # `touch_sec`, so an idle spooler costs no writes.
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 20000,
+        ttl_sec: float = 7 * 86400,
+        touch_sec: float = 3600,
+    ) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_sec = float(ttl_sec)
+        self.touch_sec = float(touch_sec)
+        self._lock = threading.Lock()
+        # key -> (last seen, last stored)
+        self._entries: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._upserts: dict = {}
+        self._deletes: set = set()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS seen_jobs (
+                job_key TEXT PRIMARY KEY,
+                seen_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        self._load()
+
+    def _load(self) -> None:
+        cutoff = time.time() - self.ttl_sec
+        rows = self._conn.execute(
+            "SELECT job_key, seen_at FROM seen_jobs WHERE seen_at > ? ORDER BY seen_at DESC LIMIT ?",
+            (cutoff, self.max_entries),
+        ).fetchall()
+        for key, seen_at in reversed(rows):
+            self._entries[key] = (seen_at, seen_at)
+        # Drop whatever did not make it into memory.
+        oldest = rows[-1][1] if len(rows) >= self.max_entries else cutoff
+        self._conn.execute("DELETE FROM seen_jobs WHERE seen_at < ?", (oldest,))
+        self._conn.commit()
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.ttl_sec
+        while self._entries:
+            key, (seen_at, _) = next(iter(self._entries.items()))
+            if seen_at > cutoff and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+            self._upserts.pop(key, None)
+            self._deletes.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            if now - entry[0] > self.ttl_sec:
+                self._expire(now)
+                return False
+            stored = entry[1]
+            if now - stored > self.touch_sec:
+                stored = now
+                self._upserts[key] = now
+            self._entries[key] = (now, stored)
+            self._entries.move_to_end(key)
+            return True
+
+    def add(self, keys: Iterable[str]) -> None:
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                self._entries[key] = (now, now)
+                self._entries.move_to_end(key)
+                self._upserts[key] = now
+                self._deletes.discard(key)
+            self._expire(now)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._expire(time.time())
+            upserts: List[Tuple[str, float]] = list(self._upserts.items())
+            deletes = [(k,) for k in self._deletes]
+            self._upserts, self._deletes = {}, set()
+        if not upserts and not deletes:
+            return
+        try:
+            with self._conn:
+                self._conn.executemany("DELETE FROM seen_jobs WHERE job_key=?", deletes)
+                self._conn.executemany(
+                    "INSERT INTO seen_jobs (job_key, seen_at) VALUES (?, ?) "
+                    "ON CONFLICT(job_key) DO UPDATE SET seen_at=excluded.seen_at",
+                    upserts,
+                )
+        except sqlite3.Error:
+            # Keep the changes for the next flush.
+            with self._lock:
+                for key, ts in upserts:
+                    if key in self._entries:
+                        self._upserts.setdefault(key, ts)
+                self._deletes.update(k for (k,) in deletes if k not in self._entries)
+            raise
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import requests
+
+from agent import run_agent
+from config import AgentConfig
+from spooler import SimulatedSpooler
+
+
+# Runs many agents in one process, each with its own simulated spooler and
+# state directory, against a real server. Works on any OS:
+#
+#   python load_test.py --server http://127.0.0.1:8088 --agents 200 --duration 120
+
+
+def _count(db_path: str, table: str) -> int:
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            return int(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0])
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the server with simulated print agents.")
+    parser.add_argument("--server", default="http://127.0.0.1:8088")
+    parser.add_argument("--agents", type=int, default=100)
+    parser.add_argument("--printers-per-agent", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=60, help="seconds of job generation")
+    parser.add_argument("--drain", type=float, default=30, help="seconds to let queued jobs finish and send")
+    parser.add_argument("--poll", type=int, default=2, help="agent poll interval (seconds)")
+    parser.add_argument("--jobs-per-min", type=float, default=2.0, help="per simulated printer")
+    parser.add_argument("--burst-prob", type=float, default=0.1)
+    parser.add_argument("--long-job-prob", type=float, default=0.05)
+    parser.add_argument("--pages-per-sec", type=float, default=0.5)
+    parser.add_argument("--state-dir", default="", help="default: a new temporary directory")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    base_dir = args.state_dir or tempfile.mkdtemp(prefix="agent-load-")
+    stop_event = threading.Event()
+    agents = []
+    for i in range(args.agents):
+        agent_name = f"SIM-{i:04d}"
+        printers = [f"{agent_name}-{p}" for p in range(max(1, args.printers_per_agent))]
+        spooler = SimulatedSpooler(
+            printers,
+            jobs_per_min=args.jobs_per_min,
+            burst_prob=args.burst_prob,
+            long_job_prob=args.long_job_prob,
+            pages_per_sec=args.pages_per_sec,
+            seed=args.seed + i,
+        )
+        cfg = AgentConfig(
+            server_url=args.server,
+            printer_name="",
+            poll_interval_sec=args.poll,
+            start_with_windows=False,
+            monitor_all_printers=True,
+        )
+        state_dir = os.path.join(base_dir, agent_name)
+        os.makedirs(state_dir, exist_ok=True)
+        thread = threading.Thread(
+            target=run_agent, args=(cfg, stop_event, spooler, state_dir), name=f"agent-{agent_name}", daemon=True
+        )
+        agents.append((spooler, state_dir, thread))
+
+    print(f"starting {args.agents} agents, state in {base_dir}")
+    started = time.time()
+    for _, _, thread in agents:
+        thread.start()
+    time.sleep(args.duration)
+    for spooler, _, _ in agents:
+        spooler.stop_arrivals()
+    time.sleep(args.drain)
+    stop_event.set()
+    for _, _, thread in agents:
+        thread.join(timeout=10)
+    elapsed = time.time() - started
+
+    generated = captured = pending = pages = 0
+    for spooler, state_dir, _ in agents:
+        stats = spooler.stats()
+        generated += stats["generated"]
+        pages += stats["generated_pages"]
+        captured += _count(os.path.join(state_dir, "seen.db"), "seen_jobs")
+        pending += _count(os.path.join(state_dir, "outbox.db"), "outbox")
+    result = {
+        "agents": args.agents,
+        "printers": args.agents * max(1, args.printers_per_agent),
+        "elapsed_sec": round(elapsed, 1),
+        "jobs_generated": generated,
+        "pages_generated": pages,
+        "jobs_captured": captured,
+        "jobs_missed": generated - captured,
+        "jobs_delivered": captured - pending,
+        "jobs_pending": pending,
+        "delivered_per_sec": round((captured - pending) / elapsed, 1) if elapsed else 0.0,
+    }
+    try:
+        result["server"] = requests.get(args.server.rstrip("/") + "/api/metrics", timeout=10).json()
+    except Exception as e:
+        result["server"] = f"metrics unavailable: {e}"
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class Rejected(Exception):
+    # Raised by the send function when the server refused records for good
+    # (per-record errors or 422); `indexes` names the refused records of the
+    # batch when the server said which, otherwise the whole batch was refused.
+    def __init__(self, message: str, indexes: Optional[Sequence[int]] = None) -> None:
+        super().__init__(message)
+        self.indexes = list(indexes) if indexes is not None else None
+
+
+class Outbox:
+    # Durable queue of job records waiting to be sent to the server. Jobs are
+    # written here before anything else, so a server outage or an agent
+    # restart loses nothing; rows are deleted only after the server accepted
+    # them. Records the server refused are moved to `dead_letter` with the
+    # error, for inspection, instead of being retried forever.
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(outbox)")}
+        if "attempts" not in columns:
+            # Outboxes created by older agents.
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS dead_letter (
+                id INTEGER PRIMARY KEY,
+                created_at REAL NOT NULL,
+                failed_at REAL NOT NULL,
+                attempts INTEGER NOT NULL,
+                error TEXT,
+                payload TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def put(self, records: List[Dict]) -> None:
+        if not records:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO outbox (created_at, payload) VALUES (?, ?)",
+                [(now, json.dumps(r, ensure_ascii=False)) for r in records],
+            )
+            self._conn.commit()
+
+    def peek(self, limit: int) -> List[Tuple[int, float, Dict]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, created_at, payload FROM outbox ORDER BY id LIMIT ?", (int(limit),)
+            ).fetchall()
+        return [(r[0], r[1], json.loads(r[2])) for r in rows]
+
+    def ack(self, ids: List[int]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM outbox WHERE id=?", [(i,) for i in ids])
+            self._conn.commit()
+
+    def fail(self, ids: List[int]) -> None:
+        # Counts one more failed delivery attempt for each row.
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany("UPDATE outbox SET attempts = attempts + 1 WHERE id=?", [(i,) for i in ids])
+            self._conn.commit()
+
+    def dead_letter(self, ids: List[int], error: str) -> None:
+        # Moves rows the server refused out of the queue, in one transaction.
+        if not ids:
+            return
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO dead_letter (id, created_at, failed_at, attempts, error, payload) "
+                    "SELECT id, created_at, ?, attempts + 1, ?, payload FROM outbox WHERE id=?",
+                    [(now, error, i) for i in ids],
+                )
+                self._conn.executemany("DELETE FROM outbox WHERE id=?", [(i,) for i in ids])
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0])
+
+    def dead_count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class OutboxSender(threading.Thread):
+    # Drains the outbox in batches of up to `batch_size` records. A partial
+    # batch waits until its oldest record is `max_wait_sec` old, so bursts
+    # (and everything queued during an outage) go out in few requests.
+    # Any error other than Rejected (transport, 5xx, a proxy's 401/403/413,
+    # a 404 from a wrong server_url) keeps the batch and backs off
+    # exponentially with jitter, up to `max_backoff_sec`, so agents
+    # reconnecting after a server restart do not all retry at once. A
+    # Rejected batch is not retried: the refused records go to the
+    # dead-letter table (a batch refused as a whole is re-sent one record at
+    # a time to find them) and the rest are delivered. `send` may also
+    # return {index: error} for records the server skipped while storing the
+    # others; those are dead-lettered and the batch acked.
+    def __init__(
+        self,
+        outbox: Outbox,
+        send: Callable[[List[Dict]], Optional[Dict[int, str]]],
+        stop_event: Optional[threading.Event] = None,
+        batch_size: int = 200,
+        max_wait_sec: float = 2.0,
+        base_backoff_sec: float = 1.0,
+        max_backoff_sec: float = 300.0,
+    ) -> None:
+        super().__init__(name="outbox-sender", daemon=True)
+        self.outbox = outbox
+        self.send = send
+        self.stop_event = stop_event or threading.Event()
+        self.batch_size = max(1, int(batch_size))
+        self.max_wait_sec = float(max_wait_sec)
+        self.base_backoff_sec = float(base_backoff_sec)
+        self.max_backoff_sec = float(max_backoff_sec)
+        self._wake = threading.Event()
+        self._failures = 0
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def _sleep(self, seconds: float) -> None:
+        self._wake.wait(timeout=max(0.05, seconds))
+        self._wake.clear()
+
+    def _backoff(self) -> float:
+        delay = min(self.max_backoff_sec, self.base_backoff_sec * (2 ** min(self._failures, 16)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                rows = self.outbox.peek(self.batch_size)
+            except sqlite3.Error:
+                self._sleep(5)
+                continue
+            if not rows:
+                self._sleep(self.max_wait_sec)
+                continue
+            age = time.time() - rows[0][1]
+            if len(rows) < self.batch_size and age < self.max_wait_sec:
+                self._sleep(self.max_wait_sec - age)
+                continue
+            try:
+                self._deliver(rows)
+            except Exception as e:
+                self._failures += 1
+                log.warning("outbox: %d records kept for retry (failure %d): %s", len(rows), self._failures, e)
+                try:
+                    self.outbox.fail([r[0] for r in rows])
+                except sqlite3.Error:
+                    pass
+                # Not _sleep(): new jobs must not cut a backoff short.
+                self.stop_event.wait(self._backoff())
+                continue
+            self._failures = 0
+
+    def _deliver(self, rows: List[Tuple[int, float, Dict]]) -> None:
+        # Raises only for errors worth retrying; acked and dead-lettered rows
+        # are final.
+        try:
+            skipped = self.send([r[2] for r in rows]) or {}
+        except Rejected as e:
+            refused = {rows[i][0] for i in e.indexes or () if 0 <= i < len(rows)}
+            if not refused and len(rows) > 1:
+                for row in rows:
+                    self._deliver([row])
+                return
+            refused = refused or {rows[0][0]}
+            self.outbox.dead_letter(sorted(refused), str(e))
+            rest = [r for r in rows if r[0] not in refused]
+            if rest:
+                self._deliver(rest)
+            return
+        errors: Dict[str, List[int]] = {}
+        for i, error in skipped.items():
+            if 0 <= i < len(rows):
+                errors.setdefault(error, []).append(rows[i][0])
+        for error, ids in errors.items():
+            log.warning("outbox: %d records refused by the server: %s", len(ids), error)
+            self.outbox.dead_letter(ids, error)
+        self.outbox.ack([r[0] for r in rows])
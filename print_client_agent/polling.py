@@ -0,0 +1,95 @@
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+
+class AdaptivePoll:
+    # Picks the wait before the next spooler poll. While any monitored queue
+    # holds jobs the agent polls every `fast_sec`, so short jobs in a burst are
+    # not missed; for `idle_after_sec` after the queues empty it polls at the
+    # configured `normal_sec`; after that the interval doubles up to
+    # `idle_sec`, so idle desktops stop churning OpenPrinter/EnumJobs.
+    def __init__(
+        self,
+        normal_sec: float,
+        fast_sec: float = 1.0,
+        idle_sec: float = 30.0,
+        idle_after_sec: float = 120.0,
+    ) -> None:
+        self.fast_sec = max(0.5, float(fast_sec))
+        self.normal_sec = max(self.fast_sec, float(normal_sec))
+        self.idle_sec = max(self.normal_sec, float(idle_sec))
+        self.idle_after_sec = max(0.0, float(idle_after_sec))
+        self.current = self.normal_sec
+        self._last_active = time.monotonic()
+
+    def next_interval(self, queued_jobs: int) -> float:
+        now = time.monotonic()
+        if queued_jobs:
+            self._last_active = now
+            self.current = self.fast_sec
+        elif now - self._last_active < self.idle_after_sec:
+            self.current = self.normal_sec
+        else:
+            self.current = min(self.idle_sec, max(self.normal_sec, self.current * 2))
+        return self.current
+
+
+# JobIds jumping further than this are taken as a spooler restart or wrap,
+# not as missed jobs.
+_MAX_JOB_ID_GAP = 1000
+
+
+class PollStats:
+    # Counters reported with the heartbeat. Missed jobs are estimated from
+    # gaps in the spooler's JobId sequence, which is shared by all printers of
+    # the machine: a gap is a job that came and went between two polls. Jobs
+    # sent to printers the agent does not monitor also leave gaps, so with a
+    # subset of printers the figure is an upper bound.
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.polls = 0
+        self.poll_sec_total = 0.0
+        self.jobs_seen = 0
+        self.jobs_missed = 0
+        self._last_job_id: Optional[int] = None
+        self._window_wall = time.monotonic()
+        self._window_cpu = time.process_time()
+
+    def note_poll(self, seconds: float) -> None:
+        with self._lock:
+            self.polls += 1
+            self.poll_sec_total += seconds
+
+    def note_new_jobs(self, job_ids: Iterable) -> None:
+        ids = sorted(int(i) for i in job_ids if isinstance(i, int) or str(i).isdigit())
+        with self._lock:
+            self.jobs_seen += len(ids)
+            for job_id in ids:
+                last = self._last_job_id
+                if last is None or job_id < last - _MAX_JOB_ID_GAP or job_id > last + _MAX_JOB_ID_GAP:
+                    # First job since start, or the sequence restarted.
+                    self._last_job_id = job_id
+                    continue
+                if job_id > last:
+                    self.jobs_missed += job_id - last - 1
+                    self._last_job_id = job_id
+
+    def snapshot(self, interval_sec: float) -> Dict:
+        # CPU use of the agent process since the previous snapshot.
+        wall = time.monotonic()
+        cpu = time.process_time()
+        with self._lock:
+            elapsed = wall - self._window_wall
+            cpu_pct = 100.0 * (cpu - self._window_cpu) / elapsed if elapsed > 0 else 0.0
+            self._window_wall, self._window_cpu = wall, cpu
+            total = self.jobs_seen + self.jobs_missed
+            return {
+                "poll_interval_sec": round(interval_sec, 2),
+                "polls": self.polls,
+                "poll_ms_avg": round(1000.0 * self.poll_sec_total / self.polls, 2) if self.polls else 0.0,
+                "jobs_seen": self.jobs_seen,
+                "jobs_missed_est": self.jobs_missed,
+                "miss_rate": round(self.jobs_missed / total, 4) if total else 0.0,
+                "cpu_pct": round(cpu_pct, 2),
+            }
@@ -0,0 +1,214 @@
+import abc
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+
+class SpoolerBackend(abc.ABC):
+    # What the agent needs from the print spooler. Jobs are returned in the
+    # shape of win32print.EnumJobs level 1 (JobId, pUserName, pDocument,
+    # TotalPages, PagesPrinted, Submitted, ...).
+    @abc.abstractmethod
+    def list_printers(self) -> List[str]:
+        ...
+
+    @abc.abstractmethod
+    def enum_jobs(self, printer_name: str) -> List[Dict]:
+        ...
+
+    def printer_model(self, printer_name: str) -> str:
+        return ""
+
+    def default_printer(self) -> str:
+        return ""
+
+
+class Win32Spooler(SpoolerBackend):
+    def __init__(self) -> None:
+        import win32print
+
+        self._win32print = win32print
+
+    def list_printers(self) -> List[str]:
+        wp = self._win32print
+        printers = wp.EnumPrinters(wp.PRINTER_ENUM_LOCAL | wp.PRINTER_ENUM_CONNECTIONS)
+        return [p[2] for p in printers]
+
+    def enum_jobs(self, printer_name: str) -> List[Dict]:
+        wp = self._win32print
+        handle = wp.OpenPrinter(printer_name)
+        try:
+            return wp.EnumJobs(handle, 0, -1, 1)
+        finally:
+            wp.ClosePrinter(handle)
+
+    def printer_model(self, printer_name: str) -> str:
+        wp = self._win32print
+        try:
+            handle = wp.OpenPrinter(printer_name)
+            try:
+                info = wp.GetPrinter(handle, 2) or {}
+                return str(info.get("pDriverName", "") or "").strip()
+            finally:
+                wp.ClosePrinter(handle)
+        except Exception:
+            return ""
+
+    def default_printer(self) -> str:
+        try:
+            return str(self._win32print.GetDefaultPrinter() or "").strip()
+        except Exception:
+            return ""
+
+
+# Spooler status flags reported by the simulator (subset of JOB_STATUS_*).
+JOB_STATUS_SPOOLING = 0x0008
+JOB_STATUS_PRINTING = 0x0010
+
+_DOCUMENTS = ("Relatorio.pdf", "Planilha.xlsx", "Contrato.docx", "Boleto.pdf", "Apresentacao.pptx", "Email")
+
+
+class SimulatedSpooler(SpoolerBackend):
+    # Pure-Python stand-in for the Windows spooler, for load tests and
+    # benchmarks away from a Windows desktop. Each printer receives jobs as a
+    # Poisson stream of `jobs_per_min`; with probability `burst_prob` an
+    # arrival is a burst of several jobs at once (a mail merge, a batch of
+    # invoices) and with `long_job_prob` a long document. A job first spools,
+    # with TotalPages growing as the application writes it, then prints at
+    # `pages_per_sec` with PagesPrinted increasing, and leaves the queue when
+    # done. Printers print one job at a time, so bursts build a queue.
+    #
+    # The state advances on every call, from the time elapsed since the last
+    # one; `clock` can be replaced to drive it faster than real time.
+    def __init__(
+        self,
+        printers: List[str],
+        jobs_per_min: float = 2.0,
+        burst_prob: float = 0.1,
+        burst_size: int = 20,
+        long_job_prob: float = 0.05,
+        pages_per_sec: float = 0.5,
+        users: int = 20,
+        model: str = "Simulated PCL6",
+        seed: Optional[int] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.printers = list(printers)
+        self.jobs_per_min = float(jobs_per_min)
+        self.burst_prob = float(burst_prob)
+        self.burst_size = max(1, int(burst_size))
+        self.long_job_prob = float(long_job_prob)
+        self.pages_per_sec = max(0.01, float(pages_per_sec))
+        self.users = [f"user{i:03d}" for i in range(max(1, int(users)))]
+        self.model = model
+        self.clock = clock
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._queues: Dict[str, List[Dict]] = {p: [] for p in self.printers}
+        self._next_arrival = {p: self.clock() + self._interarrival() for p in self.printers}
+        self._last = {p: self.clock() for p in self.printers}
+        self._next_job_id = self._rng.randint(1, 500)
+        self.generated = 0
+        self.generated_pages = 0
+        self.completed = 0
+
+    def _interarrival(self) -> float:
+        if self.jobs_per_min <= 0:
+            return float("inf")
+        return self._rng.expovariate(self.jobs_per_min / 60.0)
+
+    def _new_job(self, printer: str, now: float) -> Dict:
+        rng = self._rng
+        if rng.random() < self.long_job_prob:
+            pages = rng.randint(100, 1000)
+        else:
+            pages = max(1, int(rng.expovariate(1 / 4.0)))
+        self._next_job_id += 1
+        self.generated += 1
+        self.generated_pages += pages
+        return {
+            "JobId": self._next_job_id,
+            "pPrinterName": printer,
+            "pMachineName": "\\\\SIMULATED",
+            "pUserName": rng.choice(self.users),
+            "pDocument": rng.choice(_DOCUMENTS),
+            "pDatatype": "RAW",
+            "pStatus": None,
+            "Status": JOB_STATUS_SPOOLING,
+            "Priority": 1,
+            "Position": 0,
+            "TotalPages": 0,
+            "PagesPrinted": 0,
+            "Copies": 1,
+            # Seconds precision, like the spooler's SYSTEMTIME.
+            "Submitted": datetime.fromtimestamp(int(now)),
+            # Simulator state, stripped from the returned snapshots.
+            "_pages": pages,
+            "_spool_rate": max(pages / 5.0, 5.0),
+            "_spooled": 0.0,
+            "_printed": 0.0,
+        }
+
+    def _advance(self, printer: str, now: float) -> None:
+        queue = self._queues[printer]
+        while self._next_arrival[printer] <= now:
+            at = self._next_arrival[printer]
+            count = self._rng.randint(2, self.burst_size) if self._rng.random() < self.burst_prob else 1
+            for _ in range(count):
+                queue.append(self._new_job(printer, at))
+            self._next_arrival[printer] = at + self._interarrival()
+        elapsed = max(0.0, now - self._last[printer])
+        self._last[printer] = now
+        for job in queue:
+            if job["_spooled"] < job["_pages"]:
+                job["_spooled"] = min(job["_pages"], job["_spooled"] + job["_spool_rate"] * elapsed)
+                job["TotalPages"] = int(job["_spooled"])
+        budget = elapsed * self.pages_per_sec
+        while queue and budget > 0:
+            job = queue[0]
+            # Printing may start before spooling ends, but never overtakes it.
+            printable = job["_spooled"] - job["_printed"]
+            step = min(budget, printable)
+            job["_printed"] += step
+            budget -= step
+            job["PagesPrinted"] = int(job["_printed"])
+            job["Status"] = JOB_STATUS_PRINTING
+            if job["_printed"] < job["_pages"]:
+                break
+            queue.pop(0)
+            self.completed += 1
+        for position, job in enumerate(queue, start=1):
+            job["Position"] = position
+
+    def stop_arrivals(self) -> None:
+        # Jobs already queued keep printing; no new ones arrive.
+        with self._lock:
+            self.jobs_per_min = 0.0
+            self._next_arrival = {p: float("inf") for p in self.printers}
+
+    def list_printers(self) -> List[str]:
+        return list(self.printers)
+
+    def enum_jobs(self, printer_name: str) -> List[Dict]:
+        if printer_name not in self._queues:
+            raise ValueError(f"unknown printer: {printer_name}")
+        with self._lock:
+            self._advance(printer_name, self.clock())
+            return [{k: v for k, v in job.items() if not k.startswith("_")} for job in self._queues[printer_name]]
+
+    def printer_model(self, printer_name: str) -> str:
+        return self.model if printer_name in self._queues else ""
+
+    def default_printer(self) -> str:
+        return self.printers[0] if self.printers else ""
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "generated": self.generated,
+                "generated_pages": self.generated_pages,
+                "completed": self.completed,
+                "queued": sum(len(q) for q in self._queues.values()),
+            }
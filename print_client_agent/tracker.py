@@ -0,0 +1,77 @@
+from typing import Callable, Dict, List, Optional
+
+
+# JOB_STATUS_* bits of JOB_INFO_1.Status.
+JOB_STATUS_DELETING = 0x0004
+JOB_STATUS_PRINTED = 0x0080
+JOB_STATUS_DELETED = 0x0100
+JOB_STATUS_COMPLETE = 0x1000
+
+
+class JobTracker:
+    # Follows every job in the monitored queues from its first EnumJobs
+    # snapshot until it leaves the queue. While spooling/printing TotalPages
+    # and PagesPrinted are often 0 or partial, so the first record sent to the
+    # server is provisional; once the job is gone, final_pages() gives the
+    # definitive count from the highest values observed. Only jobs currently
+    # in a queue are held, so memory follows the queue length.
+    def __init__(self, key: Callable[[Dict], str]) -> None:
+        self._key = key
+        self._jobs: Dict[str, Dict] = {}
+
+    def update(self, printer_name: str, jobs: List[Dict]) -> List[Dict]:
+        # Records the snapshot of one printer's queue and returns the tracked
+        # jobs of that printer that are no longer in it. They stay tracked
+        # until forget(), so a failed send is retried on the next poll.
+        present = set()
+        for job in jobs:
+            key = self._key(job)
+            present.add(key)
+            state = self._jobs.get(key)
+            if state is None:
+                state = self._jobs[key] = {
+                    "key": key,
+                    "printer": printer_name,
+                    "total_pages": 0,
+                    "pages_printed": 0,
+                    "reported_pages": None,
+                }
+            state["job"] = job
+            state["status"] = int(job.get("Status") or 0)
+            state["total_pages"] = max(state["total_pages"], int(job.get("TotalPages") or 0))
+            state["pages_printed"] = max(state["pages_printed"], int(job.get("PagesPrinted") or 0))
+        return [s for k, s in self._jobs.items() if s["printer"] == printer_name and k not in present]
+
+    def note_reported(self, key: str, pages: int) -> None:
+        state = self._jobs.get(key)
+        if state is not None:
+            state["reported_pages"] = pages
+
+    def forget(self, keys: List[str]) -> None:
+        for key in keys:
+            self._jobs.pop(key, None)
+
+    def drop_printers(self, printer_names: List[str]) -> None:
+        # Printers no longer monitored: their jobs cannot be followed anymore.
+        names = set(printer_names)
+        self._jobs = {k: s for k, s in self._jobs.items() if s["printer"] not in names}
+
+    @staticmethod
+    def final_pages(state: Dict) -> int:
+        status = state.get("status", 0)
+        cancelled = status & (JOB_STATUS_DELETING | JOB_STATUS_DELETED) and not status & (
+            JOB_STATUS_PRINTED | JOB_STATUS_COMPLETE
+        )
+        if cancelled:
+            # Only what reached the printer before the cancel counts.
+            return state["pages_printed"]
+        return max(state["total_pages"], state["pages_printed"])
+
+    @staticmethod
+    def needs_final(state: Dict) -> bool:
+        # False when the provisional record already had the right count.
+        reported: Optional[int] = state.get("reported_pages")
+        return reported is None or reported != JobTracker.final_pages(state)
+
+    def __len__(self) -> int:
+        return len(self._jobs)
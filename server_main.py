@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 import subprocess
 import sys
@@ -65,6 +66,8 @@ def _run_embedded_server() -> None:
 
 
 if __name__ == "__main__":
+    # Report renderer processes re-launch this executable when frozen.
+    multiprocessing.freeze_support()
     # EXE behavior: launcher installs/starts service automatically.
     if getattr(sys, "frozen", False):
         if _try_install_and_start_service():
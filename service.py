@@ -1,3 +1,4 @@
+import multiprocessing
 import threading
 import traceback
 
@@ -62,4 +63,6 @@ class PrintServerDashboardService(win32serviceutil.ServiceFramework):
 
 
 if __name__ == "__main__":
+    # Report renderer processes re-launch this executable when frozen.
+    multiprocessing.freeze_support()
     win32serviceutil.HandleCommandLine(PrintServerDashboardService)
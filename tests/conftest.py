@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "print_client_agent"))
+
+# app.main reads its configuration at import time; keep it away from real
+# PaperCut servers, printers and the bundled database.
+_TMP = tempfile.mkdtemp(prefix="pcdash-test-")
+os.environ["DB_PATH"] = os.path.join(_TMP, "test.db")
+os.environ["PRINTER_POLL_ENABLED"] = "false"
+os.environ["PAPERCUT_LOG_DIR"] = os.path.join(_TMP, "no-logs")
+os.environ["REPORT_CACHE_DIR"] = os.path.join(_TMP, "reports")
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as c:
+        yield c
@@ -0,0 +1,102 @@
+import gzip
+import json
+
+from agent import _poll_loop, resolve_printer_names
+from config import AgentConfig
+from dedup import SeenJobs
+from outbox import Outbox
+from spooler import SpoolerBackend
+
+
+class _Spooler(SpoolerBackend):
+    def __init__(self, queues, broken=()):
+        self.queues = queues
+        self.broken = set(broken)
+        self.polled = []
+
+    def list_printers(self):
+        return list(self.queues)
+
+    def enum_jobs(self, printer_name):
+        self.polled.append(printer_name)
+        if printer_name in self.broken:
+            raise OSError("printer offline")
+        return self.queues.get(printer_name, [])
+
+    def printer_model(self, printer_name):
+        return f"{printer_name} PCL6"
+
+    def default_printer(self):
+        return "Default"
+
+
+class _Session:
+    def __init__(self):
+        self.posts = []
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        if (headers or {}).get("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        self.posts.append((url, json.loads(data)))
+
+
+class _Sender:
+    def __init__(self):
+        self.notified = 0
+
+    def notify(self):
+        self.notified += 1
+
+
+class _StopAfter:
+    def __init__(self, polls):
+        self.polls = polls
+        self.intervals = []
+
+    def is_set(self):
+        return len(self.intervals) >= self.polls
+
+    def wait(self, timeout):
+        self.intervals.append(timeout)
+
+
+def _cfg(**kwargs):
+    kwargs.setdefault("server_url", "http://127.0.0.1:9")
+    kwargs.setdefault("printer_name", "A")
+    kwargs.setdefault("poll_interval_sec", 5)
+    kwargs.setdefault("start_with_windows", False)
+    return AgentConfig(**kwargs)
+
+
+def _job(job_id, pages=2):
+    return {"JobId": job_id, "pUserName": "ana", "pDocument": f"d{job_id}", "TotalPages": pages, "Submitted": "2024-05-01 09:00"}
+
+
+def test_printer_names_are_resolved_without_duplicates():
+    spooler = _Spooler({"A": [], "B": [], "C": []})
+    assert resolve_printer_names(_cfg(printer_names=["B", "A", " "]), spooler) == ["A", "B"]
+    assert resolve_printer_names(_cfg(printer_names=["B"], monitor_default_printer=True), spooler) == ["Default", "A", "B"]
+    assert resolve_printer_names(_cfg(monitor_all_printers=True), spooler) == ["A", "B", "C"]
+
+
+def test_one_loop_polls_every_printer_and_skips_a_failing_queue(tmp_path):
+    spooler = _Spooler({"A": [_job(1)], "B": [_job(2)], "C": [_job(3), _job(4)]}, broken={"B"})
+    session = _Session()
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    seen = SeenJobs(str(tmp_path / "seen.db"))
+    sender = _Sender()
+    stop = _StopAfter(polls=2)
+
+    _poll_loop(_cfg(printer_names=["B", "C"]), stop, spooler, session, outbox, sender, seen)
+
+    assert spooler.polled == ["A", "B", "C", "A", "B", "C"]
+    records = [r[2] for r in outbox.peek(10)]
+    assert sorted((r["printer"], r["job_id"]) for r in records) == [("A", 1), ("C", 3), ("C", 4)]
+    assert {r["printer_model"] for r in records} == {"A PCL6", "C PCL6"}
+    assert sender.notified == 1  # the second poll found nothing new
+    assert stop.intervals == [1.0, 1.0]  # jobs still queued: fast polling
+    heartbeats = [p for url, p in session.posts if url.endswith("/api/agents/heartbeat")]
+    assert len(heartbeats) == 1
+    assert [p["printer_name"] for p in heartbeats[0]["printers"]] == ["A", "B", "C"]
+    outbox.close()
+    seen.close()
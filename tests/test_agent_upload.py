@@ -0,0 +1,75 @@
+import gzip
+import os
+from urllib.parse import urlparse
+
+import agent
+from agent import GZIP_MIN_BYTES, make_session, post_jobs, send_heartbeat
+from app.storage import list_client_agents
+
+
+class _AppSession:
+    # Hands the agent's requests to the app under test, keeping the exact
+    # body bytes and headers the agent produced.
+    def __init__(self, client):
+        self.client = client
+        self.sent = []
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        self.sent.append((headers or {}, data))
+        return self.client.post(urlparse(url).path, content=data, headers=headers)
+
+
+def _records(n):
+    return [
+        {
+            "printer": "P-gzip",
+            "submitted": f"2024-06-01T10:{i // 60:02d}:{i % 60:02d}",
+            "job_id": f"gz-{i}",
+            "client_host": "pc-gzip",
+            "user": "ana",
+            "document": "Relatorio mensal.pdf",
+            "pages": 3,
+        }
+        for i in range(n)
+    ]
+
+
+def test_large_batches_are_sent_gzipped_and_stored(client):
+    session = _AppSession(client)
+    assert post_jobs(session, "http://server/", _records(1)) == {}
+    headers, body = session.sent[-1]
+    assert "Content-Encoding" not in headers
+    assert len(body) < GZIP_MIN_BYTES
+
+    assert post_jobs(session, "http://server", _records(100)) == {}
+    headers, body = session.sent[-1]
+    assert headers["Content-Encoding"] == "gzip"
+    assert len(body) < len(gzip.decompress(body)) / 4
+    jobs = client.get("/api/jobs", params={"printer": "P-gzip", "limit": 500}).json()
+    assert len(jobs) == 100
+
+
+def test_gzipped_heartbeat_registers_every_printer(client, monkeypatch):
+    monkeypatch.setattr(agent, "GZIP_MIN_BYTES", 0)
+    session = _AppSession(client)
+    send_heartbeat(session, "http://server", {"P-hb1": "HP", "P-hb2": "Canon"}, "10.0.0.9")
+    assert session.sent[-1][0]["Content-Encoding"] == "gzip"
+    host = agent.host_name()
+    rows = {a["agent_id"]: a for a in list_client_agents(os.environ["DB_PATH"])}
+    assert rows[f"{host}|P-hb1"]["printer_model"] == "HP"
+    assert rows[f"{host}|P-hb2"]["ip"] == "10.0.0.9"
+
+
+def test_invalid_gzip_body_is_refused(client):
+    headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    resp = client.post("/api/client-jobs", content=b"not gzip", headers=headers)
+    assert resp.status_code == 400
+    assert resp.json()["ok"] is False
+
+
+def test_session_reuses_connections():
+    session = make_session()
+    adapter = session.get_adapter("https://server")
+    assert adapter._pool_maxsize == 4
+    assert session.headers["User-Agent"] == f"PrintClientAgent/{agent.AGENT_VERSION}"
+    session.close()
@@ -0,0 +1,52 @@
+import sqlite3
+
+from app.storage import _job_hash, init_db, insert_client_jobs
+
+
+def _record(pages, final=False):
+    rec = {
+        "client_host": "pc1",
+        "printer": "P1",
+        "job_id": "7",
+        "submitted": "2024-04-01T09:00:00",
+        "user": "ana",
+        "document": "a.pdf",
+        "pages": pages,
+        "copies": 1,
+    }
+    if final:
+        rec["final"] = True
+    return rec
+
+
+def _rows(db):
+    conn = sqlite3.connect(db)
+    rows = conn.execute("SELECT job_hash, pages, pages_final FROM jobs ORDER BY id").fetchall()
+    conn.close()
+    return rows
+
+
+def test_records_of_one_job_in_a_batch_update_a_single_row(tmp_path):
+    db = str(tmp_path / "j.db")
+    init_db(db)
+    assert insert_client_jobs(db, [_record(2), _record(5), _record(4, final=True), _record(9)]) == 1
+    assert _rows(db) == [("client|pc1|P1|7|2024-04-01T09:00:00", 4, 1)]
+
+
+def test_rows_stored_under_the_old_content_hash_are_rekeyed(tmp_path):
+    db = str(tmp_path / "j.db")
+    init_db(db)
+    conn = sqlite3.connect(db)
+    old = {"source": "client", "client_host": "pc1", "job_id": "7", "timestamp": "2024-04-01T09:00:00",
+           "user": "ana", "printer": "P1", "document": "a.pdf", "pages": 2, "copies": 1}
+    conn.execute(
+        "INSERT INTO jobs (job_hash, timestamp, user, printer, document, pages, copies, source, client_host, job_id) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (_job_hash(old), old["timestamp"], "ana", "P1", "a.pdf", 2, 1, "client", "pc1", "7"),
+    )
+    conn.execute("DELETE FROM sync_state WHERE name='migration_client_job_keys'")
+    conn.commit()
+    conn.close()
+    init_db(db)
+    assert insert_client_jobs(db, [_record(3, final=True)]) == 0
+    assert _rows(db) == [("client|pc1|P1|7|2024-04-01T09:00:00", 3, 1)]
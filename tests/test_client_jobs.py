@@ -0,0 +1,56 @@
+import os
+
+from app.main import _client_agents
+from app.storage import init_db, insert_client_batch, list_client_agents, table_versions
+
+
+def _agent_record(i, version="1.0", model="HP M404"):
+    return {
+        "printer": "P-dedup",
+        "printer_model": model,
+        "submitted": f"2024-03-03T10:00:{i:02d}",
+        "job_id": f"dedup-{i}",
+        "client_host": "pc-dedup",
+        "agent_version": version,
+        "pages": 1,
+    }
+
+
+def test_non_object_records_are_skipped_and_the_rest_stored(client):
+    good = {"printer": "P-cj", "submitted": "2024-02-02T10:00:00", "job_id": "x1", "client_host": "pc-cj"}
+    legacy = {"printer": "P-cj", "document": "no submitted time"}
+    resp = client.post("/api/client-jobs", json=["str", good, 5, legacy])
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["ok"] is True
+    assert body["inserted"] == 2
+    assert [e["index"] for e in body["errors"]] == [0, 2]
+    assert "errors" not in client.post("/api/client-jobs", json=[good]).json()
+
+
+def test_a_batch_registers_each_agent_once_with_its_last_record():
+    records = [_agent_record(i) for i in range(5)] + [_agent_record(5, version="1.1", model="HP M406")]
+    records.append(dict(_agent_record(6, model="HP M406"), client_host="pc-other"))
+    agents, printer_models = _client_agents(records)
+    assert sorted(a["agent_id"] for a in agents) == ["pc-dedup|P-dedup", "pc-other|P-dedup"]
+    assert next(a for a in agents if a["host"] == "pc-dedup")["version"] == "1.1"
+    assert printer_models == {"P-dedup": "HP M406"}
+
+
+def test_client_batch_is_one_transaction(tmp_path):
+    db = str(tmp_path / "b.db")
+    init_db(db)
+    tables = ("jobs", "client_agents", "printer_models")
+    records = [_agent_record(i) for i in range(200)]
+    agents, printer_models = _client_agents(records)
+    before = table_versions(db, tables)
+    assert insert_client_batch(db, agents, printer_models, records) == (200, 0)
+    after = table_versions(db, tables)
+    assert {t: after[t] - before[t] for t in tables} == {t: 1 for t in tables}
+    assert [a["agent_id"] for a in list_client_agents(db)] == ["pc-dedup|P-dedup"]
+
+
+def test_posted_batch_updates_the_agent_row(client):
+    client.post("/api/client-jobs", json=[_agent_record(i, version="2.0") for i in range(3)])
+    rows = [a for a in list_client_agents(os.environ["DB_PATH"]) if a["host"] == "pc-dedup"]
+    assert [(a["agent_id"], a["version"], a["printer_model"]) for a in rows] == [("pc-dedup|P-dedup", "2.0", "HP M404")]
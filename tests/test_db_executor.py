@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.db_executor import DBExecutor
+from app.storage import get_sync_state, init_db, set_sync_state
+
+
+def _fail(db_path):
+    set_sync_state(db_path, "doomed", {"x": 1})
+    raise ValueError("boom")
+
+
+def test_concurrent_writes_share_commits_and_failures_stay_isolated(tmp_path):
+    db = str(tmp_path / "w.db")
+    init_db(db)
+    executor = DBExecutor(db, commit_window_ms=50)
+    futures = [executor.submit_write(set_sync_state, db, f"k{i}", {"i": i}) for i in range(20)]
+    bad = executor.submit_write(_fail, db)
+    for f in futures:
+        f.result(timeout=10)
+    with pytest.raises(ValueError):
+        bad.result(timeout=10)
+    stats = executor.stats()
+    assert stats["write_ops"] == 21
+    assert stats["commits"] < 21
+    assert get_sync_state(db, "k19") == {"i": 19}
+    # The failing op was rolled back to its savepoint.
+    assert get_sync_state(db, "doomed") == {}
+    executor.shutdown()
+
+
+def test_shutdown_does_not_hang_on_a_full_queue(tmp_path):
+    db = str(tmp_path / "w.db")
+    init_db(db)
+    executor = DBExecutor(db, queue_size=1, commit_window_ms=0)
+    release = threading.Event()
+    executor.submit_write(lambda: release.wait(10))
+    time.sleep(0.1)  # the writer is now blocked inside that op
+    executor.submit_write(lambda: None)  # fills the queue
+    started = time.monotonic()
+    executor.shutdown(timeout=0.2)
+    assert time.monotonic() - started < 2
+    release.set()
+
+
+def test_async_reads_and_writes_leave_the_event_loop_free(tmp_path):
+    db = str(tmp_path / "w.db")
+    init_db(db)
+    executor = DBExecutor(db)
+
+    def slow_read():
+        time.sleep(0.3)
+        return threading.current_thread().name, get_sync_state(db, "k")
+
+    def write():
+        set_sync_state(db, "k", {"v": 1})
+        return threading.current_thread().name
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.ensure_future(ticker())
+        writer = await executor.write(write)
+        reader, state = await executor.read(slow_read)
+        task.cancel()
+        return writer, reader, state, ticks
+
+    writer, reader, state, ticks = asyncio.run(run())
+    assert writer == "db-write"
+    assert reader.startswith("db-read")
+    assert state == {"v": 1}
+    assert ticks >= 10  # the loop kept running during the 0.3 s read
+    assert executor.stats()["read_pending"] == 0
+    executor.shutdown()
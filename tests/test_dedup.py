@@ -0,0 +1,52 @@
+import time
+
+from dedup import SeenJobs
+
+
+def test_seen_jobs_survive_a_restart_once_flushed(tmp_path):
+    path = str(tmp_path / "seen.db")
+    seen = SeenJobs(path)
+    seen.add(["1|a", "2|b"])
+    seen.flush()
+    seen.add(["3|c"])  # never flushed
+    seen._conn.close()
+    seen = SeenJobs(path)
+    assert "1|a" in seen and "2|b" in seen
+    assert "3|c" not in seen
+    seen.close()
+
+
+def test_bounded_lru_drops_the_least_recently_seen(tmp_path):
+    seen = SeenJobs(str(tmp_path / "seen.db"), max_entries=3)
+    seen.add(["a", "b", "c"])
+    assert "a" in seen  # refreshed: "b" is now the oldest
+    seen.add(["d"])
+    assert len(seen) == 3
+    assert "b" not in seen
+    assert all(k in seen for k in ("a", "c", "d"))
+    seen.close()
+    seen = SeenJobs(str(tmp_path / "seen.db"), max_entries=3)
+    assert "b" not in seen and len(seen) == 3
+    seen.close()
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    seen = SeenJobs(str(tmp_path / "seen.db"), ttl_sec=60)
+    seen.add(["old"])
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    assert "old" not in seen
+    seen.add(["new"])
+    seen.flush()
+    rows = seen._conn.execute("SELECT job_key FROM seen_jobs").fetchall()
+    assert rows == [("new",)]
+    seen.close()
+
+
+def test_hits_do_not_write_until_touch_interval(tmp_path):
+    seen = SeenJobs(str(tmp_path / "seen.db"), touch_sec=3600)
+    seen.add(["k"])
+    seen.flush()
+    assert "k" in seen
+    assert not seen._upserts
+    seen.close()
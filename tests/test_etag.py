@@ -0,0 +1,13 @@
+def test_conditional_get_answers_304_until_a_write(client):
+    first = client.get("/api/printer-counters")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    again = client.get("/api/printer-counters", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+
+    assert client.post("/api/exclusions", json={"kind": "printer", "value": "etag-test"}).json()["ok"]
+    changed = client.get("/api/printer-counters", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
@@ -0,0 +1,39 @@
+import asyncio
+import threading
+
+from app.events import ChangeBroker
+from app.main import _diff_rows
+
+
+def test_writes_within_the_debounce_window_arrive_as_one_push():
+    async def run():
+        broker = ChangeBroker()
+        sub = broker.subscribe()
+        assert broker.subscriber_count() == 1
+
+        def writer():
+            broker.publish(["printer_counters"])
+            broker.publish(["printer_counters", "jobs"])
+            broker.publish(["client_agents"])
+
+        waiting = asyncio.ensure_future(sub.wait(timeout=5.0, debounce=0.1))
+        await asyncio.sleep(0)
+        threading.Thread(target=writer).start()
+        first = await waiting
+        second = await sub.wait(timeout=0.05)
+        broker.unsubscribe(sub)
+        broker.publish(["jobs"])
+        return first, second, broker.subscriber_count()
+
+    first, second, remaining = asyncio.run(run())
+    assert first == {"printer_counters", "jobs", "client_agents"}
+    assert second == set()
+    assert remaining == 0
+
+
+def test_stream_deltas_only_carry_changed_rows():
+    sent, upsert, remove = _diff_rows({}, [{"agent_id": "a", "v": 1}, {"agent_id": "b", "v": 1}], "agent_id")
+    assert len(upsert) == 2 and remove == []
+    _, upsert, remove = _diff_rows(sent, [{"agent_id": "a", "v": 2}], "agent_id")
+    assert upsert == [{"agent_id": "a", "v": 2}]
+    assert remove == ["b"]
@@ -0,0 +1,108 @@
+import csv
+import io
+import os
+
+from app.exports import XLSX_MEDIA_TYPE, csv_stream, write_xlsx
+from app.reports import JOB_DETAIL_HEADERS, job_detail_values
+from app.storage import iter_jobs
+
+
+EXPORT_JOBS = [
+    {
+        "printer": "P-export",
+        "user": "ana",
+        "document": f"doc, {i}",
+        "submitted": f"2023-05-0{1 + i % 3}T08:{i:02d}:00",
+        "pages": i + 1,
+        "job_id": f"export-{i}",
+        "client_host": "pc-export",
+    }
+    for i in range(12)
+]
+
+
+def _legacy_csv(headers, rows) -> bytes:
+    # What the CSV branches built before streaming: the whole file in a StringIO.
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow(row)
+    return buf.getvalue().encode("utf-8")
+
+
+def test_csv_stream_matches_the_buffered_output_in_batches():
+    headers = ["grupo", "jobs", "paginas"]
+    rows = [[f'Setor "{i}", sala\nB', i, None if i % 7 else 1.5] for i in range(1201)]
+    chunks = list(csv_stream(headers, iter(rows), batch_size=500))
+    assert len(chunks) == 4
+    assert b"".join(chunks) == _legacy_csv(headers, rows)
+    assert list(csv_stream(headers, [])) == [_legacy_csv(headers, [])]
+
+
+def test_csv_stream_sends_the_header_before_reading_rows():
+    consumed = []
+
+    def rows():
+        for i in range(3):
+            consumed.append(i)
+            yield [i]
+
+    stream = csv_stream(["n"], rows(), batch_size=2)
+    assert next(stream) == b"n\r\n"
+    assert consumed == []
+    assert next(stream) == b"0\r\n1\r\n"
+    assert consumed == [0, 1]
+
+
+def test_job_detail_csv_streams_every_job_in_the_range(client):
+    client.post("/api/client-jobs", json=EXPORT_JOBS)
+    resp = client.get("/report", params={"group_by": "job", "format": "csv", "since": "2023-05-01", "until": "2023-05-04"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/csv")
+    expected = [job_detail_values(r) for r in iter_jobs(os.environ["DB_PATH"], since="2023-05-01", until="2023-05-04")]
+    assert resp.content == _legacy_csv(JOB_DETAIL_HEADERS, expected)
+    parsed = list(csv.reader(io.StringIO(resp.text)))
+    assert sorted(int(r[4]) for r in parsed[1:] if r[2] == "P-export") == list(range(1, 13))
+
+
+def _legacy_xlsx(title, headers, rows) -> bytes:
+    # The in-memory Workbook the XLSX branches used before write-only mode.
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = title
+    ws.append(headers)
+    for row in rows:
+        ws.append(row)
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def _sheet_values(data: bytes):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(data), read_only=True)
+    return {ws.title: [list(r) for r in ws.iter_rows(values_only=True)] for ws in wb.worksheets}
+
+
+def test_write_only_xlsx_has_the_same_cells_as_the_legacy_workbook():
+    headers = ["grupo", "jobs", "paginas", "ativo"]
+    rows = [[f"Setor {i}", i, None if i % 5 == 0 else i * 1.5, i % 2 == 0] for i in range(2000)]
+    out = io.BytesIO()
+    write_xlsx(out, [("Relatório", headers, iter(rows), None)])
+    assert _sheet_values(out.getvalue()) == _sheet_values(_legacy_xlsx("Relatório", headers, rows))
+
+
+def test_job_detail_xlsx_has_summary_and_job_sheets(client):
+    client.post("/api/client-jobs", json=EXPORT_JOBS)
+    resp = client.get("/report", params={"group_by": "job", "format": "xlsx", "since": "2023-05-01", "until": "2023-05-04"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == XLSX_MEDIA_TYPE
+    sheets = _sheet_values(resp.content)
+    assert list(sheets) == ["Resumo", "Jobs"]
+    assert sheets["Jobs"][0] == JOB_DETAIL_HEADERS
+    assert sum(1 for r in sheets["Jobs"] if r[2] == "P-export") == len(EXPORT_JOBS)
+    assert len(sheets["Jobs"]) - 1 == sum(r[1] for r in sheets["Resumo"][1:])
@@ -0,0 +1,33 @@
+import sqlite3
+
+from app.storage import init_db, iter_jobs, query_jobs_page, upsert_jobs
+
+
+def test_cursor_pages_include_undated_jobs(tmp_path):
+    db = str(tmp_path / "jobs.db")
+    init_db(db)
+    upsert_jobs(
+        db,
+        [
+            {"timestamp": f"2026-01-01T10:00:{i:02d}", "user": "u", "printer": "p", "document": f"d{i}", "pages": 1}
+            for i in range(5)
+        ],
+    )
+    conn = sqlite3.connect(db)
+    conn.executemany(
+        "INSERT INTO jobs (job_hash, timestamp, user, printer, pages) VALUES (?, NULL, 'u', 'p', 1)",
+        [(f"undated-{i}",) for i in range(3)],
+    )
+    conn.commit()
+    conn.close()
+
+    seen = []
+    cursor = None
+    while True:
+        page = query_jobs_page(db, limit=2, cursor=cursor)
+        seen.extend(r["id"] for r in page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == 8
+    assert len(list(iter_jobs(db, page_size=3))) == 8
@@ -0,0 +1,17 @@
+def test_startup_import_stores_logs_in_chunks(client, tmp_path, monkeypatch):
+    from app import main
+
+    log = tmp_path / "printlog_2026-01-02.log"
+    log.write_text(
+        "".join(f"2026-01-02\t09:00:{i:02d}\timport-user\tFull\tP9\tsrv\tdoc{i}\t1\t1\tA4\n" for i in range(5)),
+        encoding="utf-8",
+    )
+    calls = []
+    write = main._write
+    monkeypatch.setattr(main, "LOG_IMPORT_CHUNK_RECORDS", 2)
+    monkeypatch.setattr(main, "_write", lambda fn, *a, **k: calls.append(len(a[1])) or write(fn, *a, **k))
+    main._import_print_logs([str(log)])
+    assert calls == [2, 2, 1]
+    jobs = client.get("/api/jobs", params={"user": "import-user", "limit": 10}).json()
+    items = jobs["items"] if isinstance(jobs, dict) else jobs
+    assert len(items) == 5
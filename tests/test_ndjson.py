@@ -0,0 +1,72 @@
+import gzip
+import json
+import threading
+import time
+
+import pytest
+
+from app import ndjson
+
+
+def _lines(n):
+    return "\n".join(
+        json.dumps({"printer": "P-ndjson", "submitted": f"2024-02-01T10:00:{i % 60:02d}", "job_id": str(i), "pages": 1})
+        for i in range(n)
+    ).encode()
+
+
+def test_gzip_upload_is_stored(client):
+    resp = client.post("/api/client-jobs/ndjson", content=gzip.compress(_lines(30)), headers={"Content-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.json()["received"] == 30
+
+
+def test_zstd_bomb_is_rejected_in_bounded_steps(client, monkeypatch):
+    zstandard = pytest.importorskip("zstandard")
+    bomb = zstandard.ZstdCompressor(level=19).compress(b"\0" * (64 * 1024 * 1024))
+    sizes = []
+    decompress = ndjson._ZstdDecoder.decompress
+
+    def spy(self, data):
+        for out in decompress(self, data):
+            sizes.append(len(out))
+            yield out
+
+    monkeypatch.setattr(ndjson._ZstdDecoder, "decompress", spy)
+    resp = client.post("/api/client-jobs/ndjson", content=bomb, headers={"Content-Encoding": "zstd"})
+    assert resp.status_code == 413
+    assert resp.json()["ok"] is False
+    assert max(sizes) <= ndjson._OUTPUT_STEP
+    assert sum(sizes) < 2 * ndjson.MAX_LINE_BYTES
+    # The abandoned reader thread exits.
+    deadline = time.time() + 5
+    while any(t.name == "zstd-decoder" for t in threading.enumerate()) and time.time() < deadline:
+        time.sleep(0.05)
+    assert not any(t.name == "zstd-decoder" for t in threading.enumerate())
+
+
+def test_zstd_round_trip_of_a_large_repetitive_body(client):
+    zstandard = pytest.importorskip("zstandard")
+    body = _lines(5000)
+    # Two frames: concatenated zstd frames are one valid body.
+    half = body.index(b"\n", len(body) // 2) + 1
+    compressor = zstandard.ZstdCompressor(level=19)
+    payload = compressor.compress(body[:half]) + compressor.compress(body[half:])
+    assert len(body) > 50 * len(payload)
+    resp = client.post("/api/client-jobs/ndjson", content=payload, headers={"Content-Encoding": "zstd"})
+    assert resp.status_code == 200
+    assert resp.json()["received"] == 5000
+    assert resp.json()["rejected"] == 0
+
+
+def test_corrupt_zstd_body_is_a_bad_request(client):
+    pytest.importorskip("zstandard")
+    resp = client.post("/api/client-jobs/ndjson", content=b"not zstd at all", headers={"Content-Encoding": "zstd"})
+    assert resp.status_code == 400
+
+
+def test_corrupt_body_and_unknown_encoding(client):
+    resp = client.post("/api/client-jobs/ndjson", content=b"not gzip", headers={"Content-Encoding": "gzip"})
+    assert resp.status_code == 400
+    resp = client.post("/api/client-jobs/ndjson", content=b"{}", headers={"Content-Encoding": "br"})
+    assert resp.status_code == 415
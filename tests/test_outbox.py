@@ -0,0 +1,170 @@
+import sqlite3
+import threading
+
+import requests
+
+from outbox import Outbox, OutboxSender, Rejected
+
+
+def _jobs(*ids):
+    return [{"printer": "P1", "submitted": "2024-03-01T08:00:00", "job_id": str(i)} for i in ids]
+
+
+def _sender(outbox, send, **kwargs):
+    kwargs.setdefault("batch_size", 10)
+    kwargs.setdefault("max_wait_sec", 0)
+    return OutboxSender(outbox, send, stop_event=threading.Event(), **kwargs)
+
+
+def test_peek_is_fifo_and_ack_removes_only_acked_rows(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    outbox.put(_jobs(1, 2, 3))
+    outbox.put(_jobs(4))
+    rows = outbox.peek(2)
+    assert [r[2]["job_id"] for r in rows] == ["1", "2"]
+    outbox.ack([rows[1][0]])
+    assert [r[2]["job_id"] for r in outbox.peek(10)] == ["1", "3", "4"]
+    assert outbox.count() == 3
+    outbox.close()
+
+
+def test_unacked_rows_survive_a_restart(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    outbox = Outbox(path)
+    outbox.put(_jobs(1, 2))
+    outbox.ack([outbox.peek(1)[0][0]])
+    outbox.close()
+    outbox = Outbox(path)
+    assert [r[2]["job_id"] for r in outbox.peek(10)] == ["2"]
+    outbox.close()
+
+
+def test_old_outbox_gains_attempts_column(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, payload TEXT NOT NULL)")
+    conn.execute("INSERT INTO outbox (created_at, payload) VALUES (1, '{}')")
+    conn.commit()
+    conn.close()
+    outbox = Outbox(path)
+    outbox.fail([r[0] for r in outbox.peek(10)])
+    assert outbox._conn.execute("SELECT attempts FROM outbox").fetchone()[0] == 1
+    outbox.close()
+
+
+def test_transport_errors_are_retried_and_counted(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    outbox.put(_jobs(1, 2))
+    calls = []
+
+    def send(records):
+        calls.append(len(records))
+        if len(calls) < 3:
+            raise requests.ConnectionError("down")
+        sender.stop_event.set()
+
+    sender = _sender(outbox, send, base_backoff_sec=0.01, max_backoff_sec=0.01)
+    sender.run()
+    assert calls == [2, 2, 2]
+    assert outbox.count() == 0
+    assert outbox.dead_count() == 0
+    outbox.close()
+
+
+def test_refused_records_go_to_dead_letter_and_the_rest_is_delivered(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    outbox.put(_jobs(1, 2, 3))
+    delivered = []
+
+    def send(records):
+        ids = [r["job_id"] for r in records]
+        if "2" in ids:
+            raise Rejected("invalid records", [ids.index("2")])
+        delivered.extend(ids)
+
+    sender = _sender(outbox, send)
+    sender._deliver(outbox.peek(10))
+    assert delivered == ["1", "3"]
+    assert outbox.count() == 0
+    row = outbox._conn.execute("SELECT attempts, error, payload FROM dead_letter").fetchone()
+    assert row[0] == 1 and row[1] == "invalid records" and '"2"' in row[2]
+    outbox.close()
+
+
+def test_batch_refused_as_a_whole_is_isolated_record_by_record(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    outbox.put(_jobs(1, 2, 3, 4))
+    sent = []
+
+    def send(records):
+        sent.append([r["job_id"] for r in records])
+        if any(r["job_id"] in ("2", "4") for r in records):
+            raise Rejected("server rejected jobs")
+
+    _sender(outbox, send)._deliver(outbox.peek(10))
+    assert sent == [["1", "2", "3", "4"], ["1"], ["2"], ["3"], ["4"]]
+    assert outbox.count() == 0
+    assert outbox.dead_count() == 2
+    outbox.close()
+
+
+class _Response:
+    def __init__(self, status, body):
+        self.status_code = status
+        self._body = body
+        self.text = str(body)
+
+    def json(self):
+        if self._body is None:
+            raise ValueError("no JSON")
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}")
+
+
+class _Session:
+    def __init__(self, response):
+        self.response = response
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        return self.response
+
+
+def _post(response):
+    from agent import post_jobs
+
+    return lambda records: post_jobs(_Session(response), "http://server", records)
+
+
+def test_auth_or_routing_4xx_keeps_the_batch_pending(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    outbox.put(_jobs(1, 2))
+    responses = [_Response(403, None), _Response(404, {"detail": "Not Found"}), _Response(413, None)]
+
+    def send(records):
+        if not responses:
+            sender.stop_event.set()
+            raise requests.ConnectionError("stop")
+        return _post(responses.pop(0))(records)
+
+    sender = _sender(outbox, send, base_backoff_sec=0.01, max_backoff_sec=0.01)
+    sender.run()
+    assert outbox.count() == 2
+    assert outbox.dead_count() == 0
+    assert outbox._conn.execute("SELECT MIN(attempts) FROM outbox").fetchone()[0] == 4
+    outbox.close()
+
+
+def test_per_record_errors_are_dead_lettered(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    outbox.put(_jobs(1, 2, 3))
+    body = {"ok": True, "inserted": 2, "errors": [{"index": 1, "error": "record must be a JSON object"}]}
+    _sender(outbox, _post(_Response(200, body)))._deliver(outbox.peek(10))
+    assert outbox.count() == 0
+    assert outbox._conn.execute("SELECT error, payload FROM dead_letter").fetchall()[0][0] == "record must be a JSON object"
+    outbox.put(_jobs(4))
+    _sender(outbox, _post(_Response(422, {"detail": []})))._deliver(outbox.peek(10))
+    assert outbox.count() == 0 and outbox.dead_count() == 2
+    outbox.close()
@@ -0,0 +1,162 @@
+import http.client
+import threading
+import xmlrpc.client
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.papercut_cache import CachedPaperCutClient
+from app.papercut_client import PaperCutClient
+from app.papercut_stub import PaperCutStubServer
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**kwargs):
+        kwargs.setdefault("users", 100)
+        server = PaperCutStubServer(port=0, **kwargs).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def test_writes_are_not_retried_on_top_of_the_transport(stub):
+    server = stub(drop_rate=1.0)
+    client = PaperCutClient(server.url, "t", max_connections=1)
+    with pytest.raises((http.client.HTTPException, ConnectionError)):
+        client.call("adjustUserAccountBalance", "user00001", 1.0, "", "")
+    # The stdlib Transport retries once by itself; nothing more.
+    assert server.stats()["dropped"] == 2
+    server.reset_stats()
+    with pytest.raises((http.client.HTTPException, ConnectionError)):
+        client.call("getUserProperty", "user00001", "department")
+    assert server.stats()["dropped"] == 4
+    client.close()
+
+
+def test_other_faults_do_not_disable_multicall(stub, monkeypatch):
+    server = stub()
+    client = PaperCutClient(server.url, "t")
+    request = client._request
+    failures = [xmlrpc.client.Fault(-32500, "Server busy")]
+
+    def flaky(method, *params, **kwargs):
+        if method == "system.multicall" and failures:
+            raise failures.pop()
+        return request(method, *params, **kwargs)
+
+    monkeypatch.setattr(client, "_request", flaky)
+    with pytest.raises(xmlrpc.client.Fault):
+        client.multicall([("getUserProperty", ("user00001", "department"))])
+    assert client.stats()["multicall"] is None
+    assert client.multicall([("getUserProperty", ("user00001", "department"))]) == ["RH"]
+    assert client.stats()["multicall"] is True
+    client.close()
+
+
+def test_multicall_isolates_faults_per_call(stub):
+    server = stub(users=10)
+    client = PaperCutClient(server.url, "t")
+    results = client.multicall(
+        [
+            ("getUserProperty", ("user00001", "department")),
+            ("getUserProperty", ("ghost", "department")),
+            ("getUserProperty", ("user00003", "no-such-prop")),
+            ("getUserAccountBalance", ("user00004", "")),
+        ]
+    )
+    assert results[0] == "RH"
+    assert isinstance(results[1], xmlrpc.client.Fault) and "does not exist" in results[1].faultString
+    assert isinstance(results[2], xmlrpc.client.Fault)
+    assert results[3] == 4.0
+    assert server.stats()["requests"] == 1
+    assert client.stats()["multicall"] is True
+    client.close()
+
+
+def test_falls_back_to_single_calls_without_multicall(stub):
+    server = stub(users=10, multicall=False)
+    client = PaperCutClient(server.url, "t", batch_size=5)
+    users = [f"user{i:05d}" for i in range(8)] + ["ghost"]
+    values = client.map("getUserProperty", [(u, "office") for u in users])
+    assert values[:3] == ["Matriz", "Filial Norte", "Filial Sul"]
+    assert isinstance(values[-1], xmlrpc.client.Fault)
+    assert client.stats()["multicall"] is False
+    # One rejected system.multicall, then one request per call.
+    assert server.stats()["calls"] == len(users)
+    client.close()
+
+
+def test_dropped_connections_are_retried_for_reads(stub):
+    # One connection keeps the stub's drop sequence deterministic.
+    server = stub(users=50, drop_rate=0.25, seed=3)
+    client = PaperCutClient(server.url, "t", max_connections=1, batch_size=2)
+    users = [f"user{i:05d}" for i in range(50)]
+    assert client.get_user_properties(users, "department") == {
+        u: ("Financeiro", "RH", "TI", "Comercial", "Juridico", "Operacoes", "Diretoria")[i % 7] for i, u in enumerate(users)
+    }
+    assert server.stats()["dropped"] > 0
+    client.close()
+
+
+def test_pool_never_exceeds_max_connections(stub):
+    server = stub(users=500, latency_ms=5)
+    client = PaperCutClient(server.url, "t", max_connections=3, batch_size=10)
+    users = [f"user{i:05d}" for i in range(500)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda part: client.map("getUserProperty", [(u, "department") for u in part]),
+                      [users[i : i + 100] for i in range(0, 500, 100)]))
+    assert client.stats()["connections"] <= 3
+    assert server.stats()["connections"] <= 3
+    client.close()
+
+
+def test_cache_keeps_faults_and_coalesces_concurrent_lookups(stub):
+    server = stub(users=10, latency_ms=50)
+    cached = CachedPaperCutClient(PaperCutClient(server.url, "t"), negative_ttl_sec=60)
+    for _ in range(3):
+        with pytest.raises(xmlrpc.client.Fault):
+            cached.call("getUserProperty", "ghost", "department")
+    assert cached.stats()["negative_hits"] == 2
+
+    start = threading.Barrier(10)
+
+    def lookup(_):
+        start.wait()
+        return cached.call("getUserProperty", "user00005", "department")
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        assert set(pool.map(lookup, range(10))) == {"Operacoes"}
+    stats = cached.stats()
+    assert stats["coalesced"] >= 1
+    assert server.stats()["calls"] == 2
+    # Writes are never cached.
+    cached.call("adjustUserAccountBalance", "user00005", 1.0, "", "")
+    cached.call("adjustUserAccountBalance", "user00005", 1.0, "", "")
+    assert cached.stats()["passthrough"] == 2
+    assert server.stats()["calls"] == 4
+    cached.close()
+
+
+def test_cache_does_not_keep_injected_or_auth_faults(stub):
+    server = stub(users=10, error_rate=1.0)
+    cached = CachedPaperCutClient(PaperCutClient(server.url, "t"), negative_ttl_sec=60)
+    with pytest.raises(xmlrpc.client.Fault, match="injected"):
+        cached.call("getUserProperty", "user00001", "department")
+    server.error_rate = 0.0
+    assert cached.call("getUserProperty", "user00001", "department") == "RH"
+    assert cached.stats()["negative_hits"] == 0
+    cached.close()
+
+    server = stub(users=10, token="secret")
+    cached = CachedPaperCutClient(PaperCutClient(server.url, "wrong"), negative_ttl_sec=60)
+    for _ in range(2):
+        with pytest.raises(xmlrpc.client.Fault, match="authentication"):
+            cached.call("getUserProperty", "user00001", "department")
+    assert server.stats()["calls"] == 2
+    cached.close()
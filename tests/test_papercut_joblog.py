@@ -0,0 +1,90 @@
+import functools
+import http.server
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+from app.papercut_joblog import SYNC_STATE_NAME, PaperCutJobLogPuller
+from app.storage import get_sync_state, init_db
+
+
+def _write(fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+def _log(directory, day, jobs):
+    lines = "".join(
+        f"{day.isoformat()}\t10:{i // 60:02d}:{i % 60:02d}\tlog-user\tFull\tP7\tsrv\tdoc{i}\t1\t1\tA4\n" for i in range(jobs)
+    )
+    (directory / f"printlog_{day.isoformat()}.log").write_text(lines, encoding="utf-8")
+
+
+def _jobs(db):
+    conn = sqlite3.connect(db)
+    count = conn.execute("SELECT COUNT(*) FROM jobs WHERE user='log-user'").fetchone()[0]
+    conn.close()
+    return count
+
+
+@pytest.fixture
+def setup(tmp_path):
+    db = str(tmp_path / "j.db")
+    init_db(db)
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    return db, logs
+
+
+def test_missing_day_keeps_the_watermark_until_a_later_log_exists(setup):
+    db, logs = setup
+    today = date.today()
+    template = str(logs / "printlog_{date:%Y-%m-%d}.log")
+    puller = PaperCutJobLogPuller(template, db, _write, start_days=3)
+    _log(logs, today - timedelta(days=3), 4)
+    # Days -2, -1 and today are missing: nothing proves day -2 had no jobs.
+    status = puller.run_once()
+    assert "not found" in status["error"]
+    assert get_sync_state(db, SYNC_STATE_NAME)["day"] == (today - timedelta(days=2)).isoformat()
+    assert _jobs(db) == 4
+    # Day -1 shows up: day -2 is skipped and day -1 read.
+    _log(logs, today - timedelta(days=1), 3)
+    status = puller.run_once()
+    assert status["error"] is None
+    assert _jobs(db) == 7
+    assert get_sync_state(db, SYNC_STATE_NAME)["day"] == today.isoformat()
+
+
+class _NoRangeHandler(http.server.SimpleHTTPRequestHandler):
+    # SimpleHTTPRequestHandler ignores Range and always answers 200.
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_server_ignoring_range_is_downloaded_once_per_run(setup):
+    db, logs = setup
+    today = date.today()
+    _log(logs, today, 300)
+    handler = functools.partial(_NoRangeHandler, directory=str(logs))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/printlog_{{date:%Y-%m-%d}}.log"
+        pages = []
+        write = lambda fn, *args, **kwargs: pages.append(len(args[1])) or fn(*args, **kwargs)
+        puller = PaperCutJobLogPuller(url, db, write, start_days=0, page_bytes=4096)
+        status = puller.run_once()
+        assert status["error"] is None
+        assert _jobs(db) == 300
+        assert len(pages) > 1
+        assert _NoRangeHandler.requests == 1
+    finally:
+        server.shutdown()
+        server.server_close()
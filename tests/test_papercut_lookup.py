@@ -0,0 +1,21 @@
+from app.papercut_cache import CachedPaperCutClient
+from app.papercut_client import PaperCutClient
+from app.papercut_stub import PaperCutStubServer
+
+
+def test_user_lookup_goes_through_the_cache(client, monkeypatch):
+    from app import main
+
+    server = PaperCutStubServer(port=0, users=20).start()
+    lookup = CachedPaperCutClient(PaperCutClient(server.url, "t"))
+    monkeypatch.setattr(main, "_papercut_lookup", lookup)
+    try:
+        for _ in range(3):
+            body = client.get("/api/papercut-users/user00002").json()
+            assert body == {"ok": True, "user": "user00002", "full_name": "Usuario 00002", "department": "TI"}
+            assert client.get("/api/papercut-users/ghost").status_code == 404
+        assert server.stats()["calls"] == 2
+        assert client.get("/api/metrics").json()["papercut"]["hits"] >= 4
+    finally:
+        lookup.close()
+        server.stop()
@@ -0,0 +1,86 @@
+import threading
+import time
+
+from app.papercut_sync import SYNC_STATE_NAME, PaperCutUserSync
+from app.storage import get_sync_state, init_db, table_versions
+
+
+class FakeClient:
+    # Sorted listUserAccounts over a user list the test can change.
+    def __init__(self, users):
+        self.users = sorted(users)
+        self.listed = []
+
+    def call(self, method, offset, limit):
+        assert method == "listUserAccounts"
+        self.listed.append(offset)
+        return self.users[offset : offset + limit]
+
+    def map(self, method, params_list):
+        return [["Dept-" + user[-1], ""] for user, _ in params_list]
+
+
+def _write(fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+def _users(n):
+    return [f"u{i:03d}" for i in range(n)]
+
+
+def test_interrupted_sweep_resumes_after_the_last_user_despite_deletions(tmp_path):
+    db = str(tmp_path / "s.db")
+    init_db(db)
+    client = FakeClient(_users(35))
+    pages = []
+
+    def stop_after_two(fn, *args, **kwargs):
+        if len(pages) == 2:
+            raise RuntimeError("interrupted")
+        pages.append(args[1])
+        return fn(*args, **kwargs)
+
+    sync = PaperCutUserSync(client, db, stop_after_two, page_size=10)
+    assert sync.run_once()["error"] == "interrupted"
+    assert get_sync_state(db, SYNC_STATE_NAME)["last_user"] == "u019"
+    # Five users before the watermark disappear: offset 20 now starts at u025.
+    client.users = [u for u in client.users if u not in _users(5)]
+    done = []
+    sync.write = lambda fn, *args, **kwargs: done.extend(u for u, _ in args[1]) or fn(*args, **kwargs)
+    status = sync.run_once()
+    assert status["error"] is None
+    assert done == _users(35)[20:]
+    assert status["watermark"]["offset"] == 0 and status["watermark"]["last_user"] == ""
+
+
+def test_unchanged_pages_do_not_write_the_watermark(tmp_path):
+    db = str(tmp_path / "s.db")
+    init_db(db)
+    sync = PaperCutUserSync(FakeClient(_users(50)), db, _write, page_size=10)
+    assert sync.run_once()["changed"] == 50
+    before = table_versions(db, ["sync_state"])["sync_state"]
+    assert sync.run_once()["changed"] == 0
+    # Only the end of the sweep is saved.
+    assert table_versions(db, ["sync_state"])["sync_state"] == before + 1
+
+
+def test_concurrent_triggers_start_one_sweep(tmp_path):
+    db = str(tmp_path / "s.db")
+    init_db(db)
+    release = threading.Event()
+    runs = []
+
+    class SlowClient(FakeClient):
+        def call(self, *args):
+            runs.append(1)
+            release.wait(5)
+            return super().call(*args)
+
+    sync = PaperCutUserSync(SlowClient(_users(3)), db, _write, page_size=10)
+    results = [sync.trigger() for _ in range(5)]
+    assert results.count(True) == 1
+    release.set()
+    deadline = time.time() + 5
+    while sync.status()["running"] and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(runs) == 1
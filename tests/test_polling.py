@@ -0,0 +1,48 @@
+import polling
+from polling import AdaptivePoll, PollStats
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_interval_is_fast_while_queued_then_normal_then_backs_off(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(polling.time, "monotonic", clock)
+    poll = AdaptivePoll(5, fast_sec=1, idle_sec=30, idle_after_sec=60)
+    assert poll.next_interval(3) == 1.0
+    clock.now += 59
+    assert poll.next_interval(0) == 5.0
+    clock.now += 1
+    assert [poll.next_interval(0) for _ in range(4)] == [10.0, 20.0, 30.0, 30.0]
+    # A new job drops straight back to fast polling, and the idle clock restarts.
+    assert poll.next_interval(1) == 1.0
+    clock.now += 10
+    assert poll.next_interval(0) == 5.0
+
+
+def test_interval_bounds_are_kept_consistent():
+    poll = AdaptivePoll(0.1, fast_sec=0.1, idle_sec=2)
+    assert (poll.fast_sec, poll.normal_sec, poll.idle_sec) == (0.5, 0.5, 2.0)
+    poll = AdaptivePoll(10, fast_sec=1, idle_sec=5)
+    assert poll.idle_sec == 10.0
+
+
+def test_job_id_gaps_are_counted_as_missed_jobs():
+    stats = PollStats()
+    stats.note_new_jobs([10, 11])
+    stats.note_new_jobs([14, "x"])  # 12 and 13 came and went between polls
+    stats.note_new_jobs([5000])  # spooler restart, not 4985 missed jobs
+    stats.note_new_jobs([5001])
+    stats.note_poll(0.002)
+    stats.note_poll(0.004)
+    snap = stats.snapshot(5.0)
+    assert snap["jobs_seen"] == 5
+    assert snap["jobs_missed_est"] == 2
+    assert snap["miss_rate"] == round(2 / 7, 4)
+    assert snap["polls"] == 2 and snap["poll_ms_avg"] == 3.0
+    assert snap["poll_interval_sec"] == 5.0
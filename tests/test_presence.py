@@ -0,0 +1,28 @@
+from app.storage import PRESENCE_TABLE
+
+
+def _beat(client, host="pc-presence"):
+    return client.post(
+        "/api/agents/heartbeat",
+        json={"host": host, "printer_name": "P1", "printer_model": "M", "ip": "10.0.0.9", "version": "1"},
+    ).json()
+
+
+def test_flush_keeps_presence_in_memory_and_coalesced_beats_are_pushed(client, monkeypatch):
+    from app import main
+
+    assert _beat(client)["ok"]
+    assert client.get("/api/agents").status_code == 200
+    assert not main._presence.stale
+
+    published = []
+    publish = main._change_broker.publish
+    monkeypatch.setattr(main._change_broker, "publish", lambda tables: published.append(tuple(tables)) or publish(tables))
+    assert _beat(client)["ok"]  # same metadata: coalesced in memory
+    assert (PRESENCE_TABLE,) in published
+
+    main._flush_presence()
+    # The flush's own write must not force a reload from SQLite.
+    assert not main._presence.stale
+    rows = {r["agent_id"]: r for r in client.get("/api/agents").json()}
+    assert "pc-presence|P1" in rows
@@ -0,0 +1,92 @@
+import threading
+
+from app.report_jobs import ReportJobManager, normalize_report_params
+from app.storage import init_db, set_sync_state, touch_client_agents, upsert_jobs
+
+
+def _job(i):
+    return {"timestamp": f"2026-01-01T10:00:{i:02d}", "user": "ana", "printer": "p1", "document": f"d{i}", "pages": 2}
+
+
+def test_artifact_survives_unrelated_writes_and_restart(tmp_path):
+    db = str(tmp_path / "r.db")
+    init_db(db)
+    upsert_jobs(db, [_job(1)])
+    params = normalize_report_params({"kind": "jobs", "format": "csv", "group_by": "user"})
+
+    reports = ReportJobManager(db, str(tmp_path / "art"), processes=0)
+    path = reports.get_or_render(params, timeout=30)
+    set_sync_state(db, "anything", {"offset": 1})
+    touch_client_agents(db, [])
+    assert reports.get_or_render(params, timeout=30) == path
+    reports.shutdown()
+
+    restarted = ReportJobManager(db, str(tmp_path / "art"), processes=0)
+    assert restarted.get_or_render(params, timeout=30) == path
+    assert restarted.stats()["rendered"] == 0
+
+    upsert_jobs(db, [_job(2)])
+    assert restarted.get_or_render(params, timeout=30) != path
+    restarted.shutdown()
+
+
+class _BlockingReports(ReportJobManager):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.release = threading.Event()
+        self.renders = []
+
+    def _render(self, key, params):
+        self.renders.append(key)
+        self.release.wait(10)
+        return super()._render(key, params)
+
+
+def test_inflight_render_is_joined_after_its_record_is_evicted(tmp_path):
+    db = str(tmp_path / "r.db")
+    init_db(db)
+    upsert_jobs(db, [_job(1)])
+    reports = _BlockingReports(db, str(tmp_path / "art"), processes=0, max_workers=2, max_jobs=1)
+    a = normalize_report_params({"kind": "jobs", "format": "csv", "group_by": "user"})
+    b = normalize_report_params({"kind": "jobs", "format": "csv", "group_by": "printer"})
+
+    first = reports.submit(a)
+    reports.submit(b)  # evicts the record of `first`
+    assert reports.get(first["id"]) is None
+    again = reports.submit(a)
+    reports.release.set()
+    assert reports.get_or_render(a, timeout=30)
+    assert len(reports.renders) == 2  # a and b once each
+    for _ in range(100):
+        if reports.get(again["id"])["status"] == "done":
+            break
+        threading.Event().wait(0.05)
+    assert reports.get(again["id"])["status"] == "done"
+    reports.shutdown()
+
+
+def test_process_pool_renders_the_same_workbook_as_the_worker_thread(tmp_path):
+    from openpyxl import load_workbook
+
+    db = str(tmp_path / "r.db")
+    init_db(db)
+    upsert_jobs(db, [_job(i) for i in range(1, 30)])
+    xlsx = normalize_report_params({"kind": "jobs", "format": "xlsx", "group_by": "user"})
+    pdf = normalize_report_params({"kind": "jobs", "format": "pdf", "group_by": "user"})
+
+    def cells(path):
+        return [list(r) for r in load_workbook(path, read_only=True).active.iter_rows(values_only=True)]
+
+    in_thread = ReportJobManager(db, str(tmp_path / "thread"), processes=0)
+    pooled = ReportJobManager(db, str(tmp_path / "pool"), processes=1)
+    try:
+        expected = cells(in_thread.get_or_render(xlsx, timeout=30))
+        assert in_thread._process_pool is None
+        assert cells(pooled.get_or_render(xlsx, timeout=60)) == expected
+        assert pooled._process_pool is not None
+        with open(pooled.get_or_render(pdf, timeout=60), "rb") as f:
+            assert f.read(5) == b"%PDF-"
+        assert pooled.stats()["rendered"] == 2
+    finally:
+        in_thread.shutdown()
+        pooled.shutdown()
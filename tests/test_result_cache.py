@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from app.cache import MISSING, ResultCache
+
+
+def test_entries_are_dropped_when_the_generation_moves():
+    cache = ResultCache(max_entries=4, ttl_sec=60)
+    cache.set("k", [1], generation=1)
+    assert cache.get("k", 1) == [1]
+    assert cache.get("k", 2) is MISSING
+    assert cache.get("k", 1) is MISSING
+    assert cache.stats()["entries"] == 0
+
+
+def test_expired_and_least_recent_entries_are_dropped():
+    cache = ResultCache(max_entries=2, ttl_sec=60)
+    cache.set("old", 1, generation=0, ttl_sec=0)
+    assert cache.get("old", 0) is MISSING
+    cache.set("a", 1, 0)
+    cache.set("b", 2, 0)
+    cache.get("a", 0)
+    cache.set("c", 3, 0)
+    assert cache.get("b", 0) is MISSING
+    assert cache.get("a", 0) == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_summary_is_cached_until_the_next_write(client):
+    def summary():
+        return client.get("/api/summary", params={"days": 3}).json()
+
+    before = summary()
+    hits = client.get("/api/metrics").json()["cache"]["hits"]
+    assert summary() == before
+    assert client.get("/api/metrics").json()["cache"]["hits"] == hits + 1
+
+    job = {
+        "printer": "P-cache",
+        "submitted": datetime.now().replace(microsecond=0).isoformat(),
+        "pages": 4,
+        "job_id": "cache-1",
+        "client_host": "pc-cache",
+    }
+    assert client.post("/api/client-jobs", json=[job]).json()["inserted"] == 1
+    after = summary()
+    assert after["totals"]["jobs"] == before["totals"]["jobs"] + 1
+    assert after["totals"]["total_pages"] == before["totals"]["total_pages"] + 4
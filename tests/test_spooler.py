@@ -0,0 +1,15 @@
+import pytest
+
+from spooler import SimulatedSpooler, SpoolerBackend
+
+
+def test_backend_must_implement_the_abstract_methods():
+    class Partial(SpoolerBackend):
+        def list_printers(self):
+            return []
+
+    with pytest.raises(TypeError):
+        Partial()
+    spooler = SimulatedSpooler(["P1"], seed=1)
+    assert isinstance(spooler, SpoolerBackend)
+    assert spooler.list_printers() == ["P1"]